@@ -0,0 +1,19 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, suffix=".part"):
+    """以二进制写入方式打开与 path 同目录的临时文件，正常结束时 os.replace 到 path，出错时删除临时文件
+
+    临时文件与目标在同一文件系统，替换是原子操作，读取方不会看到写了一半的文件。
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,135 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+# 各分辨率模板的典型文件大小（字节），该模板还没有下载记录时用于估算
+TYPICAL_BYTES = {
+    "uhd": 4_500_000,
+    "1080p": 700_000,
+    "768p": 350_000,
+    "mobile": 600_000
+}
+# 降级候选（从大到小）：横屏模板之间互相降级，竖屏只有 mobile
+DOWNGRADES = {
+    "uhd": ["uhd", "1080p", "768p"],
+    "1080p": ["1080p", "768p"],
+    "768p": ["768p"],
+    "mobile": ["mobile"]
+}
+# 滑动平均中新样本的权重
+EWMA_ALPHA = 0.3
+# 小于该字节数的下载不计入吞吐量（建连和首字节延迟占主导，不代表带宽）
+MIN_SAMPLE_BYTES = 64 * 1024
+
+# 分辨率选择结果：preset 为实际下载的模板（None 表示今日流量预算已用完，不下载），wanted 为按屏幕应下载的模板，
+# reason 为降级原因（未降级时为空），throughput 为当前吞吐量估计（字节/秒，未知为 None）
+Decision = namedtuple("Decision", ["preset", "wanted", "reason", "throughput", "used_today", "daily_budget"])
+
+
+class BandwidthTracker:
+    """按数据源记录下载吞吐量（指数加权滑动平均）、各模板平均文件大小和当日已用流量
+
+    状态保存在传入的字典中（即配置文件），重启后继续使用。
+    """
+
+    def __init__(self, state, on_change=None, lock=None, clock=time.time):
+        self.state = state
+        self.on_change = on_change
+        self.clock = clock
+        self._lock = lock or threading.Lock()
+
+    def record(self, source, preset, received, seconds, size=None):
+        """记录一次成功下载
+
+        received 为本次传输字节数（计入流量和吞吐量），seconds 为从发出请求到接收完毕的耗时，
+        size 为文件总字节数（续传时大于 received，计入该模板的平均文件大小；None 表示与 received 相同）。
+        """
+        size = received if size is None else size
+        with self._lock:
+            usage = self._usage_locked()
+            usage["bytes"] += received
+            if received >= MIN_SAMPLE_BYTES and seconds > 0:
+                throughput = self.state.setdefault("throughput", {})
+                throughput[source] = _ewma(throughput.get(source), received / seconds)
+            if size >= MIN_SAMPLE_BYTES:
+                sizes = self.state.setdefault("sizes", {})
+                sizes[preset] = _ewma(sizes.get(preset), size)
+        if self.on_change:
+            self.on_change()
+
+    def throughput(self, source):
+        """吞吐量估计（字节/秒），没有记录时返回 None"""
+        with self._lock:
+            return self.state.get("throughput", {}).get(source)
+
+    def expected_bytes(self, preset):
+        with self._lock:
+            return self.state.get("sizes", {}).get(preset) or TYPICAL_BYTES.get(preset, TYPICAL_BYTES["1080p"])
+
+    def used_today(self):
+        with self._lock:
+            return self._usage_locked()["bytes"]
+
+    def _usage_locked(self):
+        """当日流量记录，跨天时清零（调用方持有锁）"""
+        today = time.strftime("%Y-%m-%d", time.localtime(self.clock()))
+        usage = self.state.get("usage")
+        if not usage or usage.get("day") != today:
+            usage = self.state["usage"] = {"day": today, "bytes": 0}
+        return usage
+
+
+def _ewma(previous, sample):
+    return sample if previous is None else previous + EWMA_ALPHA * (sample - previous)
+
+
+def choose_resolution(tracker, source, wanted, max_seconds=0, daily_budget=0):
+    """在不超过 wanted 的模板中选择预计下载耗时不超过 max_seconds、且不超出当日流量预算的最大者
+
+    max_seconds 为 0 表示不限耗时（吞吐量未知时同样不限），daily_budget 为 0 表示不限流量。
+    都不满足耗时限制时选最小的模板；最小的模板也超出流量预算时返回 preset 为 None 的结果。
+    """
+    throughput = tracker.throughput(source)
+    used = tracker.used_today()
+    reason = ""
+    fallback = None
+    for preset in DOWNGRADES.get(wanted, [wanted]):
+        expected = tracker.expected_bytes(preset)
+        if daily_budget and used + expected > daily_budget:
+            reason = f"{preset} 约 {_mb(expected)}，超出今日流量预算"
+            continue
+        seconds = expected / throughput if throughput and max_seconds else 0
+        if seconds > max_seconds:
+            reason = f"{preset} 预计 {seconds:.0f} 秒，超出 {max_seconds} 秒"
+            fallback = preset
+            continue
+        return Decision(preset, wanted, reason, throughput, used, daily_budget)
+    if fallback is not None:
+        return Decision(fallback, wanted, reason, throughput, used, daily_budget)
+    return Decision(None, wanted, "今日流量预算已用完", throughput, used, daily_budget)
+
+
+def describe_decision(decision):
+    """状态栏/日志用的一行说明"""
+    parts = []
+    if decision.throughput:
+        parts.append(f"带宽 {_mb(decision.throughput)}/s")
+    if decision.daily_budget:
+        parts.append(f"今日流量 {_mb(decision.used_today)}/{_mb(decision.daily_budget)}")
+    if decision.preset is None:
+        parts.append(decision.reason)
+    elif decision.preset != decision.wanted:
+        parts.append(f"已降为 {decision.preset}（{decision.reason}）")
+    else:
+        parts.append(f"分辨率 {decision.preset}")
+    return " · ".join(parts)
+
+
+def log_decision(decision):
+    level = logging.INFO if decision.preset == decision.wanted else logging.WARNING
+    logging.log(level, f"分辨率选择: {describe_decision(decision)}")
+
+
+def _mb(value):
+    return f"{value / 1024 / 1024:.1f}MB"
@@ -0,0 +1,83 @@
+"""缓存维护基准：目录扫描实现与 SQLite 索引实现的单次刷新开销对比
+
+运行: python -m benchmarks.bench_cache [文件数 ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from cache_index import CacheIndex
+
+FILE_SIZE = 16
+ROUNDS = 20
+
+
+def populate(cache_dir, count):
+    """生成 count 个小文件，修改时间递增"""
+    now = time.time() - count
+    for i in range(count):
+        path = os.path.join(cache_dir, f"wallpaper_{i:08d}.jpg")
+        with open(path, 'wb') as f:
+            f.write(b"\0" * FILE_SIZE)
+        os.utime(path, (now + i, now + i))
+
+
+def legacy_refresh(cache_dir, max_files, new_path):
+    """旧实现：listdir + getmtime + 排序清理，再 listdir 随机选择"""
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.jpg')]
+    files.sort(key=lambda x: os.path.getmtime(x))
+    files.remove(new_path)
+    while len(files) > max_files - 1:
+        os.remove(files.pop(0))
+    choices = [f for f in os.listdir(cache_dir) if f.endswith('.jpg')]
+    random.choice(choices)
+
+
+def indexed_refresh(index, max_bytes, new_path):
+    """索引实现：登记 + LRU 淘汰 + O(1) 随机选择"""
+    index.add(new_path, FILE_SIZE)
+    for path in index.evict(max_bytes, keep={new_path}):
+        os.remove(path)
+    index.random_path()
+
+
+def write_new(cache_dir, i):
+    path = os.path.join(cache_dir, f"wallpaper_new_{i:04d}.jpg")
+    with open(path, 'wb') as f:
+        f.write(b"\0" * FILE_SIZE)
+    return path
+
+
+def bench(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        populate(tmp, count)
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            legacy_refresh(tmp, count, write_new(tmp, i))
+        legacy = (time.perf_counter() - start) / ROUNDS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        populate(tmp, count)
+        start = time.perf_counter()
+        index = CacheIndex(tmp)
+        rebuild = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            indexed_refresh(index, count * FILE_SIZE, write_new(tmp, i))
+        indexed = (time.perf_counter() - start) / ROUNDS
+        index.close()
+
+    print(f"{count:>8} 个文件: 目录扫描 {legacy * 1000:9.2f} ms/次 | "
+          f"索引 {indexed * 1000:7.3f} ms/次 | 首次重建 {rebuild * 1000:8.1f} ms")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""多显示器拼接基准：3×4K 横向布局（含负坐标）的拼接耗时与峰值内存
+
+运行: python -m benchmarks.bench_compositor
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.images import synthetic_jpeg
+from compositor import Compositor, compose_spanned, layout_bounds
+from display import Monitor
+
+LAYOUT = [
+    Monitor(-3840, 0, 3840, 2160, False),
+    Monitor(0, 0, 3840, 2160, True),
+    Monitor(3840, 0, 3840, 2160, False)
+]
+
+
+def worker_peak_rss(monitors, paths, out_path):
+    """在独立进程中拼接并返回该进程的峰值常驻内存（MB）"""
+    compose_spanned(monitors, paths, out_path)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / scale / 1024
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(len(LAYOUT)):
+            path = os.path.join(tmp, f"input_{i}.jpg")
+            with open(path, 'wb') as f:
+                f.write(synthetic_jpeg(3840, 2160, seed=i))
+            paths.append(path)
+
+        _, _, width, height = layout_bounds(LAYOUT)
+        print(f"画布: {width}x{height}，RGBX 画布 {width * height * 4 / 1024 / 1024:.0f} MB")
+
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            start = time.perf_counter()
+            peak = pool.submit(worker_peak_rss, LAYOUT, paths, os.path.join(tmp, "out.jpg")).result()
+            print(f"工作进程拼接: {time.perf_counter() - start:.3f} s（含进程启动），峰值RSS {peak:.0f} MB")
+
+        compositor = Compositor(tmp)
+        compositor.compose(LAYOUT, paths)  # 预热工作进程
+        os.remove(os.path.join(compositor.cache_dir, os.listdir(compositor.cache_dir)[0]))
+        start = time.perf_counter()
+        compositor.compose(LAYOUT, paths)
+        print(f"拼接（进程已就绪）: {time.perf_counter() - start:.3f} s")
+        start = time.perf_counter()
+        compositor.compose(LAYOUT, paths)
+        print(f"重复应用（命中缓存）: {(time.perf_counter() - start) * 1000:.2f} ms")
+        compositor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
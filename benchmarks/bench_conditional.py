@@ -0,0 +1,36 @@
+"""条件请求基准：模拟“今日壁纸”按30分钟间隔刷新一天的传输字节数
+
+运行: python -m benchmarks.bench_conditional
+"""
+import os
+import tempfile
+
+from benchmarks.stub_server import StubServer
+from downloader import stream_download, create_session, ValidatorStore
+
+REFRESHES_PER_DAY = 24 * 60 * 60 // 1800
+
+
+def simulate(server, cache_dir, conditional):
+    """按天刷新，第 REFRESHES_PER_DAY // 2 次时切换到新的一天"""
+    session = create_session()
+    validators = ValidatorStore(os.path.join(cache_dir, "validators.json")) if conditional else None
+    start = server.bytes_sent
+    for i in range(REFRESHES_PER_DAY):
+        if i == REFRESHES_PER_DAY // 2:
+            server.set_today("20240102")
+        stream_download(f"{server.base_url}/today", cache_dir, session=session, validators=validators)
+    session.close()
+    return server.bytes_sent - start
+
+
+def main():
+    for conditional in (False, True):
+        with StubServer() as server, tempfile.TemporaryDirectory() as tmp:
+            sent = simulate(server, tmp, conditional)
+            name = "conditional" if conditional else "unconditional"
+            print(f"{name:>14}: {REFRESHES_PER_DAY} 次刷新共传输 {sent / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""下载峰值内存基准：整块读取 response.content 与流式写盘对比
+
+运行: python -m benchmarks.bench_download
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+import requests
+
+from benchmarks.stub_server import StubServer
+from downloader import stream_download
+
+SIZES_MB = [5, 20, 80]
+
+
+def buffered_download(url, cache_dir):
+    """旧实现：完整响应体缓冲在内存中"""
+    response = requests.get(url, timeout=15)
+    response.raise_for_status()
+    with open(os.path.join(cache_dir, "wallpaper.jpg"), 'wb') as f:
+        f.write(response.content)
+
+
+def streaming_download(url, cache_dir):
+    """新实现：流式写盘，按内容哈希命名"""
+    result = stream_download(url, cache_dir)
+    os.remove(result.path)
+
+
+def measure(func, url, cache_dir):
+    """返回 (耗时秒, 峰值内存字节)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(url, cache_dir)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    with StubServer() as server, tempfile.TemporaryDirectory() as tmp:
+        print(f"{'大小':>8} {'方式':>10} {'耗时(s)':>10} {'峰值内存(MB)':>14}")
+        for size_mb in SIZES_MB:
+            url = f"{server.base_url}/blob/{size_mb * 1024 * 1024}"
+            for name, func in (("buffered", buffered_download),
+                               ("streaming", streaming_download)):
+                elapsed, peak = measure(func, url, tmp)
+                print(f"{size_mb:>6}MB {name:>10} {elapsed:>10.3f} {peak / 1024 / 1024:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""启动导入耗时基准：无界面入口的冷启动导入时间与不应被导入的 GUI/重型模块
+
+运行: python -m benchmarks.bench_import [预算毫秒]
+超出预算或导入了禁止的模块时以非零状态退出，可直接用于 CI。
+"""
+import os
+import re
+import sys
+import subprocess
+
+ENTRY = "wallpaper_cli"
+BUDGET_MS = 250
+RUNS = 5
+# 无界面路径不应导入的模块
+FORBIDDEN = ["tkinter", "pystray", "PIL", "numpy", "wallpaper_gui"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure():
+    """在全新解释器中导入入口模块，返回 (入口累计耗时ms, {模块: 累计耗时us})"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY}"],
+        cwd=root, capture_output=True, text=True, check=True
+    ).stderr
+
+    modules = {}
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            _, cumulative, _, name = match.groups()
+            modules[name] = int(cumulative)
+    # 入口模块的累计耗时包含其全部依赖，不含解释器自身启动（site 等）
+    return modules[ENTRY] / 1000, modules
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    runs = [measure() for _ in range(RUNS)]
+    best_ms, modules = min(runs, key=lambda run: run[0])
+
+    heaviest = sorted(
+        ((us, name) for name, us in modules.items() if "." not in name and name != ENTRY),
+        reverse=True
+    )[:8]
+    print(f"import {ENTRY}: 最好 {best_ms:.1f}ms / 预算 {budget:.0f}ms（{RUNS} 次取最小）")
+    for us, name in heaviest:
+        print(f"  {name:<20} {us / 1000:7.1f}ms")
+
+    leaked = [name for name in FORBIDDEN if name in modules]
+    if leaked:
+        print(f"错误: 无界面路径导入了 {', '.join(leaked)}")
+    if best_ms > budget:
+        print("错误: 超出导入耗时预算")
+    sys.exit(1 if leaked or best_ms > budget else 0)
+
+
+if __name__ == "__main__":
+    main()
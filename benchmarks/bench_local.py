@@ -0,0 +1,75 @@
+"""本地图库基准：大目录的首次扫描、增量重扫描与选图耗时
+
+运行: python -m benchmarks.bench_local [图片数 ...]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from PIL import Image
+
+from local_source import LocalLibrary
+
+FILES_PER_DIR = 1000
+PICKS = 10000
+
+
+def tiny_jpeg(width, height):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), "gray").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def populate(root, count):
+    """生成 count 张小图片，按每目录 FILES_PER_DIR 张分布，尺寸横竖交替"""
+    landscape, portrait = tiny_jpeg(64, 36), tiny_jpeg(36, 64)
+    paths = []
+    for i in range(count):
+        folder = os.path.join(root, f"album_{i // FILES_PER_DIR:04d}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(folder)
+        path = os.path.join(folder, f"photo_{i:06d}.jpg")
+        with open(path, 'wb') as f:
+            f.write(landscape if i % 3 else portrait)
+        paths.append(path)
+    return paths
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "photos")
+        paths = populate(root, count)
+        library = LocalLibrary(os.path.join(tmp, "library.db"))
+
+        first, _ = timed(library.scan, [root])
+        unchanged, _ = timed(library.scan, [root])
+        for path in paths[::100]:
+            os.utime(path, None)
+        partial, _ = timed(library.scan, [root])
+
+        library.pick([root], 48, 27)  # 加载候选数组
+        start = time.perf_counter()
+        for _ in range(PICKS):
+            library.pick([root], 48, 27)
+        pick = (time.perf_counter() - start) / PICKS
+        library.close()
+
+    print(f"{count:>8} 张: 首次扫描 {first:6.2f}s | 无变化重扫 {unchanged:5.2f}s | "
+          f"1%变化重扫 {partial:5.2f}s | 选图 {pick * 1e6:5.1f}us")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
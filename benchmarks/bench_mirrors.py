@@ -0,0 +1,44 @@
+"""镜像对冲基准：首选镜像卡顿时，单镜像串行与多镜像对冲的刷新耗时对比
+
+运行: python -m benchmarks.bench_mirrors
+"""
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+from downloader import stream_download, create_session
+from mirrors import HedgedFetcher
+
+IMAGE_SIZE = 2 * 1024 * 1024
+# (首字节延迟毫秒) —— 第一个镜像严重卡顿
+MIRROR_DELAYS = [3000, 150, 400]
+HEDGE_DELAY = 0.5
+ROUNDS = 5
+
+
+def main():
+    with StubServer() as server, tempfile.TemporaryDirectory() as tmp:
+        session = create_session()
+        urls = [f"{server.base_url}/random/{IMAGE_SIZE}?delay={delay}" for delay in MIRROR_DELAYS]
+
+        def attempt(url, cancel, on_headers):
+            return stream_download(url, tmp, session=session, cancel=cancel, on_headers=on_headers)
+
+        start = time.perf_counter()
+        attempt(urls[0], None, None)
+        print(f"单镜像（首选镜像）: {time.perf_counter() - start:.3f} s")
+
+        fetcher = HedgedFetcher(hedge_delay=HEDGE_DELAY)
+        for i in range(ROUNDS):
+            start = time.perf_counter()
+            fetcher.fetch(urls, attempt)
+            elapsed = time.perf_counter() - start
+            p50s = ", ".join(
+                f"{p * 1000:.0f}ms" if p is not None else "-" for p in map(fetcher.stats.p50, urls)
+            )
+            print(f"对冲第 {i + 1} 次: {elapsed:.3f} s  （各镜像 p50: {p50s}）")
+        fetcher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
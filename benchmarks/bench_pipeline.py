@@ -0,0 +1,472 @@
+"""下载 → 缓存 → 预览 → 应用 全流程基准（本地桩服务器模拟 bing.img.run，可在无显示环境运行）
+
+运行: python -m benchmarks.bench_pipeline [--quick] [--no-save] [--check]
+
+--quick    缓存规模只测 1k/10k
+--no-save  不写入结果文件
+--check    与上一次结果相比退化超过阈值（--threshold，默认 25%）时以非零状态退出
+
+每次运行的结果追加到 benchmarks/results.json，输出中与上一次记录对比。结果只在本机有意义，
+该文件不纳入版本库（见 .gitignore），首次运行时没有对比基线。
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import random
+import logging
+import statistics
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.images import PRESET_SIZES, synthetic_picture
+from benchmarks.stub_server import StubServer, archive_json
+from catalog import COLORS, Catalog, FileFeed
+from display import DisplayDetector, FakeBackend, Monitor
+from preview import decode_preview, scale_preview
+from perceptual_hash import HashIndex, hash_file, hash_image
+from stream_decoder import StreamDecoder
+from thumbnails import ThumbnailStore, thumbnail_path
+from wallpaper_manager import APIConfigManager, WallpaperManager
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+MAX_RUNS = 50
+REGRESSION = 0.25  # 默认比上次差 25% 以上视为退化
+NOISE_FLOOR_MS = 2.0  # 耗时类指标差值小于该值时不算退化（亚毫秒级指标抖动大）
+ROUNDS = 9
+FAST_ROUNDS = 50  # 亚毫秒级操作的重复次数
+CACHE_COUNTS = [1_000, 10_000, 100_000]
+CACHE_FILE_SIZE = 16
+PREVIEW_BOX = (600, 400)
+HASH_COUNT = 100_000  # 近似重复查询的哈希库规模
+DISTINCT_PICTURES = 20  # 估计不同图片间最小汉明距离用的图片数
+ARCHIVE_DAYS = 6_000  # 本地目录规模（Bing 自 2009 年起约 6000 天）
+ARCHIVE_SHOWN = 0.9  # 目录中已显示过的比例（不重复选择时只剩一成候选）
+
+# 网络条件：(延迟秒, 带宽字节/秒, 失败率)
+PROFILES = {
+    "local": (0.0, 0, 0.0),
+    "slow": (0.2, 2 * 1024 * 1024, 0.0),
+    "flaky": (0.0, 0, 0.3)
+}
+# 丢包链路：每个 64KB 数据块前断线的概率
+DISCONNECT_RATE = 0.05
+# 带宽自适应：auto 分辨率下单次下载的耗时上限（秒），慢速链路上 UHD 约需 2 秒
+ADAPTIVE_MAX_SECONDS = 1
+
+
+class Results:
+    """收集指标：名称 -> (数值, 单位, 是否越小越好)"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, lower_is_better=True):
+        self.metrics[name] = (value, unit, lower_is_better)
+        print(f"  {name:<32} {value:>10.2f} {unit}")
+
+
+def median_ms(func, rounds=ROUNDS):
+    """重复执行取耗时中位数（毫秒）"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def make_manager(home, server, **overrides):
+    """在独立的 HOME/工作目录中创建使用桩服务器的 WallpaperManager"""
+    os.makedirs(home, exist_ok=True)
+    os.environ["HOME"] = home
+    os.chdir(home)
+    config = copy.deepcopy(APIConfigManager.DEFAULT_CONFIG)
+    config["sources"]["today"]["templates"] = server.templates()
+    config["sources"]["random"]["templates"] = server.templates(rand=True)
+    config.update({
+        "current_source": "random",
+        "prefetch_depth": 0,
+        "cache_max_bytes": 10 * 1024 ** 3,
+        # 桩服务器的随机接口每次返回同一张合成图片，开启时所有下载都会被合并；由 bench_near_duplicates 单独测量
+        "near_duplicates": False
+    })
+    config.update(overrides)
+    with open(APIConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    return WallpaperManager(detector=DisplayDetector(FakeBackend()))
+
+
+def close_manager(manager):
+    manager.close()
+    manager.cache_index.close()
+
+
+def bench_download(root, server, results):
+    """各预设的下载吞吐量与峰值内存"""
+    manager = make_manager(os.path.join(root, "download"), server)
+    for preset in PRESET_SIZES:
+        urls = manager.generate_api_urls(preset, "random")
+        manager.download_wallpaper(urls, preset)  # 预热：服务端生成图片、建立连接
+
+        elapsed = median_ms(lambda: manager.download_wallpaper(urls, preset)) / 1000
+        size = os.path.getsize(manager.current_wallpaper)
+        results.add(f"download.{preset}.throughput", size / elapsed / 1024 / 1024, "MB/s", False)
+
+        tracemalloc.start()
+        manager.download_wallpaper(urls, preset)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.add(f"download.{preset}.peak_memory", peak / 1024 / 1024, "MB")
+    close_manager(manager)
+
+
+def populate_cache(cache_dir, count):
+    os.makedirs(cache_dir, exist_ok=True)
+    now = time.time() - count
+    for i in range(count):
+        path = os.path.join(cache_dir, f"wallpaper_{i:08d}.jpg")
+        with open(path, 'wb') as f:
+            f.write(b"\0" * CACHE_FILE_SIZE)
+        os.utime(path, (now + i, now + i))
+
+
+def bench_cache(root, server, results, counts):
+    """clean_cache 与 use_cached_wallpaper 在不同缓存规模下的单次耗时"""
+    for count in counts:
+        home = os.path.join(root, f"cache_{count}")
+        populate_cache(os.path.join(home, ".wallpaper_cache"), count)
+        start = time.perf_counter()
+        manager = make_manager(home, server, cache_max_bytes=count * CACHE_FILE_SIZE)
+        results.add(f"cache.{count}.startup", (time.perf_counter() - start) * 1000, "ms")
+
+        samples = []
+        for i in range(FAST_ROUNDS):
+            path = os.path.join(manager.cache_dir, f"new_{i:04d}.jpg")
+            with open(path, 'wb') as f:
+                f.write(b"\0" * CACHE_FILE_SIZE)
+            manager.cache_index.add(path, CACHE_FILE_SIZE)
+            manager.current_wallpaper = path
+            samples.append(median_ms(manager.clean_cache, 1))
+        results.add(f"cache.{count}.clean_cache", statistics.median(samples), "ms")
+        results.add(f"cache.{count}.use_cached", median_ms(manager.use_cached_wallpaper, FAST_ROUNDS), "ms")
+        close_manager(manager)
+
+
+def bench_near_duplicates(root, results):
+    """感知哈希：入库时计算的耗时、10 万张哈希中查找近似图片的耗时，以及区分度"""
+    directory = os.path.join(root, "phash")
+    os.makedirs(directory, exist_ok=True)
+    same = []
+    for preset in ("uhd", "1080p", "768p"):
+        for quality in (90, 75):
+            path = os.path.join(directory, f"{preset}_{quality}.jpg")
+            data = synthetic_picture(*PRESET_SIZES[preset], seed=1, quality=quality)
+            with open(path, 'wb') as f:
+                f.write(data)
+            same.append(hash_file(path)[0])
+        if preset == "uhd":
+            results.add("phash.uhd.file", median_ms(lambda: hash_file(path)), "ms")
+            decoder = StreamDecoder()
+            decoder.feed(data)
+            preview = decoder.close()[3]
+            results.add("phash.uhd.from_download", median_ms(lambda: hash_image(preview), FAST_ROUNDS), "ms")
+            same.append(hash_image(preview))
+    # 同一张图片不同分辨率/质量之间的最大距离应明显小于不同图片之间的最小距离
+    results.add("phash.same_picture.max_bits", max(bin(a ^ b).count("1") for a in same for b in same), "bits")
+    distinct = [dhash_of(synthetic_picture(480, 270, seed=seed)) for seed in range(2, 2 + DISTINCT_PICTURES)]
+    results.add(
+        "phash.distinct.min_bits",
+        min(bin(a ^ b).count("1") for i, a in enumerate(distinct) for b in distinct[i + 1:]),
+        "bits", lower_is_better=False
+    )
+
+    index = HashIndex()
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 64 - 1, HASH_COUNT, dtype=np.uint64, endpoint=True)
+    index.extend((f"{i}.jpg", int(value), 1) for i, value in enumerate(hashes))
+    probe = same[0]
+    results.add(f"phash.match.{HASH_COUNT // 1000}k", median_ms(lambda: index.nearest(probe), FAST_ROUNDS), "ms")
+
+
+def dhash_of(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return hash_image(img)
+
+
+def bench_preview(root, server, results):
+    """预览耗时（show_preview 在工作线程中的全部工作）：从磁盘解码，以及复用下载时增量解码的图片"""
+    manager = make_manager(os.path.join(root, "preview"), server)
+    for preset in PRESET_SIZES:
+        manager.download_wallpaper(manager.generate_api_urls(preset, "random"), preset)
+        path = manager.current_wallpaper
+        decode_preview(path, PREVIEW_BOX)
+        results.add(f"preview.{preset}.decode", median_ms(lambda: decode_preview(path, PREVIEW_BOX)), "ms")
+        draft = manager.decoded_preview(path)
+        if draft is not None:  # 图片太小无法降采样时没有
+            results.add(f"preview.{preset}.from_download", median_ms(lambda: scale_preview(draft, PREVIEW_BOX)), "ms")
+    close_manager(manager)
+
+
+def bench_prefit(root, server, results):
+    """各预设适配到 1920x1080 屏幕的耗时（工作进程）与文件大小比例"""
+    manager = make_manager(os.path.join(root, "prefit"), server)
+    for preset in PRESET_SIZES:
+        samples = []
+        for _ in range(ROUNDS):
+            manager.download_wallpaper(manager.generate_api_urls(preset, "random"), preset)
+            original = manager.current_wallpaper
+            start = time.perf_counter()
+            variant = manager.fit_for_display(original)
+            samples.append((time.perf_counter() - start) * 1000)
+        if variant == original:
+            continue  # 尺寸一致或需要放大，不生成适配版本
+        results.add(f"prefit.{preset}.fit", statistics.median(samples), "ms")
+        results.add(f"prefit.{preset}.size_ratio", os.path.getsize(variant) / os.path.getsize(original) * 100, "%")
+    close_manager(manager)
+
+
+def bench_thumbnails(root, server, results):
+    """历史画廊缩略图：从原图生成与从磁盘缩略图库读取的耗时"""
+    manager = make_manager(os.path.join(root, "thumbnails"), server)
+    for preset in PRESET_SIZES:
+        manager.download_wallpaper(manager.generate_api_urls(preset, "random"), preset)
+        path = manager.current_wallpaper
+
+        def generate():
+            store = ThumbnailStore(manager.thumbnails.dir)
+            store.discard(path)
+            store.load(path)
+
+        results.add(f"thumbnail.{preset}.generate", median_ms(generate), "ms")
+    # 已生成过的缩略图（新建实例，不命中内存缓存）
+    results.add("thumbnail.load", median_ms(lambda: ThumbnailStore(manager.thumbnails.dir).load(path), FAST_ROUNDS), "ms")
+    results.add("thumbnail.file_size", os.path.getsize(thumbnail_path(manager.thumbnails.dir, path)) / 1024, "KB")
+    close_manager(manager)
+
+
+def refresh_cycle(manager, resolution):
+    """一次完整刷新：下载/选图 → 设置壁纸 → 生成预览"""
+    if not manager.refresh(resolution):
+        raise RuntimeError("刷新失败")
+    manager.apply_wallpaper(manager.current_wallpaper)
+    decode_preview(manager.current_wallpaper, PREVIEW_BOX)
+
+
+def bench_refresh(root, server, results):
+    """不同网络条件下的端到端刷新耗时（1080p）"""
+    for name, (latency, bandwidth, failure_rate) in PROFILES.items():
+        manager = make_manager(os.path.join(root, f"refresh_{name}"), server, download_attempts=8)
+        manager.retry_policy.base_delay = 0.05  # 缩短退避，只衡量重试路径本身
+        refresh_cycle(manager, "1080p")
+        server.latency, server.bandwidth, server.failure_rate = latency, bandwidth, failure_rate
+        results.add(f"refresh.{name}", median_ms(lambda: refresh_cycle(manager, "1080p")), "ms")
+        server.latency, server.bandwidth, server.failure_rate = 0.0, 0, 0.0
+        close_manager(manager)
+
+    # 今日壁纸未更新时的刷新（条件请求 304）
+    manager = make_manager(os.path.join(root, "refresh_today"), server, current_source="today")
+    refresh_cycle(manager, "1080p")
+    results.add("refresh.today_not_modified", median_ms(lambda: refresh_cycle(manager, "1080p")), "ms")
+    close_manager(manager)
+
+
+def bench_resume(root, server, results):
+    """传输中途频繁断线时，每成功下载一张 UHD 壁纸实际传输的字节数（文件大小的倍数，续传时应接近 1）"""
+    manager = make_manager(os.path.join(root, "resume"), server, current_source="today", download_attempts=20)
+    manager.retry_policy.base_delay = manager.retry_policy.max_delay = 0.01
+    server.disconnect_rate = DISCONNECT_RATE
+    sent = size = 0
+    try:
+        for i in range(ROUNDS):
+            server.set_today(f"2024{i + 2:04d}")
+            start = server.bytes_sent
+            if not manager.download_wallpaper(manager.generate_api_urls("uhd", "today"), "uhd"):
+                raise RuntimeError("下载失败")
+            sent += server.bytes_sent - start
+            size += os.path.getsize(manager.current_wallpaper)
+    finally:
+        server.disconnect_rate = 0.0
+        server.set_today("20240101")
+        close_manager(manager)
+    results.add("resume.uhd.bytes_ratio", sent / size, "x")
+
+
+def bench_bandwidth(root, server, results):
+    """慢速链路、4K 屏幕下 auto 分辨率的刷新耗时：按实测带宽降级时应不超过耗时上限"""
+    for name, max_seconds in (("fixed", 0), ("adaptive", ADAPTIVE_MAX_SECONDS)):
+        manager = make_manager(
+            os.path.join(root, f"bandwidth_{name}"), server,
+            current_source="today", max_download_seconds=max_seconds
+        )
+        manager.detector.backend.set_monitors([Monitor(0, 0, 3840, 2160, True)])
+        latency, bandwidth, _ = PROFILES["slow"]
+        server.latency, server.bandwidth = latency, bandwidth
+        days = iter(range(2, 100))
+
+        def refresh():
+            server.set_today(f"2024{next(days):04d}")
+            if not manager.refresh("auto"):
+                raise RuntimeError("刷新失败")
+
+        try:
+            refresh()  # 首次下载时吞吐量未知，不降级
+            results.add(f"bandwidth.slow.{name}", median_ms(refresh, 3), "ms")
+        finally:
+            server.latency, server.bandwidth = 0.0, 0
+            server.set_today("20240101")
+            close_manager(manager)
+
+
+def bench_catalog(root, server, results):
+    """本地目录：批量导入完整归档、按条件选图的耗时，以及目录数据源每次刷新实际下载的图片数"""
+    directory = os.path.join(root, "catalog")
+    os.makedirs(directory, exist_ok=True)
+    fixture = os.path.join(directory, "archive.json")
+    with open(fixture, 'w', encoding='utf-8') as f:
+        json.dump(archive_json(ARCHIVE_DAYS), f)
+    feed = FileFeed(fixture, base_url=server.base_url)
+    rounds = iter(range(ROUNDS))
+
+    def sync():
+        catalog = Catalog(os.path.join(directory, f"sync_{next(rounds)}.db"))
+        catalog.sync(feed)
+        catalog.close()
+
+    results.add(f"catalog.sync.{ARCHIVE_DAYS // 1000}k", median_ms(sync), "ms")
+
+    catalog = Catalog(os.path.join(directory, Catalog.DB_NAME))
+    catalog.sync(feed)
+    rng = random.Random(0)
+    for image in feed.fetch():
+        if rng.random() < ARCHIVE_SHOWN:
+            histogram = bytes(rng.randrange(256) for _ in COLORS)
+            catalog.record_download(image.date, "1080p", image.urls["1080p"], None, histogram)
+    results.add("catalog.pick", median_ms(lambda: catalog.pick("1080p", no_repeat_days=30), FAST_ROUNDS), "ms")
+    results.add(
+        "catalog.pick_filtered",
+        median_ms(lambda: catalog.pick("1080p", 0, "20120101", "20191231", color="blue"), FAST_ROUNDS), "ms"
+    )
+    catalog.close()
+
+    # 目录数据源的端到端刷新：每次只下载选中的一张
+    manager = make_manager(os.path.join(root, "archive"), server, current_source="archive")
+    manager.api_config.config["sources"]["archive"]["feed"] = f"{server.base_url}/HPImageArchive.aspx?n=60"
+    refresh_cycle(manager, "1080p")
+    before = server.archive_requests
+    results.add("refresh.archive", median_ms(lambda: refresh_cycle(manager, "1080p")), "ms")
+    results.add("catalog.downloads_per_refresh", (server.archive_requests - before) / ROUNDS, "x")
+    close_manager(manager)
+
+
+def load_runs():
+    try:
+        with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)["runs"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return []
+
+
+def compare(results, runs, threshold=REGRESSION):
+    """与上一次记录逐项对比，返回退化的指标名列表"""
+    previous = runs[-1]["metrics"] if runs else {}
+    regressions = []
+    print(f"\n{'指标':<32} {'本次':>10} {'上次':>10} {'变化':>8}")
+    for name, (value, unit, lower_is_better) in results.metrics.items():
+        if name not in previous or not previous[name]["value"]:
+            print(f"{name:<32} {value:>10.2f} {'-':>10} {'-':>8}")
+            continue
+        old = previous[name]["value"]
+        change = (value - old) / old
+        worse = change > threshold if lower_is_better else change < -threshold
+        if unit == "ms" and abs(value - old) < NOISE_FLOOR_MS:
+            worse = False
+        if worse:
+            regressions.append(name)
+        print(f"{name:<32} {value:>10.2f} {old:>10.2f} {change:>+7.0%}{' ✗' if worse else ''}")
+    return regressions
+
+
+def save_run(results, runs):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(RESULTS_FILE), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    runs.append({
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "metrics": {
+            name: {"value": round(value, 4), "unit": unit, "lower_is_better": lower_is_better}
+            for name, (value, unit, lower_is_better) in results.metrics.items()
+        }
+    })
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"runs": runs[-MAX_RUNS:]}, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全流程基准")
+    parser.add_argument("--quick", action="store_true", help="缓存规模只测 1k/10k")
+    parser.add_argument("--no-save", action="store_true", help="不写入结果文件")
+    parser.add_argument("--check", action="store_true", help="有退化时以非零状态退出")
+    parser.add_argument("--threshold", type=float, default=REGRESSION, help="退化阈值（比例）")
+    args = parser.parse_args()
+
+    # 重试、熔断等预期内的错误日志不输出到终端
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    results = Results()
+    cwd, home = os.getcwd(), os.environ.get("HOME")
+    with StubServer() as server, tempfile.TemporaryDirectory() as root:
+        try:
+            print("下载:")
+            bench_download(root, server, results)
+            print("缓存:")
+            bench_cache(root, server, results, CACHE_COUNTS[:2] if args.quick else CACHE_COUNTS)
+            print("近似重复:")
+            bench_near_duplicates(root, results)
+            print("预览:")
+            bench_preview(root, server, results)
+            print("屏幕适配:")
+            bench_prefit(root, server, results)
+            print("缩略图:")
+            bench_thumbnails(root, server, results)
+            print("端到端刷新:")
+            bench_refresh(root, server, results)
+            print("断线续传:")
+            bench_resume(root, server, results)
+            print("带宽自适应:")
+            bench_bandwidth(root, server, results)
+            print("本地目录:")
+            bench_catalog(root, server, results)
+        finally:
+            os.chdir(cwd)
+            if home is not None:
+                os.environ["HOME"] = home
+
+    runs = load_runs()
+    regressions = compare(results, runs, args.threshold)
+    if not args.no_save:
+        save_run(results, runs)
+        print(f"\n结果已追加到 {RESULTS_FILE}")
+    if regressions:
+        print(f"退化: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""预览解码基准：全尺寸解码 + LANCZOS 与 draft 降采样解码对比
+
+运行: python -m benchmarks.bench_preview
+"""
+import os
+import tempfile
+import time
+from PIL import Image
+
+from benchmarks.images import PRESET_SIZES, synthetic_jpeg
+from preview import PreviewRenderer, decode_preview
+
+BOX = (600, 400)
+ROUNDS = 10
+
+
+def legacy_preview(path, box_size):
+    """旧实现：完整解码后缩放"""
+    img = Image.open(path)
+    ratio = min(box_size[0] / img.width, box_size[1] / img.height)
+    return img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def cached_render(renderer, path):
+    """经过缩略图缓存的渲染（等待回调完成）"""
+    done = []
+    renderer.render(path, BOX, done.append)
+    while not done:
+        time.sleep(0)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'预设':>8} {'全尺寸解码(ms)':>16} {'draft解码(ms)':>14} {'缓存命中(ms)':>12}")
+        for name, (width, height) in PRESET_SIZES.items():
+            path = os.path.join(tmp, f"{name}.jpg")
+            with open(path, 'wb') as f:
+                f.write(synthetic_jpeg(width, height))
+            renderer = PreviewRenderer()
+            cached_render(renderer, path)
+            print(f"{name:>8} {timed(legacy_preview, path, BOX):>16.1f} "
+                  f"{timed(decode_preview, path, BOX):>14.1f} "
+                  f"{timed(cached_render, renderer, path):>12.2f}")
+            renderer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
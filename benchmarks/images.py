@@ -0,0 +1,39 @@
+"""合成测试图片"""
+import io
+import random
+from PIL import Image, ImageDraw
+
+# 与 bing.img.run 各模板对应的尺寸
+PRESET_SIZES = {
+    "uhd": (3840, 2160),
+    "1080p": (1920, 1080),
+    "768p": (1366, 768),
+    "mobile": (1080, 1920)
+}
+
+
+def synthetic_jpeg(width, height, quality=90, seed=0):
+    """生成带噪声纹理的 JPEG 字节（压缩率接近真实照片）"""
+    noise = Image.effect_noise((width, height), 48 + seed % 16)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def synthetic_picture(width, height, seed=0, quality=90):
+    """生成构图随 seed 变化的 JPEG：同一 seed 的不同尺寸是同一张图片的缩放版本（感知哈希测试用）"""
+    rng = random.Random(seed)
+    base = Image.new("RGB", (480, 270), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(base)
+    for _ in range(12):
+        x, y = rng.randrange(-60, 480), rng.randrange(-40, 270)
+        draw.ellipse(
+            [x, y, x + rng.randrange(40, 240), y + rng.randrange(30, 160)],
+            fill=tuple(rng.randrange(256) for _ in range(3))
+        )
+    img = base.resize((width, height), Image.Resampling.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
@@ -0,0 +1,334 @@
+"""本地HTTP桩服务器（模拟壁纸接口，用于基准测试）"""
+import sys
+import json
+import time
+import random
+import itertools
+import threading
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 响应体由固定块循环拼接，服务端自身不占用与文件大小成比例的内存
+_BLOCK = bytes(range(256)) * 256
+
+# bing.img.run 模板名 -> (分辨率预设, 是否随机)
+BING_TEMPLATES = {
+    "uhd": ("uhd", False),
+    "1920x1080": ("1080p", False),
+    "1366x768": ("768p", False),
+    "m": ("mobile", False),
+    "rand_uhd": ("uhd", True),
+    "rand": ("1080p", True),
+    "rand_1366x768": ("768p", True),
+    "rand_m": ("mobile", True)
+}
+BING_PRESETS = {preset for preset, _ in BING_TEMPLATES.values()}
+# HPImageArchive 图片地址后缀 -> 分辨率预设
+ARCHIVE_SUFFIXES = {"UHD": "uhd", "1920x1080": "1080p", "1366x768": "768p", "1080x1920": "mobile"}
+ARCHIVE_FIRST_DAY = date(2009, 1, 1)
+
+
+def archive_json(days, first=ARCHIVE_FIRST_DAY):
+    """HPImageArchive 格式的归档元数据（从 first 起连续 days 天，最新的在前），urlbase 指向本服务器的 /archive/"""
+    images = []
+    for i in range(days):
+        day = (first + timedelta(days=i)).strftime("%Y%m%d")
+        images.append({
+            "startdate": day,
+            "urlbase": f"/archive/OHR.Day{day}_ZH-CN",
+            "title": f"第 {i + 1} 天",
+            "copyright": "合成测试图片"
+        })
+    return {"images": images[::-1]}
+
+
+class _JpegCache:
+    """按预设尺寸懒生成并缓存合成 JPEG"""
+
+    def __init__(self):
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, preset):
+        with self._lock:
+            if preset not in self._images:
+                from benchmarks.images import PRESET_SIZES, synthetic_jpeg
+                self._images[preset] = synthetic_jpeg(*PRESET_SIZES[preset])
+            return self._images[preset]
+
+
+def _tag_jpeg(data, tag):
+    """在 SOI 后插入 COM 注释段，不重新编码即可得到内容不同的合法 JPEG
+
+    返回分段列表（不拼接），与客户端同进程运行时不会产生与图片大小成比例的分配。
+    """
+    comment = str(tag).encode()
+    view = memoryview(data)
+    return [view[:2], b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment, view[2:]]
+
+
+def _slice_parts(parts, start, stop):
+    """取分段列表中 [start, stop) 字节对应的分段（不拷贝数据）"""
+    sliced = []
+    for part in parts:
+        view = memoryview(part)
+        if start < len(view) and stop > 0:
+            sliced.append(view[max(start, 0):stop])
+        start -= len(view)
+        stop -= len(view)
+    return sliced
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """路由：
+    GET /blob/<字节数>  返回指定大小的数据
+    GET /today          302 跳转到当天图片（模拟 bing.img.run/uhd.php）
+    GET /image/<日期>   带 ETag/Last-Modified 的图片，支持 304
+    GET /random/<字节数> 每次返回内容不同的数据（模拟随机历史壁纸）
+    GET /<模板>.php     模拟 bing.img.run 的各分辨率模板，返回对应尺寸的合成 JPEG
+                        （今日壁纸 302 跳转到 /bing/<预设>/<日期>.jpg，rand_* 每次内容不同）
+    GET /portal         200 的 HTML 登录页（模拟强制门户劫持），?type= 可伪造 Content-Type
+    GET /truncated/<预设> 只有前一半数据的 JPEG（Content-Length 与实际一致）
+    GET /HPImageArchive.aspx?n=<天数> 归档元数据（见 archive_json），图片地址为下一条路由
+    GET /archive/OHR.Day<日期>_ZH-CN_<后缀>.jpg 归档中某天某分辨率的合成 JPEG（带 ETag）
+
+    /bing/ 下的图片支持 Range/If-Range（单个 bytes=N- 或 N-M 范围）。
+
+    查询参数：
+    delay=<毫秒>  返回响应头前的延迟（模拟首字节慢的镜像）
+
+    服务器级的延迟、带宽、失败率和断线率见 StubServer。
+    """
+
+    def do_GET(self):
+        self._sent = 0  # 本次响应已发送的响应体字节数
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        delay = self.server.latency + int(query.get("delay", ["0"])[0]) / 1000
+        if delay:
+            time.sleep(delay)
+        if self.server.failure_rate and random.random() < self.server.failure_rate:
+            self.server.failures += 1
+            self.send_error(503)
+            return
+        parts = url.path.strip("/").split("/")
+        template = parts[0][:-len(".php")] if len(parts) == 1 and parts[0].endswith(".php") else None
+        if template in BING_TEMPLATES:
+            preset, rand = BING_TEMPLATES[template]
+            if rand:
+                self._send_bytes(_tag_jpeg(self.server.jpeg(preset), next(self.server.random_ids)))
+            else:
+                self.send_response(302)
+                self.send_header("Location", f"/bing/{preset}/{self.server.today}.jpg")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+        elif len(parts) == 3 and parts[0] == "bing" and parts[1] in BING_PRESETS:
+            etag = f'"{parts[1]}-{parts[2]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send_bytes(_tag_jpeg(self.server.jpeg(parts[1]), parts[2]), {"ETag": etag}, ranges=True)
+        elif parts == ["portal"]:
+            page = b"<!DOCTYPE html><html><head><title>Login</title></head><body>" + b"<p>Sign in</p>" * 4096 + b"</body></html>"
+            self._send_bytes([page], {"Content-Type": query.get("type", ["text/html; charset=utf-8"])[0]})
+        elif len(parts) == 2 and parts[0] == "truncated" and parts[1] in BING_PRESETS:
+            data = self.server.jpeg(parts[1])
+            self._send_bytes([memoryview(data)[:len(data) // 2]])
+        elif parts == ["HPImageArchive.aspx"]:
+            body = json.dumps(archive_json(int(query.get("n", ["8"])[0]))).encode()
+            self._send_bytes([body], {"Content-Type": "application/json"})
+        elif len(parts) == 2 and parts[0] == "archive" and parts[1].endswith(".jpg"):
+            name, _, suffix = parts[1][:-len(".jpg")].rpartition("_")
+            if suffix not in ARCHIVE_SUFFIXES:
+                self.send_error(404)
+                return
+            self.server.archive_requests += 1
+            self._send_bytes(_tag_jpeg(self.server.jpeg(ARCHIVE_SUFFIXES[suffix]), name), {"ETag": f'"{parts[1]}"'})
+        elif len(parts) == 2 and parts[0] == "blob" and parts[1].isdigit():
+            self._send_body(int(parts[1]))
+        elif len(parts) == 2 and parts[0] == "random" and parts[1].isdigit():
+            self._send_body(int(parts[1]), prefix=next(self.server.random_ids).to_bytes(8, "big"))
+        elif parts == ["today"]:
+            self.send_response(302)
+            self.send_header("Location", f"/image/{self.server.today}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif len(parts) == 2 and parts[0] == "image":
+            etag = f'"{parts[1]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send_body(self.server.image_size, {
+                "ETag": etag,
+                "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"
+            })
+        else:
+            self.send_error(404)
+
+    def _send_bytes(self, parts, headers=None, ranges=False):
+        headers = dict(headers or {})
+        total = sum(len(part) for part in parts)
+        status = 200
+        if ranges:
+            headers["Accept-Ranges"] = "bytes"
+            byte_range = self._requested_range(headers.get("ETag"), total)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{total}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range:
+                start, end = byte_range
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+                parts = _slice_parts(parts, start, end + 1)
+                total = end + 1 - start
+
+        self.send_response(status)
+        self.send_header("Content-Type", headers.pop("Content-Type", "image/jpeg"))
+        self.send_header("Content-Length", str(total))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        for part in parts:
+            for offset in range(0, len(part), len(_BLOCK)):
+                self._write(part[offset:offset + len(_BLOCK)])
+
+    def _requested_range(self, etag, total):
+        """解析 Range 请求头：返回 (起点, 终点)；应返回完整内容时为 None，范围无法满足时为 False"""
+        value = self.headers.get("Range", "")
+        if_range = self.headers.get("If-Range")
+        if not value.startswith("bytes=") or "," in value or (if_range and if_range != etag):
+            return None
+        first, _, last = value[len("bytes="):].partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start, end = int(first), min(int(last) if last else total - 1, total - 1)
+        return (start, end) if start <= end else False
+
+    def _write(self, chunk):
+        """写出一块数据：设置了带宽时按速率限流，设置了断线率时按概率中途断开连接，
+        设置了 disconnect_after 时在本次响应发送到该字节数处断开（只生效一次）"""
+        if self.server.disconnect_rate and random.random() < self.server.disconnect_rate:
+            self._disconnect()
+        limit = self.server.disconnect_after
+        if limit and self._sent + len(chunk) >= limit:
+            self.server.disconnect_after = 0
+            chunk = chunk[:limit - self._sent]
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            self.server.bytes_sent += len(chunk)
+            self._disconnect()
+        self.wfile.write(chunk)
+        self._sent += len(chunk)
+        self.server.bytes_sent += len(chunk)
+        if self.server.bandwidth:
+            time.sleep(len(chunk) / self.server.bandwidth)
+
+    def _disconnect(self):
+        self.server.disconnects += 1
+        self.close_connection = True
+        raise ConnectionAbortedError("模拟连接中断")
+
+    def _send_body(self, size, headers=None, prefix=b""):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(size))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        prefix = prefix[:size]
+        self._write(prefix)
+        remaining = size - len(prefix)
+        while remaining > 0:
+            chunk = _BLOCK[:min(len(_BLOCK), remaining)]
+            self._write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    """客户端主动断开（取消/超时）属于预期情况，不打印异常"""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """在后台线程运行的桩服务器，支持 with 语句
+
+    latency 为每个请求返回响应头前的延迟（秒），bandwidth 为每个连接的发送速率（字节/秒，0 不限），
+    failure_rate 为请求直接返回 503 的概率，disconnect_rate 为每发送一个 64KB 数据块前断开连接的概率
+    （模拟丢包严重的链路上传输中途断线）。四者可随时修改。
+    disconnect_after 设为 N 时，下一个响应在发送 N 字节响应体后断开连接（一次性，之后自动清零），用于确定性地测试续传。
+    """
+
+    def __init__(self, handler=StubHandler, image_size=4 * 1024 * 1024, latency=0.0, bandwidth=0, failure_rate=0.0,
+                 disconnect_rate=0.0):
+        self.httpd = _QuietServer(("127.0.0.1", 0), handler)
+        self.httpd.bytes_sent = 0
+        self.httpd.random_ids = itertools.count(1)  # next() 在 CPython 中是原子的，并发请求不会拿到相同编号
+        self.httpd.failures = 0
+        self.httpd.today = "20240101"
+        self.httpd.image_size = image_size
+        self.httpd.latency = latency
+        self.httpd.bandwidth = bandwidth
+        self.httpd.failure_rate = failure_rate
+        self.httpd.disconnect_rate = disconnect_rate
+        self.httpd.disconnects = 0
+        self.httpd.disconnect_after = 0
+        self.httpd.archive_requests = 0
+        self.httpd.jpeg = _JpegCache()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __getattr__(self, name):
+        if name in ("latency", "bandwidth", "failure_rate", "failures", "disconnect_rate", "disconnects",
+                    "disconnect_after", "archive_requests"):
+            return getattr(self.httpd, name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in ("latency", "bandwidth", "failure_rate", "disconnect_rate", "disconnect_after"):
+            setattr(self.httpd, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def templates(self, rand=False):
+        """与默认配置相同结构的模板表（预设 -> URL），可直接写入数据源配置"""
+        return {
+            preset: f"{self.base_url}/{name}.php"
+            for name, (preset, is_rand) in BING_TEMPLATES.items() if is_rand == rand
+        }
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def bytes_sent(self):
+        """累计发送的响应体字节数"""
+        return self.httpd.bytes_sent
+
+    def set_today(self, day):
+        """切换“今日”图片"""
+        self.httpd.today = day
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
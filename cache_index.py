@@ -0,0 +1,324 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+from preview import is_sha256
+
+
+class CacheIndex:
+    """壁纸缓存索引（SQLite 持久化）
+
+    记录每个缓存文件的路径、大小、分辨率、来源、内容哈希、感知哈希、像素数、引用计数、最近使用时间和命中次数。
+    文件按内容哈希存放，逐字节相同的下载只增加引用计数，容量和淘汰均按唯一图片计算。
+    淘汰按最近使用时间做真正的 LRU，容量以字节计；随机回退选择在内存数组上 O(1) 完成。
+    屏幕适配版本（来源为 PREFIT_SOURCE）参与容量统计和淘汰，但不进入随机选择的数组。
+    """
+    DB_NAME = "cache_index.db"
+    SCHEMA_VERSION = 3
+    PREFIT_SOURCE = "prefit"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # 内存中的原图路径数组 + 位置表，用于 O(1) 随机选择和删除
+        self._paths = []
+        self._positions = {}
+        self._total_bytes = 0
+        db_path = os.path.join(cache_dir, self.DB_NAME)
+        try:
+            self._open(db_path)
+        except sqlite3.DatabaseError as e:
+            if isinstance(e, sqlite3.OperationalError):
+                raise  # 被锁定、无法打开等不是文件损坏
+            self._conn.close()
+            logging.error(f"缓存索引损坏，重新创建并从缓存目录重建: {str(e)}")
+            set_aside_database(db_path)
+            self._open(db_path)
+
+        if not self._paths:
+            self.rebuild()
+
+    def _open(self, db_path):
+        """打开数据库、建表并升级结构，加载内存数组"""
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                resolution TEXT NOT NULL DEFAULT '',
+                source TEXT NOT NULL DEFAULT '',
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                sha256 TEXT,
+                refcount INTEGER NOT NULL DEFAULT 1,
+                phash INTEGER,
+                pixels INTEGER
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        self._migrate()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON entries(last_used)")
+        self._conn.commit()
+        self._load()
+
+    def _migrate(self):
+        """升级旧版本索引结构"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if "sha256" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN sha256 TEXT")
+            if "refcount" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN refcount INTEGER NOT NULL DEFAULT 1")
+        if version < 3:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if "phash" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN phash INTEGER")
+            if "pixels" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN pixels INTEGER")
+        self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _load(self):
+        """从数据库加载路径数组和总字节数"""
+        self._paths = [
+            row[0] for row in self._conn.execute("SELECT path FROM entries WHERE source != ?", (self.PREFIT_SOURCE,))
+        ]
+        self._positions = {path: i for i, path in enumerate(self._paths)}
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def rebuild(self):
+        """扫描缓存目录重建索引（首次启用或索引损坏时）"""
+        rows = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.jpg'):
+                    stat = entry.stat()
+                    name = entry.name[:-len('.jpg')]
+                    if prefit_original(entry.path):
+                        size = name.partition('.')[2]
+                        rows.append((entry.path, stat.st_size, size, self.PREFIT_SOURCE, stat.st_mtime, stat.st_mtime, None))
+                        continue
+                    sha256 = name if is_sha256(name) else None  # 旧版时间戳命名的文件没有哈希
+                    rows.append((entry.path, stat.st_size, "", "", stat.st_mtime, stat.st_mtime, sha256))
+
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.executemany(
+                """INSERT INTO entries (path, size, resolution, source, created, last_used, sha256)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            self._conn.commit()
+            self._load()
+        if rows:
+            logging.info(f"已从缓存目录重建索引: {len(rows)} 个文件")
+
+    def add(self, path, size, resolution="", source="", sha256=None, phash=None, pixels=None):
+        """登记一次下载；内容已存在时只增加引用计数并刷新使用时间
+
+        phash 为 64 位感知哈希（无符号整数），pixels 为原始像素数。
+        返回 True 表示新增了唯一图片，False 表示重复内容。
+        """
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE path = ?", (path,)).fetchone()
+            if old:
+                self._conn.execute(
+                    "UPDATE entries SET refcount = refcount + 1, last_used = ? WHERE path = ?",
+                    (now, path)
+                )
+            else:
+                self._conn.execute(
+                    """INSERT INTO entries
+                       (path, size, resolution, source, created, last_used, sha256, phash, pixels)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (path, size, resolution, source, now, now, sha256, _to_signed(phash), pixels)
+                )
+                if source != self.PREFIT_SOURCE:
+                    self._append(path)
+                self._total_bytes += size
+            self._bump_stat("downloads")
+            if old:
+                self._bump_stat("duplicates")
+            self._conn.commit()
+        return not old
+
+    def dedup_stats(self):
+        """返回 (下载次数, 重复次数, 去重率)"""
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT key, value FROM stats"))
+        downloads = stats.get("downloads", 0)
+        duplicates = stats.get("duplicates", 0)
+        return downloads, duplicates, (duplicates / downloads if downloads else 0.0)
+
+    def _bump_stat(self, key):
+        self._conn.execute(
+            "INSERT INTO stats (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+            (key,)
+        )
+
+    def touch(self, path):
+        """记录一次使用（更新最近使用时间和命中次数）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET last_used = ?, hit_count = hit_count + 1 WHERE path = ?",
+                (time.time(), path)
+            )
+            self._conn.commit()
+
+    def remove(self, path):
+        """移除索引项（不删除文件）"""
+        with self._lock:
+            self._remove_locked([path])
+            self._conn.commit()
+
+    def set_phash(self, path, phash, pixels=None):
+        """补记已有条目的感知哈希和像素数"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET phash = ?, pixels = COALESCE(?, pixels) WHERE path = ?",
+                (_to_signed(phash), pixels, path)
+            )
+            self._conn.commit()
+
+    def phash(self, path):
+        """条目的感知哈希，未记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT phash FROM entries WHERE path = ?", (path,)).fetchone()
+        return _to_unsigned(row[0]) if row else None
+
+    def sha256(self, path):
+        """条目的内容哈希，未记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM entries WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def phashes(self, exclude_source=PREFIT_SOURCE):
+        """已记录感知哈希的条目 [(路径, 哈希, 像素数)]，默认不含屏幕适配版本"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, phash, pixels FROM entries WHERE phash IS NOT NULL AND source != ?",
+                (exclude_source,)
+            ).fetchall()
+        return [(path, _to_unsigned(phash), pixels) for path, phash, pixels in rows]
+
+    def unhashed(self):
+        """尚未计算感知哈希的条目 [(路径, 来源)]（旧版本缓存）"""
+        with self._lock:
+            return self._conn.execute("SELECT path, source FROM entries WHERE phash IS NULL").fetchall()
+
+    def random_path(self):
+        """O(1) 随机选择一个缓存原图（不含屏幕适配版本），没有时返回 None"""
+        with self._lock:
+            return random.choice(self._paths) if self._paths else None
+
+    def history(self, exclude_source=PREFIT_SOURCE):
+        """按最近使用时间倒序返回 [(路径, 最近使用时间, 分辨率, 来源)]，默认不含屏幕适配版本"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, last_used, resolution, source FROM entries WHERE source != ? ORDER BY last_used DESC",
+                (exclude_source,)
+            ).fetchall()
+
+    def evict(self, max_bytes, keep=()):
+        """按 LRU 淘汰直到总大小不超过 max_bytes，返回被移出索引的路径列表"""
+        removed = []
+        with self._lock:
+            if self._total_bytes <= max_bytes:
+                return removed
+            total = self._total_bytes
+            # 按 last_used 索引顺序读取，只读取需要淘汰的前若干行
+            for path, size in self._conn.execute("SELECT path, size FROM entries ORDER BY last_used"):
+                if total <= max_bytes:
+                    break
+                if path in keep:
+                    continue
+                removed.append(path)
+                total -= size
+            self._remove_locked(removed)
+            self._conn.commit()
+        return removed
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def _append(self, path):
+        self._positions[path] = len(self._paths)
+        self._paths.append(path)
+
+    def _remove_locked(self, paths):
+        """删除数据库行并在内存数组中交换删除（调用方持有锁，负责提交）"""
+        for path in paths:
+            row = self._conn.execute("SELECT size FROM entries WHERE path = ?", (path,)).fetchone()
+            if not row:
+                continue
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (path,))
+            self._total_bytes -= row[0]
+
+            index = self._positions.pop(path, None)
+            if index is None:
+                continue  # 屏幕适配版本不在数组中
+            last = self._paths.pop()
+            if last != path:
+                self._paths[index] = last
+                self._positions[last] = index
+
+    def __len__(self):
+        """原图数量（不含屏幕适配版本）"""
+        return len(self._paths)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def set_aside_database(db_path):
+    """把损坏的数据库文件改名为 .corrupt（保留以便排查），并删除其 WAL/共享内存文件"""
+    os.replace(db_path, db_path + ".corrupt")
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(db_path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _to_signed(value):
+    """64 位无符号哈希转为 SQLite INTEGER 可存储的有符号值"""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    if value is None:
+        return None
+    return value + (1 << 64) if value < 0 else value
+
+
+def prefit_original(path):
+    """屏幕适配版本（<原图哈希>.<宽>x<高>.jpg）对应的原图路径，其他文件（或 path 为空）返回 None"""
+    if not path:
+        return None
+    directory, name = os.path.split(path)
+    key, _, size = name[:-len('.jpg')].partition('.') if name.endswith('.jpg') else ('', '', '')
+    if is_sha256(key) and _is_size(size):
+        return os.path.join(directory, f"{key}.jpg")
+    return None
+
+
+def _is_size(name):
+    """形如 1920x1080 的尺寸"""
+    width, _, height = name.partition('x')
+    return width.isdigit() and height.isdigit()
@@ -0,0 +1,259 @@
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+import numpy as np
+
+from cache_index import set_aside_database
+
+# 主色调分类：8 个色相区间 + 低饱和度/低亮度的灰色
+COLORS = ["red", "orange", "yellow", "green", "cyan", "blue", "purple", "pink", "gray"]
+# 色相区间上界（度）及对应的颜色序号，345° 以上回到红色
+HUE_EDGES = [15, 45, 70, 160, 200, 260, 300, 345, 360]
+HUE_BINS = [0, 1, 2, 3, 4, 5, 6, 7, 0]
+# 饱和度或亮度低于该值（0~255）的像素计为灰色
+GRAY_SATURATION = 51
+GRAY_VALUE = 38
+# 统计直方图前把图片缩到的尺寸
+HISTOGRAM_SIZE = (64, 36)
+
+# HPImageArchive 的 urlbase 加上后缀即为各分辨率模板的图片地址
+PRESET_SUFFIXES = {
+    "uhd": "UHD",
+    "1080p": "1920x1080",
+    "768p": "1366x768",
+    "mobile": "1080x1920"
+}
+
+# 目录中的一条图片元数据：date 为 YYYYMMDD，urls 为 {分辨率模板: 地址}
+ArchiveImage = namedtuple("ArchiveImage", ["date", "title", "copyright", "urls"])
+# 选图结果（last_shown 为 0 表示从未显示过）
+CatalogPick = namedtuple("CatalogPick", ["date", "title", "url", "last_shown"])
+
+
+def color_histogram(image):
+    """颜色直方图：len(COLORS) 个字节，各颜色像素占比按 255 归一化"""
+    small = image.convert("RGB").resize(HISTOGRAM_SIZE)
+    hsv = np.asarray(small.convert("HSV")).reshape(-1, 3)
+    degrees = hsv[:, 0].astype(np.uint16) * 360 // 256
+    bins = np.array(HUE_BINS, dtype=np.uint8)[np.searchsorted(HUE_EDGES, degrees, side="right")]
+    bins[(hsv[:, 1] < GRAY_SATURATION) | (hsv[:, 2] < GRAY_VALUE)] = len(COLORS) - 1
+    counts = np.bincount(bins, minlength=len(COLORS))
+    return (counts * 255 // counts.sum()).astype(np.uint8).tobytes()
+
+
+def dominant_color(histogram):
+    """直方图中占比最高的颜色序号"""
+    return int(np.argmax(np.frombuffer(histogram, dtype=np.uint8)))
+
+
+def parse_archive(data, base_url=""):
+    """解析 HPImageArchive 格式的 JSON（{"images": [{startdate, title, copyright, urlbase}, ...]}）"""
+    parts = urlsplit(base_url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    images = []
+    for item in data.get("images", []):
+        date, urlbase = item.get("startdate"), item.get("urlbase")
+        if not date or not urlbase:
+            continue
+        # urlbase 通常是以 / 开头的站内路径，直接拼接比逐条 urljoin 快得多（完整归档有数千条）
+        prefix = origin + urlbase if urlbase.startswith("/") else urljoin(base_url, urlbase)
+        urls = {preset: f"{prefix}_{suffix}.jpg" for preset, suffix in PRESET_SUFFIXES.items()}
+        images.append(ArchiveImage(date, item.get("title", ""), item.get("copyright", ""), urls))
+    return images
+
+
+class ArchiveFeed:
+    """HTTP 元数据源：Bing 的 HPImageArchive.aspx 接口，或任何返回相同 JSON 格式的归档镜像"""
+
+    def __init__(self, url, session=None, timeout=(5, 15)):
+        self.url = url
+        self.session = session
+        self.timeout = timeout
+
+    def fetch(self):
+        import requests  # 只在同步时需要
+
+        http = self.session or requests
+        response = http.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return parse_archive(response.json(), base_url=response.url)
+
+
+class FileFeed:
+    """本地 JSON 文件元数据源（格式与 HPImageArchive 相同），用于离线导入完整归档或测试夹具"""
+
+    def __init__(self, path, base_url="https://www.bing.com"):
+        self.path = path
+        self.base_url = base_url
+
+    def fetch(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return parse_archive(json.load(f), base_url=self.base_url)
+
+
+def make_feed(spec, session=None, timeout=(5, 15)):
+    """按配置创建元数据源：http(s) 地址为 ArchiveFeed，其余视为本地文件路径"""
+    if spec.startswith(("http://", "https://")):
+        return ArchiveFeed(spec, session, timeout)
+    return FileFeed(spec)
+
+
+class Catalog:
+    """Bing 历史壁纸本地目录（SQLite）
+
+    每天一条：日期、标题、版权信息、各分辨率模板的地址与内容哈希、颜色直方图及主色调、最近显示时间。
+    元数据由 sync() 从元数据源批量导入，下载时 record_download() 补记内容哈希和颜色（颜色只能在
+    下载后得到，目录会一直保留，缓存淘汰后仍可按颜色筛选）。pick() 用日期主键和 last_shown、
+    color 索引在本地选出一张，刷新时只下载选中的这一张。
+    """
+    DB_NAME = "catalog.db"
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        try:
+            self._open(db_path)
+        except sqlite3.DatabaseError as e:
+            if isinstance(e, sqlite3.OperationalError):
+                raise  # 被锁定、无法打开等不是文件损坏
+            self._conn.close()
+            logging.error(f"本地目录损坏，重新创建（下次同步时重新导入元数据）: {str(e)}")
+            set_aside_database(db_path)
+            self._open(db_path)
+
+    def _open(self, db_path):
+        """打开数据库并建表"""
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                date TEXT PRIMARY KEY,
+                title TEXT NOT NULL DEFAULT '',
+                copyright TEXT NOT NULL DEFAULT '',
+                histogram BLOB,
+                color INTEGER,
+                last_shown REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                date TEXT NOT NULL,
+                preset TEXT NOT NULL,
+                url TEXT NOT NULL,
+                sha256 TEXT,
+                PRIMARY KEY (date, preset)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_last_shown ON images(last_shown)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_color ON images(color, last_shown)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_url ON urls(url)")
+        self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def sync(self, feed):
+        """从元数据源导入（已有条目只更新标题和地址，保留哈希、颜色和显示记录），返回新增条数"""
+        images = feed.fetch()
+        with self._lock:
+            before = self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            self._conn.executemany(
+                """INSERT INTO images (date, title, copyright) VALUES (?, ?, ?)
+                   ON CONFLICT(date) DO UPDATE SET title = excluded.title, copyright = excluded.copyright""",
+                [(image.date, image.title, image.copyright) for image in images]
+            )
+            self._conn.executemany(
+                """INSERT INTO urls (date, preset, url) VALUES (?, ?, ?)
+                   ON CONFLICT(date, preset) DO UPDATE SET url = excluded.url""",
+                [(image.date, preset, url) for image in images for preset, url in image.urls.items()]
+            )
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('synced', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (time.time(),)
+            )
+            self._conn.commit()
+            added = self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] - before
+        logging.info(f"本地目录已同步: 元数据 {len(images)} 条，新增 {added} 条")
+        return added
+
+    def last_synced(self):
+        """上次同步的时间戳，从未同步返回 0"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+        return row[0] if row else 0
+
+    def record_download(self, date, preset, url, sha256=None, histogram=None):
+        """登记一次下载：补记该分辨率的地址与内容哈希、颜色直方图，并把该图片记为刚显示过"""
+        with self._lock:
+            self._conn.execute("INSERT INTO images (date) VALUES (?) ON CONFLICT(date) DO NOTHING", (date,))
+            self._conn.execute(
+                """UPDATE images SET last_shown = ?, histogram = COALESCE(?, histogram), color = COALESCE(?, color)
+                   WHERE date = ?""",
+                (time.time(), histogram, dominant_color(histogram) if histogram else None, date)
+            )
+            if url:
+                # 已有地址（元数据源给出的）保留，只补记内容哈希
+                self._conn.execute(
+                    """INSERT INTO urls (date, preset, url, sha256) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(date, preset) DO UPDATE SET sha256 = excluded.sha256""",
+                    (date, preset, url, sha256)
+                )
+            self._conn.commit()
+
+    def mark_shown(self, date):
+        with self._lock:
+            self._conn.execute("UPDATE images SET last_shown = ? WHERE date = ?", (time.time(), date))
+            self._conn.commit()
+
+    def pick(self, preset, no_repeat_days=0, date_from="", date_to="", color=None):
+        """在有 preset 地址的图片中按条件选一张
+
+        优先从 no_repeat_days 天内未显示过的图片中随机选择；都显示过时选最久未显示的一张。
+        date_from/date_to 为 YYYYMMDD（含端点，空为不限），color 为 COLORS 中的名称（None 为不限，
+        尚未下载过、没有颜色信息的图片不参与按颜色筛选）。没有符合条件的图片时返回 None。
+        """
+        conditions, params = ["1"], [preset]
+        if date_from:
+            conditions.append("i.date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("i.date <= ?")
+            params.append(date_to)
+        if color:
+            conditions.append("i.color = ?")
+            params.append(COLORS.index(color))
+        base = f"""SELECT i.date, i.title, u.url, i.last_shown FROM images i
+                   JOIN urls u ON u.date = i.date AND u.preset = ?
+                   WHERE {" AND ".join(conditions)}"""
+        # 从未显示过的 last_shown 为 0，“不重复”条件是 last_shown 索引上的范围查询
+        fresh = f"{base} AND i.last_shown < ?"
+        cutoff = time.time() - no_repeat_days * 86400
+        with self._lock:
+            # 先计数再按偏移取一行：随机选择不需要对候选集排序
+            count = self._conn.execute(f"SELECT COUNT(*) FROM ({fresh})", (*params, cutoff)).fetchone()[0]
+            if count:
+                row = self._conn.execute(
+                    f"{fresh} LIMIT 1 OFFSET ?", (*params, cutoff, random.randrange(count))
+                ).fetchone()
+            else:
+                row = self._conn.execute(f"{base} ORDER BY i.last_shown LIMIT 1", params).fetchone()
+        return CatalogPick(*row) if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
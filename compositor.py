@@ -0,0 +1,161 @@
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import metrics
+from atomic_file import atomic_open
+from preview import file_key, hashed_key
+
+
+def layout_bounds(monitors):
+    """虚拟桌面包围盒 (left, top, width, height)，坐标可为负"""
+    left = min(m.x for m in monitors)
+    top = min(m.y for m in monitors)
+    right = max(m.x + m.width for m in monitors)
+    bottom = max(m.y + m.height for m in monitors)
+    return left, top, right - left, bottom - top
+
+
+def composite_key(monitors, image_paths):
+    """按布局和输入图片内容生成拼接缓存键"""
+    digest = hashlib.sha256()
+    for m, path in zip(monitors, image_paths):
+        digest.update(f"{m.x},{m.y},{m.width},{m.height}:{file_key(path)};".encode())
+    return digest.hexdigest()
+
+
+def fit_cover(img, width, height):
+    """按“填充”方式缩放裁剪到目标尺寸（居中裁剪，不留黑边）"""
+    src_ratio = img.width / img.height
+    dst_ratio = width / height
+    if src_ratio > dst_ratio:
+        crop_w = img.height * dst_ratio
+        box = ((img.width - crop_w) / 2, 0, (img.width + crop_w) / 2, img.height)
+    else:
+        crop_h = img.width / dst_ratio
+        box = (0, (img.height - crop_h) / 2, img.width, (img.height + crop_h) / 2)
+    if img.size == (width, height):
+        return img
+    return img.resize((width, height), Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+
+
+def compose_spanned(monitors, image_paths, out_path, quality=90):
+    """在单张画布上拼接各显示器壁纸并编码为 JPEG（在工作进程中运行）
+
+    画布为 RGBX 四通道的 NumPy 数组（未覆盖区域为黑色），Pillow 通过 frombuffer 零拷贝编码；
+    输入图片逐张解码、缩放、写入画布后即释放，峰值内存约为一张画布加一张输入图。
+    """
+    left, top, width, height = layout_bounds(monitors)
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    for m, path in zip(monitors, image_paths):
+        with Image.open(path) as img:
+            img.draft("RGB", (m.width, m.height))
+            # 转为 RGBX 后每行与画布行布局一致，整行连续拷贝
+            fitted = fit_cover(img.convert("RGBX"), m.width, m.height)
+            x, y = m.x - left, m.y - top
+            canvas[y:y + m.height, x:x + m.width] = np.asarray(fitted)
+            del fitted
+
+    image = Image.frombuffer("RGBX", (width, height), canvas, "raw", "RGBX", 0, 1)
+    with atomic_open(out_path) as f:
+        image.save(f, "JPEG", quality=quality)
+    return out_path
+
+
+def variant_path(cache_dir, path, width, height):
+    """适配到指定尺寸的版本路径：与原图同在缓存目录，按内容（或路径+修改时间）和尺寸命名"""
+    return os.path.join(cache_dir, f"{hashed_key(path)}.{width}x{height}.jpg")
+
+
+def prefit_image(src_path, out_path, width, height, quality=90):
+    """把图片按“填充”方式裁剪缩放到显示器尺寸并重新编码（在工作进程中运行）
+
+    图片已与屏幕尺寸一致，或有一边小于屏幕（需要放大）时不处理，返回原路径，交给系统缩放。
+    """
+    with Image.open(src_path) as img:
+        if img.size == (width, height) or img.width < width or img.height < height:
+            return src_path
+        img.draft("RGB", (width, height))
+        fitted = fit_cover(img.convert("RGB"), width, height)
+
+    with atomic_open(out_path) as f:
+        fitted.save(f, "JPEG", quality=quality, optimize=True)
+    return out_path
+
+
+class Compositor:
+    """图片后处理（工作进程）：多显示器拼接和单屏尺寸适配
+
+    拼接结果按布局+输入内容缓存，重复应用无需重新拼接；适配版本按原图内容+屏幕尺寸缓存在原图旁边，
+    设置壁纸时直接使用，系统无需每次缩放大图。
+    """
+
+    def __init__(self, cache_dir, max_entries=10):
+        self.variant_dir = cache_dir
+        self.cache_dir = os.path.join(cache_dir, "composites")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self._executor = None
+        self._lock = threading.Lock()
+        # (原图路径, 宽, 高) -> 无需适配的原图路径，避免重复提交到工作进程检查
+        self._unchanged = set()
+
+    def _submit(self, func, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=1)
+            return self._executor.submit(func, *args)
+
+    def fit(self, path, width, height, quality=90):
+        """返回适配到 width x height 的版本路径和是否为新生成；无需适配时返回 (原路径, False)"""
+        out_path = variant_path(self.variant_dir, path, width, height)
+        if os.path.exists(out_path):
+            os.utime(out_path)
+            return out_path, False
+        if (path, width, height) in self._unchanged:
+            return path, False
+
+        with metrics.timer("prefit"):
+            result = self._submit(prefit_image, path, out_path, width, height, quality).result()
+        if result == path:
+            self._unchanged.add((path, width, height))
+            return path, False
+        logging.info(f"已生成 {width}x{height} 适配版本: {result}")
+        return result, True
+
+    def compose(self, monitors, image_paths):
+        """返回拼接后的壁纸路径"""
+        key = composite_key(monitors, image_paths)
+        out_path = os.path.join(self.cache_dir, f"{key}.jpg")
+        if os.path.exists(out_path):
+            os.utime(out_path)
+            logging.info(f"复用拼接壁纸: {out_path}")
+            return out_path
+
+        future = self._submit(compose_spanned, list(monitors), list(image_paths), out_path)
+        with metrics.timer("compose"):
+            future.result()
+        logging.info(f"已生成拼接壁纸: {out_path}")
+        self._prune()
+        return out_path
+
+    def _prune(self):
+        """只保留最近使用的 max_entries 张拼接壁纸"""
+        entries = sorted(
+            (e for e in os.scandir(self.cache_dir) if e.name.endswith('.jpg')),
+            key=lambda e: e.stat().st_mtime,
+            reverse=True
+        )
+        for entry in entries[self.max_entries:]:
+            os.remove(entry.path)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
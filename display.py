@@ -0,0 +1,300 @@
+import os
+import re
+import sys
+import time
+import shutil
+import ctypes
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+
+# 显示器布局：左上角坐标（可为负）、物理像素尺寸、是否主显示器
+Monitor = namedtuple("Monitor", ["x", "y", "width", "height", "primary"])
+
+# 各下载模板对应的分辨率
+RESOLUTION_PRESETS = {
+    "uhd": (3840, 2160),
+    "1080p": (1920, 1080),
+    "768p": (1366, 768),
+    "mobile": (1080, 1920)
+}
+
+# 精确匹配表（纯查表，不依赖检测后端）
+_EXACT_PRESETS = {size: name for name, size in RESOLUTION_PRESETS.items()}
+# 按面积升序，用于“更大尺寸的最近匹配”
+_PRESETS_BY_AREA = sorted(RESOLUTION_PRESETS.items(), key=lambda item: item[1][0] * item[1][1])
+
+
+def match_resolution_preset(width, height):
+    """把物理分辨率匹配到下载模板
+
+    1. 完全匹配；2. 宽高都不小于屏幕的最小面积模板；3. 都不满足时用最高分辨率 uhd。
+    """
+    exact = _EXACT_PRESETS.get((width, height))
+    if exact:
+        return exact
+    for name, (w, h) in _PRESETS_BY_AREA:
+        if w >= width and h >= height:
+            return name
+    return "uhd"
+
+
+class DisplayBackend:
+    """显示器检测后端接口"""
+
+    def monitors(self):
+        """枚举所有显示器，返回 Monitor 列表"""
+        raise NotImplementedError
+
+    def config_token(self):
+        """廉价的显示配置指纹，配置变化时返回值随之变化；无法廉价获取时返回 None"""
+        return None
+
+
+class Win32Backend(DisplayBackend):
+    """Windows：EnumDisplayMonitors 枚举，GetSystemMetrics 作为配置指纹"""
+    MONITORINFOF_PRIMARY = 0x1
+    SM_CXSCREEN = 0
+    SM_CYSCREEN = 1
+    SM_XVIRTUALSCREEN = 76
+    SM_YVIRTUALSCREEN = 77
+    SM_CXVIRTUALSCREEN = 78
+    SM_CYVIRTUALSCREEN = 79
+    SM_CMONITORS = 80
+
+    def __init__(self):
+        from ctypes import wintypes
+
+        # Windows 结构体只定义一次
+        class RECT(ctypes.Structure):
+            _fields_ = [
+                ("left", ctypes.c_long),
+                ("top", ctypes.c_long),
+                ("right", ctypes.c_long),
+                ("bottom", ctypes.c_long)
+            ]
+
+        class MONITORINFOEXW(ctypes.Structure):
+            _fields_ = [
+                ("cbSize", wintypes.DWORD),
+                ("rcMonitor", RECT),
+                ("rcWork", RECT),
+                ("dwFlags", wintypes.DWORD),
+                ("szDevice", wintypes.WCHAR * 32)
+            ]
+
+        self._MONITORINFOEXW = MONITORINFOEXW
+        self._callback_type = ctypes.WINFUNCTYPE(
+            ctypes.c_int,
+            wintypes.HMONITOR,
+            wintypes.HDC,
+            ctypes.POINTER(RECT),
+            wintypes.LPARAM
+        )
+        self._user32 = ctypes.windll.user32
+
+    def monitors(self):
+        found = []
+
+        def monitor_enum_proc(hmonitor, hdc, lprect, lparam):
+            info = self._MONITORINFOEXW()
+            info.cbSize = ctypes.sizeof(self._MONITORINFOEXW)
+            if self._user32.GetMonitorInfoW(hmonitor, ctypes.byref(info)):
+                rect = info.rcMonitor
+                found.append(Monitor(
+                    rect.left, rect.top,
+                    rect.right - rect.left, rect.bottom - rect.top,
+                    bool(info.dwFlags & self.MONITORINFOF_PRIMARY)
+                ))
+            return 1
+
+        self._user32.EnumDisplayMonitors(None, None, self._callback_type(monitor_enum_proc), 0)
+        if not found:
+            # 回退到系统指标（应返回主显示器分辨率）
+            logging.warning("使用系统指标回退方案")
+            found.append(Monitor(
+                0, 0,
+                self._user32.GetSystemMetrics(self.SM_CXSCREEN),
+                self._user32.GetSystemMetrics(self.SM_CYSCREEN),
+                True
+            ))
+        return found
+
+    def config_token(self):
+        metrics = (
+            self.SM_CMONITORS, self.SM_CXSCREEN, self.SM_CYSCREEN,
+            self.SM_XVIRTUALSCREEN, self.SM_YVIRTUALSCREEN,
+            self.SM_CXVIRTUALSCREEN, self.SM_CYVIRTUALSCREEN
+        )
+        return tuple(self._user32.GetSystemMetrics(m) for m in metrics)
+
+
+class _ScreenResourcesHead(ctypes.Structure):
+    """XRRScreenResources 开头的两个时间戳字段（只读取这两项）"""
+    _fields_ = [("timestamp", ctypes.c_ulong), ("config_timestamp", ctypes.c_ulong)]
+
+
+class XrandrBackend(DisplayBackend):
+    """Linux/X11：解析 xrandr --current 输出
+
+    配置指纹取自 RandR 的两个时间戳（XRRGetScreenResourcesCurrent，一次 X 请求往返，不探测硬件）：
+    设置分辨率/排列时 timestamp 变化，接入或拔出显示器时 config_timestamp 变化。
+    加载不到 libX11/libXrandr 或无法连接 X 服务器时没有指纹，DisplayDetector 退回按 ttl 定期重新枚举。
+    """
+    _LINE = re.compile(r"^\S+ connected( primary)? (\d+)x(\d+)([+-]\d+)([+-]\d+)")
+
+    def __init__(self):
+        self._xrandr = None
+        self._display = None
+        self._root = None
+        try:
+            self._open_display()
+        except (OSError, AttributeError) as e:
+            logging.info(f"无法读取 RandR 配置时间戳，显示配置改为定期检查: {str(e)}")
+
+    def _open_display(self):
+        import ctypes.util
+
+        x11 = ctypes.CDLL(ctypes.util.find_library("X11") or "libX11.so.6")
+        xrandr = ctypes.CDLL(ctypes.util.find_library("Xrandr") or "libXrandr.so.2")
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xrandr.XRRGetScreenResourcesCurrent.restype = ctypes.POINTER(_ScreenResourcesHead)
+        xrandr.XRRGetScreenResourcesCurrent.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        xrandr.XRRFreeScreenResources.restype = None
+        xrandr.XRRFreeScreenResources.argtypes = [ctypes.POINTER(_ScreenResourcesHead)]
+        display = x11.XOpenDisplay(None)
+        if not display:
+            raise OSError(f"无法连接 X 服务器: {os.environ.get('DISPLAY')}")
+        self._xrandr, self._display, self._root = xrandr, display, x11.XDefaultRootWindow(display)
+
+    def config_token(self):
+        if self._display is None:
+            return None
+        resources = self._xrandr.XRRGetScreenResourcesCurrent(self._display, self._root)
+        if not resources:
+            return None
+        try:
+            return resources.contents.timestamp, resources.contents.config_timestamp
+        finally:
+            self._xrandr.XRRFreeScreenResources(resources)
+
+    def monitors(self):
+        output = subprocess.run(
+            ["xrandr", "--current"],
+            capture_output=True, text=True, timeout=5, check=True
+        ).stdout
+        return self.parse(output)
+
+    @classmethod
+    def parse(cls, output):
+        found = []
+        for line in output.splitlines():
+            match = cls._LINE.match(line)
+            if match:
+                primary, width, height, x, y = match.groups()
+                found.append(Monitor(int(x), int(y), int(width), int(height), bool(primary)))
+        # 未标记主显示器时以第一块为主
+        if found and not any(m.primary for m in found):
+            found[0] = found[0]._replace(primary=True)
+        return found
+
+
+class FakeBackend(DisplayBackend):
+    """固定布局的假后端（无显示环境和测试用）"""
+
+    def __init__(self, monitors=None):
+        self.set_monitors(monitors or [Monitor(0, 0, 1920, 1080, True)])
+        self.enumerations = 0
+
+    def set_monitors(self, monitors):
+        self._monitors = list(monitors)
+        self._token = object()
+
+    def monitors(self):
+        self.enumerations += 1
+        return list(self._monitors)
+
+    def config_token(self):
+        return self._token
+
+
+def default_backend():
+    """按平台选择检测后端"""
+    if sys.platform == "win32":
+        return Win32Backend()
+    if os.environ.get("DISPLAY") and shutil.which("xrandr"):
+        return XrandrBackend()
+    logging.info("无可用显示环境，使用默认 1920x1080 布局")
+    return FakeBackend()
+
+
+def set_wallpaper_style(span):
+    """设置 Windows 壁纸排列方式：拼接壁纸用“跨区”，普通壁纸从“跨区”恢复为“填充”"""
+    if sys.platform != "win32":
+        return
+    import winreg
+    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Control Panel\Desktop", 0,
+                        winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE) as key:
+        try:
+            current, _ = winreg.QueryValueEx(key, "WallpaperStyle")
+        except FileNotFoundError:
+            current = None
+        if span:
+            winreg.SetValueEx(key, "WallpaperStyle", 0, winreg.REG_SZ, "22")
+            winreg.SetValueEx(key, "TileWallpaper", 0, winreg.REG_SZ, "0")
+        elif current == "22":
+            winreg.SetValueEx(key, "WallpaperStyle", 0, winreg.REG_SZ, "10")
+
+
+class DisplayDetector:
+    """带缓存的显示器检测
+
+    枚举结果缓存到显示配置发生变化为止：后端提供廉价配置指纹时每次比较指纹，
+    否则（如 X11 下没有 libXrandr）最多每 ttl 秒重新枚举一次，显示变化最迟在 ttl 秒后生效。
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend or default_backend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._monitors = None
+        self._token = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._monitors = None
+
+    def get_monitors(self):
+        """返回全部显示器布局（缓存）"""
+        with self._lock:
+            token = self.backend.config_token()
+            now = time.monotonic()
+            stale = (
+                self._monitors is None
+                or (token is not None and token != self._token)
+                or (token is None and now - self._checked_at >= self.ttl)
+            )
+            if stale:
+                monitors = self.backend.monitors()
+                if monitors != self._monitors:
+                    layout = ", ".join(f"{m.width}x{m.height}{'(主)' if m.primary else ''}" for m in monitors)
+                    logging.info(f"显示器布局：{layout}")
+                self._monitors = monitors
+                self._token = token
+                self._checked_at = now
+            return self._monitors
+
+    def get_primary_resolution(self):
+        """主显示器物理分辨率，检测失败时回退到 1080p"""
+        try:
+            for monitor in self.get_monitors():
+                if monitor.primary:
+                    return monitor.width, monitor.height
+        except Exception as e:
+            logging.error(f"分辨率检测失败: {str(e)}")
+        return 1920, 1080
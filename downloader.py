@@ -0,0 +1,451 @@
+import os
+import json
+import time
+import logging
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# 流式写入时每次读取的块大小（64KB）
+CHUNK_SIZE = 64 * 1024
+
+# 缓存文件按内容 SHA-256 命名
+CONTENT_SUFFIX = ".jpg"
+
+# 未完成的下载保存在缓存目录的子目录中（不进入缓存索引），下次按请求URL续传
+PARTIAL_DIR = "partial"
+# 超过该时长未续传的未完成下载在清理缓存时删除
+PARTIAL_MAX_AGE = 7 * 24 * 3600
+
+# 下载结果：path 为最终可用文件，received 为本次传输的响应体字节数（续传时不含此前已接收的部分，只用于流量统计），
+# not_modified 表示复用了缓存，sha256 为内容哈希，duplicate 表示内容与已缓存文件完全相同（未新增文件）；
+# 使用边下载边解码时 image_size 为图片原始尺寸，preview 为降采样解码的图片；url 为跳转后的最终地址；
+# size 为最终文件的字节数（续传时含此前已接收的部分，复用缓存时为 None）
+DownloadResult = namedtuple(
+    "DownloadResult",
+    ["path", "received", "not_modified", "sha256", "duplicate", "image_size", "preview", "url", "size"],
+    defaults=(None, None, None, None)
+)
+
+
+class IncompleteDownloadError(Exception):
+    """实际接收字节数与 Content-Length 不一致（连接中途断开）"""
+
+
+class InvalidImageError(Exception):
+    """响应内容不是图片（如强制门户返回的 HTML 页面）或图片数据不完整"""
+
+
+class DownloadCancelled(Exception):
+    """下载被取消（对冲请求中其他镜像已先完成）"""
+
+
+def create_session(pool_maxsize=4):
+    """创建长连接复用的HTTP会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.verify = False
+    return session
+
+
+class ValidatorStore:
+    """按请求URL持久化缓存校验信息（ETag/Last-Modified/最终跳转地址/本地文件）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, url):
+        """返回仍有本地文件对应的校验信息，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry and os.path.exists(entry.get("path", "")):
+            return entry
+        return None
+
+    def update(self, url, response, path, sha256=None):
+        """根据响应头记录校验信息并落盘"""
+        entry = {
+            "sha256": sha256,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_length": response.headers.get("Content-Length"),
+            "final_url": response.url,
+            "path": path
+        }
+        with self._lock:
+            self._entries[url] = entry
+            self._save()
+
+    def redirect(self, old_path, new_path, sha256=None):
+        """把指向 old_path 的校验信息改为指向 new_path（缓存文件被同一图片的其他版本取代时）
+
+        之后对这些URL的条件请求命中时直接复用 new_path，不再重新下载被取代的版本。
+        """
+        with self._lock:
+            changed = False
+            for entry in self._entries.values():
+                if entry.get("path") == old_path:
+                    entry["path"], entry["sha256"] = new_path, sha256
+                    changed = True
+            if changed:
+                self._save()
+
+    def _save(self):
+        """原子写入（临时文件 + 重命名）"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class PartialDownload:
+    """按请求URL保存的未完成下载：.part 为已接收的数据，.json 记录其校验信息（ETag 或 Last-Modified）
+
+    下次请求同一URL时发送 Range/If-Range 从已有字节处续传；服务端忽略范围或内容已变化时返回完整
+    响应（200），此时从头写入。同一文件同时只允许一个下载使用，拿不到时调用方改用一次性临时文件。
+    """
+
+    _active = set()
+    _active_lock = threading.Lock()
+
+    def __init__(self, cache_dir, url):
+        directory = os.path.join(cache_dir, PARTIAL_DIR)
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        self.path = os.path.join(directory, name + ".part")
+        self.meta_path = os.path.join(directory, name + ".json")
+        self.offset = 0
+
+    @classmethod
+    def acquire(cls, cache_dir, url):
+        """占用 url 对应的未完成下载，已被其他线程占用时返回 None"""
+        partial = cls(cache_dir, url)
+        with cls._active_lock:
+            if partial.path in cls._active:
+                return None
+            cls._active.add(partial.path)
+        os.makedirs(os.path.dirname(partial.path), exist_ok=True)
+        return partial
+
+    def release(self):
+        with self._active_lock:
+            self._active.discard(self.path)
+
+    def range_headers(self):
+        """有可续传的数据时返回 Range/If-Range 请求头"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                validator = json.load(f)["validator"]
+            self.offset = os.path.getsize(self.path)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.offset = 0
+            return {}
+        if not self.offset:
+            return {}
+        # 续传的字节偏移针对原始内容，不能使用压缩传输
+        return {"Range": f"bytes={self.offset}-", "If-Range": validator, "Accept-Encoding": "identity"}
+
+    def open(self, response, consume):
+        """按响应决定续传还是从头写入，返回 (文件对象, 续传起点)；续传时已有数据逐块交给 consume（哈希、解码）"""
+        # 写入期间校验信息失效，失败时由 keep() 重新记录
+        _remove_quietly(self.meta_path)
+        start = _content_range_start(response)
+        if start is None or not self.offset:
+            if self.offset:
+                logging.info("服务端未按范围返回（不支持续传或内容已变化），从头下载")
+            self.offset = 0
+            return open(self.path, 'wb'), 0
+        if start != self.offset:
+            self.discard()
+            raise IncompleteDownloadError(f"续传起点不一致: 请求 {self.offset}，返回 {start}")
+
+        f = open(self.path, 'r+b')
+        try:
+            while chunk := f.read(CHUNK_SIZE):
+                consume(chunk)
+        except BaseException:
+            f.close()
+            raise
+        logging.info(f"从 {self.offset} 字节处续传")
+        return f, self.offset
+
+    def keep(self, response):
+        """下载中断时保存校验信息以便续传，响应不支持续传时删除数据，返回是否保留"""
+        validator = _range_validator(response)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if not validator or not size:
+            self.discard()
+            return False
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"validator": validator, "final_url": response.url, "size": size}, f)
+        logging.info(f"已保留未完成的下载: {size} 字节")
+        return True
+
+    def discard(self):
+        _remove_quietly(self.path)
+        _remove_quietly(self.meta_path)
+
+
+def prune_partials(cache_dir, max_age=PARTIAL_MAX_AGE):
+    """删除长时间未续传的未完成下载，返回删除的文件数"""
+    directory = os.path.join(cache_dir, PARTIAL_DIR)
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    with PartialDownload._active_lock:
+        active = {os.path.splitext(path)[0] for path in PartialDownload._active}
+    for entry in entries:
+        if os.path.splitext(entry.path)[0] in active:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def content_path(cache_dir, sha256):
+    """内容寻址的缓存文件路径"""
+    return os.path.join(cache_dir, sha256 + CONTENT_SUFFIX)
+
+
+def stream_download(url, cache_dir, session=None, timeout=15, chunk_size=CHUNK_SIZE, validators=None,
+                    cancel=None, on_headers=None, decoder=None):
+    """条件请求 + 边下载边哈希写入临时文件，校验长度后按内容哈希原子重命名到缓存目录
+
+    若服务端返回 304 或最终地址与校验信息未变，则直接复用已缓存文件，不传输响应体。
+    若内容与已缓存文件逐字节相同，则丢弃临时文件并返回已有路径。
+    cancel 为 threading.Event，置位后在下一个数据块处抛出 DownloadCancelled；
+    on_headers 在收到响应头（首字节）时被调用。
+    decoder 为增量解码器（feed/close，见 stream_decoder.StreamDecoder）：数据块到达时同时交给它解码，
+    非图片的响应（Content-Type 为文本或文件头不符）尽早以 InvalidImageError 失败，不写入缓存。
+    中途失败时，带 ETag/Last-Modified 的响应保留已接收的数据（见 PartialDownload），
+    下次请求同一URL时续传；其余情况删除临时文件。缓存目录不会出现半截文件。
+    """
+    http = session or requests
+    cached = validators.get(url) if validators else None
+    partial = PartialDownload.acquire(cache_dir, url)
+    try:
+        response = _get(http, url, timeout, cached, partial)
+        with response:
+            if on_headers:
+                on_headers()
+            _check_cancel(cancel)
+            if cached and (response.status_code == 304 or _is_unchanged(response, cached)):
+                logging.info(f"壁纸未变化，复用缓存: {cached['path']}")
+                metrics.inc("download.not_modified")
+                return DownloadResult(
+                    cached["path"], 0, True, cached.get("sha256"), True, url=cached.get("final_url")
+                )
+
+            response.raise_for_status()
+            if decoder is not None:
+                _check_content_type(response)
+            written, size, sha256, duplicate, decoded = _write_atomically(
+                response, cache_dir, chunk_size, cancel, partial, decoder
+            )
+    finally:
+        if partial is not None:
+            partial.release()
+
+    path = content_path(cache_dir, sha256)
+    if validators:
+        validators.update(url, response, path, sha256)
+    metrics.inc("download.bytes", written)
+    if duplicate:
+        metrics.inc("download.duplicates")
+    logging.info(f"下载完成: {path} ({written} 字节{'，内容重复' if duplicate else ''})")
+    if decoded is None:
+        return DownloadResult(path, written, False, sha256, duplicate, url=response.url, size=size)
+    _, width, height, preview = decoded
+    return DownloadResult(path, written, False, sha256, duplicate, (width, height), preview, response.url, size)
+
+
+def _get(http, url, timeout, cached, partial):
+    """发起条件请求（有未完成的下载时附带续传请求头）；续传范围无效（416）时丢弃已有数据重新请求"""
+    headers = _conditional_headers(cached)
+    if partial is not None:
+        headers.update(partial.range_headers())
+    with metrics.timer("download.connect_ttfb"):
+        response = http.get(url, stream=True, timeout=timeout, verify=False, headers=headers)
+    if response.status_code == 416 and "Range" in headers:
+        response.close()
+        logging.info("续传范围无效，重新下载")
+        partial.discard()
+        return _get(http, url, timeout, cached, partial)
+    return response
+
+
+def _conditional_headers(cached):
+    """构造条件请求头"""
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _is_unchanged(response, cached):
+    """服务端忽略条件请求时，按最终跳转地址和校验字段判断内容是否未变"""
+    if response.status_code != 200 or response.url != cached.get("final_url"):
+        return False
+    # 不用 Content-Length 判断：随机接口同一地址可能返回大小相同的不同图片
+    for header, key in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+        value = response.headers.get(header)
+        if value and value == cached.get(key):
+            return True
+    return False
+
+
+def _check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled("下载已取消")
+
+
+def _write_atomically(response, cache_dir, chunk_size, cancel=None, partial=None, decoder=None):
+    """将响应体分块写入临时文件并同时计算哈希（及增量解码），完整后 os.replace 到内容路径
+
+    partial 不为 None 时写入（或续写）其 .part 文件，中途失败时按 PartialDownload.keep 保留；
+    内容不是有效图片时总是删除。
+    返回 (本次接收字节数, 文件总字节数, SHA-256, 是否与已有文件重复, decoder.close() 的结果)。
+    """
+    digest = hashlib.sha256()
+
+    def consume(chunk):
+        digest.update(chunk)
+        if decoder is not None:
+            decoder.feed(chunk)
+
+    # 临时文件与目标在同一文件系统，保证 os.replace 是原子操作
+    if partial is None:
+        fd, tmp_path = tempfile.mkstemp(prefix=".download_", suffix=".part", dir=cache_dir)
+        f, offset = os.fdopen(fd, 'wb'), 0
+    else:
+        tmp_path = partial.path
+        try:
+            f, offset = partial.open(response, consume)
+        except InvalidImageError:
+            metrics.inc("download.invalid")
+            partial.discard()
+            raise
+    try:
+        with metrics.timer("download.body"), f:
+            written = 0
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                _check_cancel(cancel)
+                if chunk:
+                    f.write(chunk)
+                    consume(chunk)
+                    written += len(chunk)
+        _check_content_length(response, written)
+        _check_content_range(response, offset + written)
+        decoded = decoder.close() if decoder is not None else None
+        if offset:
+            metrics.inc("download.resumed")
+            metrics.inc("download.resumed_bytes", offset)
+
+        with metrics.timer("cache.write"):
+            sha256 = digest.hexdigest()
+            path = content_path(cache_dir, sha256)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                _remove_quietly(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        if partial is not None:
+            partial.discard()
+        return written, offset + written, sha256, duplicate, decoded
+    except BaseException as e:
+        invalid = isinstance(e, InvalidImageError)
+        if invalid:
+            metrics.inc("download.invalid")
+        if partial is None:
+            _remove_quietly(tmp_path)
+        elif invalid:
+            partial.discard()
+        else:
+            partial.keep(response)  # 不可续传时 keep 会删除数据
+        raise
+
+
+def _check_content_type(response):
+    """Content-Type 明确为文本（HTML 登录页、错误页等）时不读取响应体"""
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type.startswith("text/") or content_type in ("application/json", "application/xhtml+xml"):
+        metrics.inc("download.invalid")
+        raise InvalidImageError(f"响应内容不是图片: Content-Type {content_type}")
+
+
+def _content_range_start(response):
+    """206 响应的 Content-Range 起点，非范围响应返回 None"""
+    if response.status_code != 206:
+        return None
+    try:
+        return int(response.headers["Content-Range"].split()[1].split("-")[0])
+    except (KeyError, IndexError, ValueError):
+        raise IncompleteDownloadError("206 响应缺少有效的 Content-Range")
+
+
+def _check_content_range(response, total):
+    """续传完成后校验总长度与 Content-Range 声明的完整大小一致"""
+    if response.status_code != 206:
+        return
+    expected = response.headers.get("Content-Range", "").rpartition("/")[2]
+    if expected.isdigit() and int(expected) != total:
+        raise IncompleteDownloadError(f"续传内容不完整: 期望 {expected} 字节，实际 {total} 字节")
+
+
+def _range_validator(response):
+    """可用于 If-Range 的校验值：强 ETag 优先，其次 Last-Modified；压缩传输的响应不支持续传"""
+    if response.status_code not in (200, 206):
+        return None
+    if response.headers.get("Content-Encoding", "identity").lower() != "identity":
+        return None
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _check_content_length(response, written):
+    """校验接收长度（压缩传输时比较原始字节数）"""
+    expected = response.headers.get("Content-Length")
+    if expected is None:
+        return
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    received = written if encoding == "identity" else response.raw.tell()
+    if received != int(expected):
+        raise IncompleteDownloadError(f"内容不完整: 期望 {expected} 字节，实际 {received} 字节")
+
+
+def _remove_quietly(path):
+    """删除文件，忽略不存在等错误"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,185 @@
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+
+from thumbnails import THUMB_SIZE
+
+PAD = 8
+CAPTION_HEIGHT = 18
+# 每个格子占用的尺寸（缩略图 + 说明文字 + 间距）
+TILE_WIDTH = THUMB_SIZE[0] + PAD
+TILE_HEIGHT = THUMB_SIZE[1] + CAPTION_HEIGHT + PAD
+# 可见区域上下各多创建的行数，滚动时提前加载
+OVERSCAN_ROWS = 1
+
+
+class HistoryGallery(tk.Toplevel):
+    """历史壁纸画廊（虚拟化网格）
+
+    滚动区域按全部条目计算，但只为可见行（及上下 OVERSCAN_ROWS 行）创建画布元素和 PhotoImage，
+    滚出视野的格子立即删除，内存占用只与窗口大小有关，与历史条目数无关。
+    缩略图由 ThumbnailStore 在后台读取或生成；双击格子把该壁纸设为当前壁纸。
+    """
+
+    def __init__(self, master, entries, store, on_select):
+        super().__init__(master)
+        self.title(f"历史壁纸（{len(entries)} 张）")
+        self.geometry("860x600")
+        self.entries = entries  # [(路径, 最近使用时间, 分辨率, 来源)]
+        self.store = store
+        self.on_select = on_select
+        self.columns = 0
+        self.selected = None
+        self._tiles = {}  # 条目序号 -> {"path", "items", "photo"}
+        self._render_pending = False
+        self._closed = False
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL)
+        self.canvas = tk.Canvas(
+            self,
+            background="#202020",
+            highlightthickness=0,
+            yscrollincrement=TILE_HEIGHT // 3,
+            yscrollcommand=self._on_yview
+        )
+        self.scrollbar.config(command=self.canvas.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+
+        self.canvas.bind("<Configure>", self._on_resize)
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda _: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda _: self.canvas.yview_scroll(1, "units"))
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    def close(self):
+        self._closed = True
+        for tile in self._tiles.values():
+            self.store.cancel(tile["path"])
+        self._tiles.clear()
+        self.destroy()
+
+    def _on_resize(self, event):
+        """列数变化时重新排版（清空已创建的格子）"""
+        columns = max(1, event.width // TILE_WIDTH)
+        if columns != self.columns:
+            self.columns = columns
+            for index in list(self._tiles):
+                self._drop_tile(index)
+            rows = -(-len(self.entries) // columns)
+            self.canvas.config(scrollregion=(0, 0, columns * TILE_WIDTH + PAD, rows * TILE_HEIGHT + PAD))
+        self.schedule_render()
+
+    def _on_yview(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_render()
+
+    def _on_wheel(self, event):
+        # Windows 每格 delta 为 120，macOS 为 ±1
+        step = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.canvas.yview_scroll(step, "units")
+
+    def schedule_render(self):
+        """合并同一轮事件中的多次滚动，空闲时只渲染一次"""
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        """创建进入可见范围的格子，删除离开可见范围的格子"""
+        self._render_pending = False
+        if self._closed or not self.columns:
+            return
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // TILE_HEIGHT) - OVERSCAN_ROWS)
+        last_row = int((top + self.canvas.winfo_height()) // TILE_HEIGHT) + OVERSCAN_ROWS
+        visible = range(first_row * self.columns, min(len(self.entries), (last_row + 1) * self.columns))
+
+        for index in [index for index in self._tiles if index not in visible]:
+            self._drop_tile(index)
+        for index in visible:
+            if index not in self._tiles:
+                self._create_tile(index)
+
+    def _position(self, index):
+        row, column = divmod(index, self.columns)
+        return PAD + column * TILE_WIDTH, PAD + row * TILE_HEIGHT
+
+    def _create_tile(self, index):
+        path, last_used, resolution, _ = self.entries[index]
+        x, y = self._position(index)
+        caption = datetime.fromtimestamp(last_used).strftime("%Y-%m-%d %H:%M")
+        if resolution:
+            caption += f"  {resolution}"
+        items = [
+            self.canvas.create_rectangle(
+                x, y, x + THUMB_SIZE[0], y + THUMB_SIZE[1],
+                fill="#303030", width=2, outline=self._outline(index)
+            ),
+            self.canvas.create_text(
+                x, y + THUMB_SIZE[1] + 3, anchor=tk.NW, fill="#d0d0d0", text=caption, font=("TkDefaultFont", 9)
+            )
+        ]
+        self._tiles[index] = {"path": path, "items": items, "photo": None}
+
+        image = self.store.cached(path)
+        if image is not None:
+            self._set_image(index, path, image)
+        else:
+            self.store.request(path, lambda path, image: self._deliver(index, path, image))
+
+    def _drop_tile(self, index):
+        tile = self._tiles.pop(index)
+        self.canvas.delete(*tile["items"])
+        if tile["photo"] is None:
+            self.store.cancel(tile["path"])
+
+    def _deliver(self, index, path, image):
+        """缩略图工作线程的回调，转交 Tk 主线程"""
+        if self._closed:
+            return
+        try:
+            self.after(0, self._set_image, index, path, image)
+        except (RuntimeError, tk.TclError):
+            pass  # 窗口已关闭
+
+    def _set_image(self, index, path, image):
+        """在格子中显示缩略图（格子已滚出视野或已被复用时忽略）"""
+        from PIL import ImageTk
+
+        tile = self._tiles.get(index)
+        if tile is None or tile["path"] != path or tile["photo"] is not None:
+            return
+        x, y = self._position(index)
+        tile["photo"] = ImageTk.PhotoImage(image)
+        tile["items"].append(self.canvas.create_image(
+            x + THUMB_SIZE[0] // 2, y + THUMB_SIZE[1] // 2, image=tile["photo"]
+        ))
+
+    def _outline(self, index):
+        return "#3d8ee0" if index == self.selected else "#303030"
+
+    def _index_at(self, event):
+        """鼠标位置对应的条目序号，不在任何格子上时返回 None"""
+        x, y = self.canvas.canvasx(event.x) - PAD, self.canvas.canvasy(event.y) - PAD
+        if x < 0 or y < 0:
+            return None
+        column, row = int(x // TILE_WIDTH), int(y // TILE_HEIGHT)
+        index = row * self.columns + column
+        if column >= self.columns or index >= len(self.entries):
+            return None
+        return index
+
+    def _on_click(self, event):
+        index = self._index_at(event)
+        previous, self.selected = self.selected, index
+        for i in (previous, index):
+            if i in self._tiles:
+                self.canvas.itemconfig(self._tiles[i]["items"][0], outline=self._outline(i))
+
+    def _on_double_click(self, event):
+        index = self._index_at(event)
+        if index is not None:
+            self.on_select(self.entries[index][0])
@@ -0,0 +1,172 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from PIL import Image
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+class LocalLibrary:
+    """本地图片库索引（SQLite 持久化，增量扫描）
+
+    扫描时只对新增或修改时间/大小变化的文件读取图片头获取尺寸，其余文件仅比较 stat 结果。
+    选图时按屏幕尺寸取出候选数组并缓存到下次扫描，随机/顺序选择均为 O(1)，不会遍历目录。
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_size ON images(width, height)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        # (文件夹元组, 屏幕宽, 屏幕高) -> 候选路径数组，扫描后清空
+        self._candidates = {}
+        self._cursor = int(self._get_meta("cursor", "0"))
+
+    def _get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def last_scan(self, folders):
+        """上次完整扫描这些文件夹的时间戳，从未扫描返回 None"""
+        with self._lock:
+            value = self._get_meta("scanned:" + "|".join(sorted(folders)))
+        return float(value) if value else None
+
+    def ensure_scanned(self, folders, max_age):
+        """从未扫描过则同步扫描；超过 max_age 秒则在后台线程重新扫描"""
+        scanned = self.last_scan(folders)
+        if scanned is None:
+            self.scan(folders)
+        elif time.time() - scanned > max_age and not self._scan_lock.locked():
+            threading.Thread(target=self.scan, args=(folders,), name="local-scan", daemon=True).start()
+
+    def scan(self, folders):
+        """增量扫描文件夹，返回 (新增或更新数, 删除数)"""
+        with self._scan_lock:
+            start = time.perf_counter()
+            with self._lock:
+                known = {
+                    path: (mtime_ns, size)
+                    for path, mtime_ns, size in self._conn.execute(
+                        "SELECT path, mtime_ns, size FROM images WHERE folder IN (%s)" % ",".join("?" * len(folders)),
+                        list(folders)
+                    )
+                }
+
+            changed = []
+            seen = set()
+            for folder in folders:
+                for entry in _walk_images(folder):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    seen.add(entry.path)
+                    if known.get(entry.path) == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                    dimensions = _read_dimensions(entry.path)
+                    if dimensions:
+                        changed.append((entry.path, folder, stat.st_mtime_ns, stat.st_size, *dimensions))
+
+            removed = [(path,) for path in known if path not in seen]
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)", changed)
+                self._conn.executemany("DELETE FROM images WHERE path = ?", removed)
+                self._set_meta("scanned:" + "|".join(sorted(folders)), time.time())
+                self._conn.commit()
+                self._candidates.clear()
+
+            logging.info(
+                f"本地图库扫描完成: {len(seen)} 张，更新 {len(changed)}，删除 {len(removed)}，"
+                f"耗时 {time.perf_counter() - start:.2f}s"
+            )
+            return len(changed), len(removed)
+
+    def pick(self, folders, width, height, order="random"):
+        """按屏幕尺寸选一张图片（优先选择宽高都不小于屏幕的图片），图库为空返回 None"""
+        with self._lock:
+            key = (tuple(sorted(folders)), width, height)
+            candidates = self._candidates.get(key)
+            if candidates is None:
+                candidates = self._load_candidates(folders, width, height)
+                self._candidates[key] = candidates
+            if not candidates:
+                return None
+
+            if order == "sequential":
+                self._cursor = (self._cursor + 1) % len(candidates)
+                self._set_meta("cursor", self._cursor)
+                self._conn.commit()
+                return candidates[self._cursor]
+            return random.choice(candidates)
+
+    def _load_candidates(self, folders, width, height):
+        """一次查询得到候选数组；没有足够大的图片时退回同方向的全部图片，再退回全部图片"""
+        placeholders = ",".join("?" * len(folders))
+        landscape = width >= height
+        queries = [
+            ("width >= ? AND height >= ?", [width, height]),
+            ("(width >= height) = ?", [landscape]),
+            ("1", [])
+        ]
+        for condition, params in queries:
+            rows = self._conn.execute(
+                f"SELECT path FROM images WHERE folder IN ({placeholders}) AND {condition} ORDER BY path",
+                list(folders) + params
+            ).fetchall()
+            if rows:
+                return [row[0] for row in rows]
+        return []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _walk_images(folder):
+    """用 os.scandir 非递归栈遍历目录，产出图片文件的 DirEntry"""
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield entry
+        except OSError as e:
+            logging.warning(f"无法读取目录 {current}: {str(e)}")
+
+
+def _read_dimensions(path):
+    """只解析图片头获取尺寸（Pillow 延迟加载，不解码像素）"""
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
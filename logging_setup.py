@@ -0,0 +1,47 @@
+import queue
+import atexit
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_listener = None
+
+
+def setup_logging(console=False):
+    """日志先进入内存队列，由后台线程写入滚动日志文件（最大5MB，保留3个备份）
+
+    调用方线程（包括 Tk 主线程）只做入队，不直接进行文件 I/O 和轮转。
+    """
+    global _listener
+    file_handler = RotatingFileHandler(
+        'wallpaper.log',
+        maxBytes=5 * 1024 * 1024,
+        backupCount=3,
+        encoding='utf-8'
+    )
+    handlers = [file_handler]
+    if console:
+        # 无界面模式同时输出到标准错误，便于 cron/服务管理器收集
+        handlers.append(logging.StreamHandler())
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))  # 只合并参数，时间等由文件处理器格式化
+    logging.basicConfig(handlers=[queue_handler], level=logging.INFO)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并关闭文件（可重复调用）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.shutdown()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图桶上界（秒），覆盖从毫秒级的缓存操作到分钟级的慢速下载
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PREFIX = "wallpaper_"
+
+
+class Histogram:
+    """固定桶耗时直方图"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """按桶内线性插值估算分位数"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class Metrics:
+    """进程内指标：各阶段耗时直方图 + 计数器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """统计代码块耗时（异常时同样记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """JSON 可序列化的快照"""
+        with self._lock:
+            return {
+                "started": self.started,
+                "time": time.time(),
+                "counters": dict(self._counters),
+                "timings": {
+                    name: {
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "avg": round(h.sum / h.count, 6) if h.count else 0.0,
+                        "p50": round(h.quantile(0.5), 6),
+                        "p95": round(h.quantile(0.95), 6),
+                        "max": round(h.max, 6),
+                        "buckets": dict(zip([*map(str, h.buckets), "+Inf"], h.counts))
+                    }
+                    for name, h in self._histograms.items()
+                }
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = PREFIX + _metric_name(name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, h in sorted(self._histograms.items()):
+                metric = PREFIX + _metric_name(name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{metric}_sum {h.sum:.6f}", f"{metric}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+# 全局指标（与 logging 类似，各模块直接使用模块级函数）
+REGISTRY = Metrics()
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+inc = REGISTRY.inc
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics 返回 Prometheus 文本，GET /metrics.json 返回 JSON"""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = REGISTRY.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = REGISTRY.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    """指标导出：监听本机端口提供 HTTP 查询，和/或定期写入文件
+
+    文件扩展名为 .prom 时写 Prometheus 文本（可配合 node_exporter 文本采集），否则写 JSON。
+    """
+
+    def __init__(self, port=0, path="", interval=60):
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self._server = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer(("127.0.0.1", self.port), _MetricsHandler)
+            except OSError as e:
+                logging.error(f"指标端口监听失败: {self.port}（{str(e)}）")
+            else:
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+                logging.info(f"指标服务: http://127.0.0.1:{self.port}/metrics")
+        if self.path:
+            threading.Thread(target=self._write_loop, name="metrics-file", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.path:
+            self.write()
+
+    def write(self):
+        """原子写入一次指标文件"""
+        text = REGISTRY.to_prometheus() if self.path.endswith(".prom") else REGISTRY.to_json()
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"写入指标文件失败: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
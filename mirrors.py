@@ -0,0 +1,123 @@
+import time
+import logging
+import threading
+from collections import deque
+from statistics import median
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from downloader import DownloadCancelled
+from retry_policy import describe_error
+
+
+def as_mirror_list(template):
+    """模板可以是单个URL或镜像URL列表，统一为列表"""
+    return [template] if isinstance(template, str) else list(template)
+
+
+class MirrorStats:
+    """按镜像记录最近的首字节延迟和失败情况，用于排序"""
+
+    def __init__(self, window=20, unhealthy_after=3):
+        self.window = window
+        self.unhealthy_after = unhealthy_after
+        self._latencies = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def record_latency(self, url, latency):
+        with self._lock:
+            self._latencies.setdefault(url, deque(maxlen=self.window)).append(latency)
+
+    def record_success(self, url):
+        with self._lock:
+            self._failures[url] = 0
+
+    def record_failure(self, url):
+        with self._lock:
+            self._failures[url] = self._failures.get(url, 0) + 1
+
+    def p50(self, url):
+        """首字节延迟中位数（秒），无样本时返回 None"""
+        with self._lock:
+            samples = self._latencies.get(url)
+            return median(samples) if samples else None
+
+    def healthy(self, url):
+        with self._lock:
+            return self._failures.get(url, 0) < self.unhealthy_after
+
+    def order(self, urls, default_latency):
+        """健康镜像按 p50 升序在前（无样本按 default_latency 计），不健康的排最后；同等时保持配置顺序"""
+        def key(item):
+            index, url = item
+            p50 = self.p50(url)
+            return (not self.healthy(url), default_latency if p50 is None else p50, index)
+        return [url for _, url in sorted(enumerate(urls), key=key)]
+
+
+class HedgedFetcher:
+    """对冲请求引擎
+
+    先请求排序最靠前的镜像；若在 hedge_delay 秒内所有在途请求都没有收到首字节，
+    或某个请求失败，则启动下一个镜像。采用最先成功的结果并取消其余请求。
+    """
+
+    def __init__(self, hedge_delay=2.0, max_workers=4):
+        self.hedge_delay = hedge_delay
+        self.stats = MirrorStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mirror")
+
+    def fetch(self, urls, attempt):
+        """attempt(url, cancel, on_headers) 执行一次下载并返回结果；全部失败时抛出最后一个异常"""
+        ordered = self.stats.order(urls, self.hedge_delay)
+        cancel = threading.Event()
+        pending = {}
+        errors = []
+        remaining = deque(ordered)
+
+        def launch():
+            url = remaining.popleft()
+            first_byte = threading.Event()
+            start = time.monotonic()
+
+            def on_headers():
+                self.stats.record_latency(url, time.monotonic() - start)
+                first_byte.set()
+
+            future = self._executor.submit(attempt, url, cancel, on_headers)
+            pending[future] = (url, first_byte)
+            if len(pending) > 1:
+                logging.info(f"对冲请求: 启动镜像 {url}")
+
+        launch()
+        while pending:
+            timeout = self.hedge_delay if remaining else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 在途请求都未收到首字节时才追加镜像
+                if not any(first_byte.is_set() for _, first_byte in pending.values()):
+                    launch()
+                continue
+
+            for future in done:
+                url, first_byte = pending.pop(future)
+                try:
+                    result = future.result()
+                except DownloadCancelled:
+                    continue
+                except Exception as e:
+                    self.stats.record_failure(url)
+                    errors.append(e)
+                    logging.warning(f"镜像请求失败: {url} - {describe_error(e)}")
+                    if remaining:
+                        launch()
+                    continue
+
+                self.stats.record_success(url)
+                cancel.set()  # 取消其余在途请求
+                return result
+
+        raise errors[-1] if errors else DownloadCancelled("所有镜像请求均被取消")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+import metrics
+
+# dHash 网格：缩到 (HASH_SIZE+1)×HASH_SIZE 的灰度图，比较每行相邻像素，得到 HASH_SIZE² = 64 位
+HASH_SIZE = 8
+# 从文件计算时 draft 降采样解码的目标尺寸（JPEG 在 DCT 域直接缩小，UHD 只需解码 1/8）
+DRAFT_SIZE = (64, 64)
+# 汉明距离不超过该值视为同一张图片（不同分辨率或重新编码的版本通常在 0~2 位）
+MAX_DISTANCE = 4
+
+# numpy < 2.0 没有 bitwise_count 时按 16 位查表计算置位数
+if not hasattr(np, "bitwise_count"):
+    _POPCOUNT16 = np.unpackbits(np.arange(1 << 16, dtype=">u2").view(np.uint8)).reshape(-1, 16).sum(axis=1, dtype=np.uint8)
+
+
+def dhash(image):
+    """差分哈希：对缩放和重新编码不敏感，返回 64 位无符号整数"""
+    small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_image(image):
+    with metrics.timer("phash.compute"):
+        return dhash(image)
+
+
+def hash_file(path):
+    """draft 降采样解码图片文件并计算哈希，返回 (哈希, (原始宽, 原始高))"""
+    with metrics.timer("phash.compute"), Image.open(path) as img:
+        size = img.size
+        img.draft("L", DRAFT_SIZE)
+        return dhash(img), size
+
+
+def popcount(values):
+    """uint64 数组逐元素的置位数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    parts = _POPCOUNT16[values.view(np.uint16)].reshape(-1, 4)
+    return parts[:, 0] + parts[:, 1] + parts[:, 2] + parts[:, 3]
+
+
+class HashIndex:
+    """感知哈希索引（近似重复检测）
+
+    哈希紧凑存放在 uint64 数组中（每张图片 8 字节，另记像素数），查询时对整个数组做一次
+    异或 + 置位计数得到全部汉明距离，10 万张的查询在毫秒级完成。
+    路径数组 + 位置表与 CacheIndex 相同，删除时与末尾元素交换，O(1)。
+    """
+
+    def __init__(self, capacity=1024):
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._pixels = np.zeros(capacity, dtype=np.int64)
+        self._paths = []
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def add(self, path, value, pixels=0):
+        """登记（或更新）一张图片的哈希和像素数"""
+        with self._lock:
+            index = self._positions.get(path)
+            if index is None:
+                index = len(self._paths)
+                if index == len(self._hashes):
+                    self._grow(index * 2)
+                self._positions[path] = index
+                self._paths.append(path)
+            self._hashes[index] = value
+            self._pixels[index] = pixels or 0
+
+    def extend(self, rows):
+        """批量登记 [(路径, 哈希, 像素数)]（启动时从缓存索引加载，已有的路径忽略）"""
+        with self._lock:
+            rows = [row for row in rows if row[0] not in self._positions]
+            start = len(self._paths)
+            end = start + len(rows)
+            if end > len(self._hashes):
+                self._grow(max(end, len(self._hashes) * 2))
+            self._hashes[start:end] = np.fromiter((row[1] for row in rows), dtype=np.uint64, count=len(rows))
+            self._pixels[start:end] = np.fromiter((row[2] or 0 for row in rows), dtype=np.int64, count=len(rows))
+            for index, (path, _, _) in enumerate(rows, start):
+                self._positions[path] = index
+                self._paths.append(path)
+
+    def remove(self, path):
+        with self._lock:
+            index = self._positions.pop(path, None)
+            if index is None:
+                return
+            last = len(self._paths) - 1
+            last_path = self._paths.pop()
+            if index != last:
+                self._paths[index] = last_path
+                self._positions[last_path] = index
+                self._hashes[index] = self._hashes[last]
+                self._pixels[index] = self._pixels[last]
+
+    def nearest(self, value, max_distance=MAX_DISTANCE, exclude=None):
+        """汉明距离最小且不超过 max_distance 的图片，返回 (路径, 距离, 像素数)，没有时返回 None"""
+        with metrics.timer("phash.match"), self._lock:
+            count = len(self._paths)
+            if not count:
+                return None
+            distances = popcount(self._hashes[:count] ^ np.uint64(value))
+            if exclude in self._positions:
+                distances[self._positions[exclude]] = HASH_SIZE * HASH_SIZE + 1
+            index = int(np.argmin(distances))
+            distance = int(distances[index])
+            if distance > max_distance:
+                return None
+            return self._paths[index], distance, int(self._pixels[index])
+
+    def _grow(self, capacity):
+        self._hashes = np.resize(self._hashes, capacity)
+        self._pixels = np.resize(self._pixels, capacity)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path):
+        return path in self._positions
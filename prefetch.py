@@ -0,0 +1,146 @@
+import sys
+import ctypes
+import logging
+import threading
+from collections import deque
+
+import metrics
+from cache_index import prefit_original
+
+# 用户空闲多少秒后才开始后台预取
+IDLE_THRESHOLD = 10
+# 非空闲或失败时的重试等待
+IDLE_POLL = 30
+FAILURE_BACKOFF = 300
+
+
+def user_idle_seconds():
+    """距上次键鼠输入的秒数；无法检测的平台返回 None（视为空闲）"""
+    if sys.platform != "win32":
+        return None
+    try:
+        class LASTINPUTINFO(ctypes.Structure):
+            _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+        info = LASTINPUTINFO()
+        info.cbSize = ctypes.sizeof(LASTINPUTINFO)
+        if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+    except Exception:
+        return None
+
+
+class Prefetcher:
+    """壁纸预取队列
+
+    为当前数据源和分辨率设置在后台预先下载最多 depth 张壁纸，刷新时直接取用。
+    数据源或分辨率变化时清空队列；取到与已有壁纸相同的内容（如“今日壁纸”未更新）时暂停补充，
+    直到下次取用或切换设置。
+    """
+
+    def __init__(self, manager, depth=2):
+        self.manager = manager
+        self.depth = depth
+        self.hits = 0
+        self.misses = 0
+        self._queue = deque()
+        self._key = None
+        self._generation = 0
+        self._stalled = False
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, source, resolution):
+        """启动后台线程"""
+        self.set_key(source, resolution)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def set_key(self, source, resolution):
+        """切换数据源/分辨率设置（resolution 可为 "auto"），设置变化时作废队列"""
+        with self._lock:
+            if (source, resolution) == self._key:
+                return
+            if self._queue:
+                logging.info(f"预取队列已作废: {len(self._queue)} 张")
+            self._key = (source, resolution)
+            self._queue.clear()
+            self._generation += 1
+            self._stalled = False
+        self._wakeup.set()
+
+    def take(self, source, resolution):
+        """取出一张已就绪的壁纸，没有则返回 None"""
+        with self._lock:
+            path = None
+            if (source, resolution) == self._key and self._queue:
+                path = self._queue.popleft()
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._stalled = False
+            depth = len(self._queue)
+        metrics.inc("prefetch.hits" if path else "prefetch.misses")
+        total = self.hits + self.misses
+        logging.info(f"预取{'命中' if path else '未命中'}: 队列剩余 {depth}，命中率 {self.hits / total:.1%}")
+        self._wakeup.set()
+        return path
+
+    def queued_paths(self):
+        """队列中的文件（清理缓存时需保留）"""
+        with self._lock:
+            return set(self._queue)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._fill()
+
+    def _fill(self):
+        """补充队列直到填满、设置变化或遇到重复内容"""
+        while not self._stopped:
+            with self._lock:
+                if self._key is None or self._stalled or len(self._queue) >= self.depth:
+                    return
+                source, resolution = self._key
+                generation = self._generation
+            if not self.manager.is_remote_source(source):
+                return  # 本地数据源无需预取
+
+            idle = user_idle_seconds()
+            if idle is not None and idle < IDLE_THRESHOLD:
+                if self._wakeup.wait(IDLE_POLL):
+                    return  # 被新的事件唤醒，由外层循环重新开始
+                continue
+
+            try:
+                path = self.manager.prefetch_one(source, resolution)
+            except Exception as e:
+                logging.warning(f"预取失败: {str(e)}，{FAILURE_BACKOFF} 秒后重试")
+                if self._wakeup.wait(FAILURE_BACKOFF):
+                    return  # 被新的事件唤醒，由外层循环重新开始
+                continue
+
+            with self._lock:
+                if generation != self._generation:
+                    continue  # 设置已变化，结果留在缓存中但不入队
+                current = self.manager.current_wallpaper
+                # 开启屏幕适配时当前壁纸是适配版本，预取到的是其原图
+                if path in self._queue or path in (current, prefit_original(current)):
+                    self._stalled = True
+                    return
+                self._queue.append(path)
+                depth = len(self._queue)
+            logging.info(f"预取完成: {path}，队列深度 {depth}/{self.depth}")
@@ -0,0 +1,108 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+def is_sha256(name):
+    """是否为十六进制 SHA-256 摘要（内容寻址文件的文件名）"""
+    return len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+
+def file_key(path):
+    """预览缓存键：内容寻址文件直接用文件名中的哈希，其他文件用路径+修改时间+大小"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if is_sha256(name):
+        return name
+    stat = os.stat(path)
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def hashed_key(path):
+    """可用作文件名的 file_key：内容寻址文件即其内容哈希，其他文件为 file_key 的 SHA-256"""
+    key = file_key(path)
+    return key if is_sha256(key) else hashlib.sha256(key.encode()).hexdigest()
+
+
+def fit_size(width, height, box_width, box_height):
+    """保持宽高比缩放到指定区域内的尺寸"""
+    ratio = min(box_width / width, box_height / height)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def decode_preview(path, box_size):
+    """解码并缩放预览图
+
+    JPEG 先用 draft 在 DCT 域按 1/2、1/4、1/8 降采样，直接解码到接近目标的尺寸，
+    再用 LANCZOS 做最后一步小尺寸缩放。
+    """
+    from PIL import Image  # 首次预览时才导入，不拖慢启动
+
+    with metrics.timer("preview.decode"), Image.open(path) as img:
+        target = fit_size(img.width, img.height, *box_size)
+        img.draft("RGB", target)
+        return scale_preview(img.convert("RGB"), box_size)
+
+
+def scale_preview(img, box_size):
+    """把已解码的图片缩放到预览区域"""
+    from PIL import Image
+
+    return img.resize(fit_size(img.width, img.height, *box_size), Image.Resampling.LANCZOS)
+
+
+class PreviewRenderer:
+    """后台预览解码器（带缩略图缓存）
+
+    解码和缩放在单独的工作线程完成，回调在工作线程中被调用，
+    调用方负责把结果转交给 Tk 主线程生成 PhotoImage。
+    draft_source(path) 返回下载时已解码的图片（或 None），足够大时只做缩放，不再从磁盘解码。
+    """
+
+    def __init__(self, max_entries=8, draft_source=None):
+        self.max_entries = max_entries
+        self.draft_source = draft_source
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def render(self, path, box_size, callback):
+        """异步生成预览，完成后 callback(image)；被更新的请求取代时不回调"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._executor.submit(self._render, path, box_size, callback, generation)
+
+    def _render(self, path, box_size, callback, generation):
+        try:
+            if generation != self._generation:
+                return  # 已有更新的预览请求
+            key = (file_key(path), box_size)
+            with self._lock:
+                image = self._cache.get(key)
+                if image is not None:
+                    self._cache.move_to_end(key)
+            if image is None:
+                draft = self.draft_source(path) if self.draft_source else None
+                # 降采样图片比预览区域小时（窗口很大）仍从磁盘解码，避免放大变糊
+                if draft is not None and draft.width >= fit_size(draft.width, draft.height, *box_size)[0]:
+                    with metrics.timer("preview.scale"):
+                        image = scale_preview(draft, box_size)
+                else:
+                    image = decode_preview(path, box_size)
+                with self._lock:
+                    self._cache[key] = image
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+            if generation == self._generation:
+                callback(image)
+        except Exception as e:
+            logging.error(f"加载预览图失败: {str(e)}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
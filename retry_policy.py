@@ -0,0 +1,114 @@
+import time
+import random
+import logging
+import threading
+import requests
+
+from downloader import IncompleteDownloadError
+
+# 可重试的HTTP状态码（超时、限流、服务端临时错误）
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """数据源处于熔断状态，本次不发起请求"""
+
+
+def describe_error(error):
+    """简短的错误描述（HTTP错误只记录状态码，不记录响应正文）"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return f"HTTP {error.response.status_code} {error.response.reason}"
+    return f"{type(error).__name__}: {str(error)[:200]}"
+
+
+class RetryPolicy:
+    """下载重试策略：指数退避 + 全抖动，连接/读取超时分离，区分可重试与致命错误"""
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=30.0, connect_timeout=5, read_timeout=15):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @property
+    def timeout(self):
+        """requests 的 (连接超时, 读取超时)"""
+        return self.connect_timeout, self.read_timeout
+
+    def is_retryable(self, error):
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is not None and error.response.status_code in RETRYABLE_STATUS
+        return isinstance(error, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownloadError
+        ))
+
+    def delay(self, attempt, error=None):
+        """第 attempt 次（从0开始）失败后的等待秒数；服务端给出 Retry-After 时优先采用"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.isdigit() else None
+
+
+class CircuitBreaker:
+    """按“数据源/分辨率模板”计数的熔断器
+
+    连续失败达到阈值后熔断，熔断期间直接使用缓存壁纸；超时后放行一次试探请求，
+    试探仍失败则熔断时间翻倍（不超过 max_reset）。状态保存在传入的字典中（即配置文件），
+    时间使用墙上时钟，重启后继续生效。
+    """
+
+    def __init__(self, state, on_change=None, failure_threshold=3, reset_timeout=600, max_reset=6 * 3600, lock=None):
+        self.state = state
+        self.on_change = on_change
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset = max_reset
+        # state 属于配置时传入配置的锁，保证写盘序列化时状态不被同时修改
+        self._lock = lock or threading.Lock()
+
+    def allow(self, key):
+        """是否允许请求（关闭或已到试探时间）"""
+        with self._lock:
+            entry = self.state.get(key)
+            if not entry or not entry.get("opened_at"):
+                return True
+            return time.time() - entry["opened_at"] >= entry["reset_timeout"]
+
+    def record_success(self, key):
+        with self._lock:
+            if self.state.pop(key, None) is None:
+                return
+        logging.info(f"熔断器恢复: {key}")
+        self._changed()
+
+    def record_failure(self, key):
+        with self._lock:
+            entry = self.state.setdefault(key, {"failures": 0, "opened_at": None, "reset_timeout": self.reset_timeout})
+            entry["failures"] += 1
+            if entry["opened_at"]:
+                # 试探请求失败，延长熔断时间
+                entry["reset_timeout"] = min(entry["reset_timeout"] * 2, self.max_reset)
+            opened = bool(entry["opened_at"]) or entry["failures"] >= self.failure_threshold
+            if opened:
+                entry["opened_at"] = time.time()
+            reset_timeout = entry["reset_timeout"]
+        if opened:
+            logging.warning(f"熔断器打开: {key}，{reset_timeout} 秒后重试")
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import errno
+import ctypes
+import random
+import select
+import logging
+import threading
+
+# 包含系统休眠时间的单调时钟：Linux 的 CLOCK_MONOTONIC 在休眠期间暂停，改用 CLOCK_BOOTTIME；
+# macOS 的 CLOCK_MONOTONIC 和 Windows 的 time.monotonic（GetTickCount64）本身包含休眠时间
+if sys.platform.startswith("linux"):
+    _SUSPEND_CLOCK_ID = time.CLOCK_BOOTTIME
+elif sys.platform == "darwin":
+    _SUSPEND_CLOCK_ID = time.CLOCK_MONOTONIC
+else:
+    _SUSPEND_CLOCK_ID = None
+
+# timerfd 常量（linux/timerfd.h）
+_CLOCK_REALTIME = 0
+_TFD_NONBLOCK = os.O_NONBLOCK
+_TFD_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+_TFD_TIMER_ABSTIME = 1
+_TFD_TIMER_CANCEL_ON_SET = 2
+# Windows 电源通知（PowerRegisterSuspendResumeNotification）
+_DEVICE_NOTIFY_CALLBACK = 2
+_PBT_RESUME = (7, 18)  # PBT_APMRESUMESUSPEND、PBT_APMRESUMEAUTOMATIC
+
+
+def suspend_aware_clock():
+    """单调时钟（秒），系统休眠期间照常计时，不受墙上时钟修改影响"""
+    if _SUSPEND_CLOCK_ID is None:
+        return time.monotonic()
+    return time.clock_gettime(_SUSPEND_CLOCK_ID)
+
+
+def next_aligned(wall, interval):
+    """wall 之后下一个按本地时间对齐的时刻（如间隔1小时对齐到整点、1天对齐到零点）"""
+    offset = time.localtime(wall).tm_gmtoff
+    return ((wall + offset) // interval + 1) * interval - offset
+
+
+class _EventWaiter:
+    """在 threading.Event 上等待：超时、wake() 或（Windows）系统从休眠恢复时返回"""
+
+    def __init__(self, resume_notifications=False):
+        self._event = threading.Event()
+        self._registration = None
+        if resume_notifications and sys.platform == "win32":
+            try:
+                self._registration = _register_resume_callback(self.wake)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"无法注册休眠恢复通知: {str(e)}")
+
+    def wait(self, timeout):
+        """等待 timeout 秒（None 为一直等待），返回墙上时钟是否被修改（本实现无法得知，总是 False）"""
+        if self._event.wait(timeout):
+            self._event.clear()
+        return False
+
+    def wake(self):
+        self._event.set()
+
+    def close(self):
+        if self._registration is not None:
+            ctypes.windll.powrprof.PowerUnregisterSuspendResumeNotification(self._registration[1])
+            self._registration = None
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+class _Itimerspec(ctypes.Structure):
+    _fields_ = [("it_interval", _Timespec), ("it_value", _Timespec)]
+
+
+class _TimerfdWaiter:
+    """Linux：在 CLOCK_BOOTTIME 的 timerfd 上等待
+
+    该定时器在休眠期间照常计时，到期时刻落在休眠期间时恢复后立即触发；另一个 CLOCK_REALTIME 定时器
+    设置 TFD_TIMER_CANCEL_ON_SET，墙上时钟被修改（手动调整、NTP 跳变）时内核通知，用于重新计算对齐时刻。
+    两者与 wake() 的管道一起 select，等待期间没有任何轮询唤醒。
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._timerfd_create = libc.timerfd_create
+        self._timerfd_settime = libc.timerfd_settime
+        self._timerfd_settime.argtypes = [
+            ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Itimerspec), ctypes.POINTER(_Itimerspec)
+        ]
+        self._fds = []
+        self._lock = threading.Lock()  # wake() 与 close() 互斥，避免写入已关闭（可能被复用）的描述符
+        try:
+            self._timer = self._create(_SUSPEND_CLOCK_ID)
+            self._clock_watch = self._create(_CLOCK_REALTIME)
+            self._watch_clock()
+            self._read_end, self._write_end = os.pipe()
+            self._fds += [self._read_end, self._write_end]
+            os.set_blocking(self._read_end, False)
+            os.set_blocking(self._write_end, False)
+        except OSError:
+            self.close()
+            raise
+
+    def _create(self, clock_id):
+        fd = self._timerfd_create(clock_id, _TFD_NONBLOCK | _TFD_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "timerfd_create 失败")
+        self._fds.append(fd)
+        return fd
+
+    def _settime(self, fd, flags, seconds):
+        spec = _Itimerspec()
+        spec.it_value.tv_sec = int(seconds)
+        spec.it_value.tv_nsec = int((seconds - int(seconds)) * 1e9)
+        if self._timerfd_settime(fd, flags, ctypes.byref(spec), None) < 0:
+            raise OSError(ctypes.get_errno(), "timerfd_settime 失败")
+
+    def _watch_clock(self):
+        """监听墙上时钟修改：一个远期的绝对时间定时器，时钟被修改时读取返回 ECANCELED"""
+        self._settime(self._clock_watch, _TFD_TIMER_ABSTIME | _TFD_TIMER_CANCEL_ON_SET, time.time() + 10 * 365 * 86400)
+
+    def wait(self, timeout):
+        """等待 timeout 秒（None 为一直等待），返回墙上时钟是否被修改"""
+        # 相对定时器：0 表示停止计时，已到期时用 1 纳秒立即触发
+        self._settime(self._timer, 0, 0 if timeout is None else max(timeout, 1e-9))
+        ready, _, _ = select.select([self._timer, self._clock_watch, self._read_end], [], [])
+        if self._read_end in ready:
+            _drain(self._read_end)
+        if self._timer in ready:
+            _drain(self._timer)
+        if self._clock_watch not in ready:
+            return False
+        try:
+            os.read(self._clock_watch, 8)
+        except OSError as e:
+            if e.errno not in (errno.ECANCELED, errno.EAGAIN):
+                raise
+        self._watch_clock()
+        return True
+
+    def wake(self):
+        with self._lock:
+            if not self._fds:
+                return
+            try:
+                os.write(self._write_end, b"\0")
+            except BlockingIOError:
+                pass  # 管道已满说明已有未处理的唤醒
+
+    def close(self):
+        with self._lock:
+            for fd in self._fds:
+                os.close(fd)
+            self._fds = []
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 64):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _register_resume_callback(callback):
+    """Windows：系统从休眠恢复时在通知线程中调用 callback，返回需保持引用的 (参数结构, 注册句柄)"""
+    from ctypes import wintypes
+
+    routine_type = ctypes.WINFUNCTYPE(wintypes.ULONG, ctypes.c_void_p, wintypes.ULONG, ctypes.c_void_p)
+
+    class DEVICE_NOTIFY_SUBSCRIBE_PARAMETERS(ctypes.Structure):
+        _fields_ = [("Callback", routine_type), ("Context", ctypes.c_void_p)]
+
+    def routine(context, kind, setting):
+        if kind in _PBT_RESUME:
+            callback()
+        return 0
+
+    params = DEVICE_NOTIFY_SUBSCRIBE_PARAMETERS(routine_type(routine), None)
+    handle = ctypes.c_void_p()
+    status = ctypes.windll.powrprof.PowerRegisterSuspendResumeNotification(
+        _DEVICE_NOTIFY_CALLBACK, ctypes.byref(params), ctypes.byref(handle)
+    )
+    if status:
+        raise OSError(status, "PowerRegisterSuspendResumeNotification 失败")
+    return params, handle
+
+
+def default_waiter():
+    """按平台选择等待方式：Linux 用 timerfd，Windows 用事件 + 休眠恢复通知"""
+    if sys.platform.startswith("linux"):
+        try:
+            return _TimerfdWaiter()
+        except (OSError, AttributeError) as e:
+            logging.warning(f"timerfd 不可用，休眠恢复后的刷新可能推迟: {str(e)}")
+    return _EventWaiter(resume_notifications=True)
+
+
+class RefreshScheduler:
+    """自动刷新调度器
+
+    独立线程按包含休眠时间的单调时钟（suspend_aware_clock）计时，触发时刻基于上一次计划时刻累加，
+    不随回调耗时漂移；可选按墙上时钟对齐和随机抖动。两次触发之间线程一直阻塞，不做任何轮询：
+    休眠期间错过的多次触发在系统恢复时（timerfd 到期或 Windows 电源通知）合并为一次；
+    墙上时钟被修改（手动调整、NTP 校时）不会被当作休眠，对齐模式下收到时钟修改通知后重新计算对齐时刻。
+    回调在调度线程中执行，执行期间到期的触发同样被合并。
+    传入 clock 时（测试）使用普通事件等待，由 wake() 唤醒。
+    """
+
+    def __init__(self, callback, on_schedule=None, clock=None, wall_clock=time.time):
+        self.callback = callback
+        self.on_schedule = on_schedule  # on_schedule(下次触发的墙上时间戳或 None)
+        self.clock = clock or suspend_aware_clock
+        self.wall_clock = wall_clock
+        self.interval = 0
+        self.align = False
+        self.jitter = 0
+        self.ticks = 0
+        self.missed = 0
+        self._base = None  # 不含抖动的计划时刻（单调时钟）
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._waiter = _EventWaiter() if clock else default_waiter()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._thread is None:
+            self._waiter.close()
+        else:
+            self._waiter.wake()  # 线程退出时关闭等待器
+
+    def wake(self):
+        """立即重新检查计划（系统恢复或时钟变化的外部通知）"""
+        self._waiter.wake()
+
+    def configure(self, interval, align=False, jitter=0):
+        """设置刷新间隔（秒，0 为关闭）；参数不变时保持原计划，不会重置计时"""
+        with self._lock:
+            if (interval, align, jitter) == (self.interval, self.align, self.jitter):
+                return False
+            self.interval, self.align, self.jitter = interval, align, jitter
+            self._base = None
+            self._plan(self.clock())
+        logging.info(f"已安排自动刷新，间隔: {interval}秒{'（对齐）' if align and interval else ''}")
+        self._waiter.wake()
+        return True
+
+    def _plan(self, now):
+        """计算下一次触发时刻（需持有锁）"""
+        if self.interval <= 0:
+            self._base = self._deadline = None
+        else:
+            if self.align:
+                wall = self.wall_clock()
+                # 留 1 秒余量，避免刚在对齐点前触发时再次落到同一个对齐点
+                self._base = now + next_aligned(wall + 1, self.interval) - wall
+            elif self._base is None:
+                self._base = now + self.interval
+            else:
+                # 跳过已错过的触发点，保持原有节拍
+                skipped = max(0, int((now - self._base) // self.interval))
+                self._base += (skipped + 1) * self.interval
+            self._deadline = self._base + random.uniform(0, self.jitter)
+        if self.on_schedule:
+            deadline = self._deadline
+            self.on_schedule(None if deadline is None else self.wall_clock() + deadline - now)
+
+    def _run(self):
+        try:
+            while not self._stopped:
+                with self._lock:
+                    now = self.clock()
+                    deadline = self._deadline
+                    if deadline is not None and now >= deadline:
+                        missed = int((now - self._base) // self.interval)
+                        self._plan(now)
+                    else:
+                        missed = None
+                if missed is None:
+                    if self._waiter.wait(None if deadline is None else deadline - now):
+                        self._clock_changed()
+                    continue
+
+                self.ticks += 1
+                if missed:
+                    self.missed += missed
+                    logging.info(f"错过 {missed} 次自动刷新（休眠或上次刷新耗时过长），合并为一次")
+                try:
+                    self.callback()
+                except Exception as e:
+                    logging.error(f"自动刷新失败: {str(e)}")
+        finally:
+            self._waiter.close()
+
+    def _clock_changed(self):
+        """墙上时钟被修改：单调时钟上的计划不受影响，只有对齐模式需要按新的本地时间重新对齐"""
+        with self._lock:
+            if not self.align or self._deadline is None:
+                return
+            logging.info("系统时间已修改，重新计算对齐刷新时刻")
+            self._base = None
+            self._plan(self.clock())
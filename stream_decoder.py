@@ -0,0 +1,116 @@
+import io
+import time
+import logging
+
+from PIL import Image, ImageFile
+
+import metrics
+from downloader import InvalidImageError
+
+# 常见图片格式的文件头；首个数据块不以其中之一开头即判定不是图片（如强制门户返回的 HTML 登录页）
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"RIFF", b"BM")
+# 累计这么多字节仍无法解析出图片头时放弃
+MAX_HEADER_BYTES = 256 * 1024
+# 下载时解码的目标尺寸：JPEG 在 DCT 域按 1/2~1/8 缩放到不小于该尺寸（UHD 为 1/4，1080p 为 1/2）
+DRAFT_SIZE = (640, 360)
+
+
+class StreamDecoder(ImageFile.Parser):
+    """边下载边解码（Pillow 增量解析器 + JPEG draft 降采样）
+
+    首个数据块即校验文件头，非图片内容立即抛出 InvalidImageError，不必下载完整个响应体；
+    图片头解析完成后用 draft 按 DRAFT_SIZE 降采样解码，之后每个数据块到达时继续解码，
+    最后一个字节到达时预览图即已就绪。close() 同时校验图片完整（截断的 JPEG 会失败）。
+    图片太小无法降采样时仍完整解码以校验，但不返回预览图（预览直接从磁盘按需解码更快）。
+    不支持增量解码的格式（如 PNG），以及 Pillow 内部接口（Image._getdecoder 等）与当前版本不兼容时，
+    退回为缓存整个响应体，在 close() 中用公开接口解码校验（同样拒绝截断的图片，只是预览图要到下载完成后才生成）。
+    """
+
+    def __init__(self, draft_size=DRAFT_SIZE):
+        self.draft_size = draft_size
+        self.buffered = False  # 退回为下载完成后整体解码
+        self.original_size = None
+        self.elapsed = 0.0  # 累计解码耗时（秒）
+
+    def feed(self, data):
+        start = time.perf_counter()
+        try:
+            if self.image is None:
+                self._open(data)
+            elif self.buffered:
+                self.data += data
+            else:
+                super().feed(data)
+        except OSError as e:
+            raise InvalidImageError(f"图片数据损坏: {str(e)}") from e
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def _open(self, data):
+        """累积数据直到能解析出图片头，然后按目标尺寸设置 draft 并创建解码器"""
+        self.data = data if self.data is None else self.data + data
+        if len(self.data) >= 8 and not self.data.startswith(IMAGE_SIGNATURES):
+            raise InvalidImageError(f"响应内容不是图片: {bytes(self.data[:16])!r}")
+        try:
+            with io.BytesIO(self.data) as fp:
+                image = Image.open(fp)
+        except OSError:
+            if len(self.data) > MAX_HEADER_BYTES:
+                raise InvalidImageError("无法识别图片格式")
+            return  # 数据还不够
+
+        self.original_size = image.size  # draft 会修改 image.size
+        if self.draft_size and image.format == "JPEG":
+            image.draft("RGB", self.draft_size)
+        # JpegImageFile 的 load_read 只用于文件截断时补 EOI，解码器本身支持增量输入
+        custom_read = image.format != "JPEG" and (hasattr(image, "load_seek") or hasattr(image, "load_read"))
+        if custom_read or len(image.tile) != 1:
+            # 无法增量解码：缓存完整响应体，下载完成后整体解码校验
+            self.buffered = True
+            self.image, self.data = image, bytearray(self.data)
+            return
+
+        # 与 ImageFile.Parser 相同的解码器初始化，区别是在此之前调用了 draft
+        try:
+            image.load_prepare()
+            decoder_name, extents, offset, args = image.tile[0]
+            image.tile = []
+            self.decoder = Image._getdecoder(image.mode, decoder_name, args, image.decoderconfig)
+            self.decoder.setimage(image.im, extents)
+        except (AttributeError, TypeError) as e:
+            logging.warning(f"当前 Pillow 版本不支持增量解码，改为下载完成后校验: {str(e)}")
+            self.decoder = None
+            self.buffered = True
+            self.image, self.data = image, bytearray(self.data)
+            return
+        self.image = image
+        self.offset = offset
+        if offset <= len(self.data):
+            self.data, self.offset = self.data[offset:], 0
+
+    def close(self):
+        """结束解码并校验完整性，返回 (格式, 原始宽, 原始高, 预览图或 None)"""
+        if self.image is None:
+            raise InvalidImageError("响应内容不是完整的图片")
+        image_format = self.image.format
+        try:
+            image = self._decode_buffered() if self.buffered else super().close()
+        except OSError as e:
+            raise InvalidImageError(f"图片数据不完整: {str(e)}") from e
+        if image is not None and image.size == self.original_size:
+            image = None
+        metrics.observe("download.decode", self.elapsed)
+        return image_format, *self.original_size, image
+
+    def _decode_buffered(self):
+        """用公开接口解码缓存的完整响应体（截断时 load() 抛出 OSError）"""
+        start = time.perf_counter()
+        try:
+            image = Image.open(io.BytesIO(self.data))
+            if self.draft_size and image.format == "JPEG":
+                image.draft("RGB", self.draft_size)
+            image.load()
+            return image
+        finally:
+            self.data = None
+            self.elapsed += time.perf_counter() - start
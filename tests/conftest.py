@@ -0,0 +1,38 @@
+import os
+import json
+import sys
+
+import pytest
+
+# 模块位于仓库根目录（无安装包），直接加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """独立的 HOME 和工作目录（缓存目录和 api_config.json 都写在这里）"""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_manager(home):
+    """创建 WallpaperManager（config 为写入 api_config.json 的配置，默认使用默认配置），测试结束时关闭"""
+    from display import DisplayDetector, FakeBackend
+    from wallpaper_manager import APIConfigManager, WallpaperManager
+
+    managers = []
+
+    def make(config=None, backend=None):
+        if config is not None:
+            with open(APIConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as f:
+                json.dump(config, f)
+        manager = WallpaperManager(detector=DisplayDetector(backend or FakeBackend()))
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+        manager.cache_index.close()
@@ -0,0 +1,19 @@
+from bandwidth import BandwidthTracker, choose_resolution
+
+
+def test_resumed_download_learns_full_file_size():
+    tracker = BandwidthTracker({})
+    # 续传：文件 4MB，本次只传输了后 1MB
+    tracker.record("today", "uhd", 1_000_000, 2.0, size=4_000_000)
+
+    assert tracker.expected_bytes("uhd") == 4_000_000
+    assert tracker.used_today() == 1_000_000
+    assert tracker.throughput("today") == 500_000
+    # 预计 8 秒，超出 5 秒的时间预算
+    assert choose_resolution(tracker, "today", "uhd", max_seconds=5).preset != "uhd"
+
+
+def test_size_defaults_to_received():
+    tracker = BandwidthTracker({})
+    tracker.record("today", "1080p", 300_000, 1.0)
+    assert tracker.expected_bytes("1080p") == 300_000
@@ -0,0 +1,45 @@
+import os
+
+from cache_index import CacheIndex
+
+SHA = "ab" * 32
+
+
+def test_corrupt_index_is_set_aside_and_rebuilt(tmp_path):
+    (tmp_path / f"{SHA}.jpg").write_bytes(b"\xff\xd8\xff" + b"\0" * 100)
+    (tmp_path / CacheIndex.DB_NAME).write_bytes(os.urandom(4096))
+
+    index = CacheIndex(str(tmp_path))
+
+    assert len(index) == 1
+    assert index.random_path() == str(tmp_path / f"{SHA}.jpg")
+    assert (tmp_path / (CacheIndex.DB_NAME + ".corrupt")).exists()
+    index.close()
+    # 重建后的索引可以正常再次打开
+    reopened = CacheIndex(str(tmp_path))
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_prefit_variants_are_not_picked_as_fallback(tmp_path):
+    index = CacheIndex(str(tmp_path))
+    original = str(tmp_path / f"{SHA}.jpg")
+    variant = str(tmp_path / f"{SHA}.1366x768.jpg")
+    index.add(original, 1000, "uhd", "random", SHA)
+    index.add(variant, 100, "1366x768", CacheIndex.PREFIT_SOURCE)
+
+    assert {index.random_path() for _ in range(50)} == {original}
+    assert index.total_bytes == 1100
+    assert index.evict(0) and index.total_bytes == 0 and index.random_path() is None
+    index.close()
+
+
+def test_rebuild_recognises_prefit_variants(tmp_path):
+    for name in (f"{SHA}.jpg", f"{SHA}.1366x768.jpg"):
+        (tmp_path / name).write_bytes(b"\xff\xd8\xff" + b"\0" * 100)
+    index = CacheIndex(str(tmp_path))
+
+    assert len(index) == 1
+    assert index.random_path() == str(tmp_path / f"{SHA}.jpg")
+    assert [row[0] for row in index.history()] == [str(tmp_path / f"{SHA}.jpg")]
+    index.close()
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from PIL import Image
+
+import catalog
+from benchmarks.stub_server import archive_json
+from catalog import Catalog, FileFeed, color_histogram
+
+DAYS = 10
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的时间：显示记录按调用顺序递增"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(catalog.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "archive.json"
+    path.write_text(json.dumps(archive_json(DAYS)), encoding='utf-8')
+    db = Catalog(str(tmp_path / Catalog.DB_NAME))
+    db.sync(FileFeed(str(path)))
+    yield db
+    db.close()
+
+
+def dates():
+    return [image["startdate"] for image in archive_json(DAYS)["images"]]
+
+
+def test_pick_skips_recently_shown(archive, clock):
+    shown, fresh = dates()[:-1], dates()[-1]
+    for date in shown:
+        clock[0] += 60
+        archive.mark_shown(date)
+    for _ in range(20):
+        assert archive.pick("1080p", no_repeat_days=30).date == fresh
+
+    clock[0] += 60
+    archive.mark_shown(fresh)
+    # 都在不重复天数内显示过：选最久未显示的
+    assert archive.pick("1080p", no_repeat_days=30).date == shown[0]
+    # 超过不重复天数后重新参与随机选择
+    clock[0] += 31 * 86400
+    assert {archive.pick("1080p", no_repeat_days=30).date for _ in range(200)} == set(dates())
+
+
+def test_pick_filters_by_dominant_color(archive, clock):
+    red, blue = dates()[:2]
+    archive.record_download(red, "1080p", None, None, color_histogram(Image.new("RGB", (64, 36), (220, 20, 20))))
+    archive.record_download(blue, "1080p", None, None, color_histogram(Image.new("RGB", (64, 36), (20, 40, 220))))
+
+    assert archive.pick("1080p", color="blue").date == blue
+    assert archive.pick("1080p", color="red").date == red
+    # 没有颜色信息的图片不参与按颜色筛选
+    assert archive.pick("1080p", color="green") is None
+
+
+def test_corrupt_catalog_is_set_aside_and_recreated(tmp_path):
+    db_path = tmp_path / Catalog.DB_NAME
+    db_path.write_bytes(b"not a database" * 512)
+
+    db = Catalog(str(db_path))
+
+    assert len(db) == 0
+    assert db.last_synced() == 0
+    assert (tmp_path / (Catalog.DB_NAME + ".corrupt")).exists()
+    db.close()
@@ -0,0 +1,79 @@
+import json
+
+import os
+import time
+
+from bandwidth import Decision
+from wallpaper_manager import APIConfigManager
+
+# 早期版本界面写出的配置：只有 today/random 两个数据源，各自只有名称和模板
+BASELINE_CONFIG = {
+    "current_source": "random",
+    "current_wallpaper": "",
+    "resolution": "1080p",
+    "refresh_interval": 1800,
+    "sources": {
+        "today": {
+            "name": "今日壁纸",
+            "templates": {"1080p": "https://mirror.example/1920x1080.php"}
+        },
+        "random": {
+            "name": "随机历史",
+            "templates": {"1080p": "https://bing.img.run/rand.php"}
+        }
+    }
+}
+
+
+def load_baseline():
+    with open(APIConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(BASELINE_CONFIG, f)
+    return APIConfigManager().config
+
+
+def test_old_config_gains_new_sources_and_keeps_edits(home):
+    config = load_baseline()
+    assert config["sources"]["local"] == APIConfigManager.DEFAULT_CONFIG["sources"]["local"]
+    assert config["sources"]["today"]["templates"] == {"1080p": "https://mirror.example/1920x1080.php"}
+    assert config["refresh_interval"] == 1800
+    assert config["prefetch_depth"] == APIConfigManager.DEFAULT_CONFIG["prefetch_depth"]
+
+
+def test_user_values_in_builtin_sources_are_not_overwritten(home):
+    edited = json.loads(json.dumps(BASELINE_CONFIG))
+    edited["sources"]["local"] = {"name": "我的照片", "type": "local", "folders": ["/photos"]}
+    with open(APIConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(edited, f)
+    local = APIConfigManager().config["sources"]["local"]
+    assert local["name"] == "我的照片"
+    assert local["folders"] == ["/photos"]
+    assert local["rescan_interval"] == 3600
+
+
+def test_old_today_source_can_be_upgraded(make_manager):
+    manager = make_manager(config=dict(BASELINE_CONFIG, upgrade_later=True))
+    assert manager.api_config.config["sources"]["today"]["upgradable"] is True
+    downgraded = Decision("1080p", "uhd", "", 0, 0, 0)
+    assert manager._should_upgrade("today", downgraded)
+    assert not manager._should_upgrade("random", downgraded)
+
+
+def test_old_random_source_avoids_current_wallpaper_variant(make_manager):
+    manager = make_manager(config=dict(BASELINE_CONFIG, near_duplicates=False))
+    assert manager.api_config.config["sources"]["random"]["avoid_repeats"] is True
+    original = os.path.join(manager.cache_dir, "ab" * 32 + ".jpg")
+    manager.current_wallpaper = os.path.join(manager.cache_dir, "ab" * 32 + ".1920x1080.jpg")
+    assert manager._is_repeat("random", original)
+    assert not manager._is_repeat("today", original)
+    assert not manager._is_repeat("random", os.path.join(manager.cache_dir, "cd" * 32 + ".jpg"))
+
+
+def test_old_config_gains_catalog_source_and_daily_today(make_manager):
+    manager = make_manager(config=BASELINE_CONFIG)
+    sources = manager.api_config.config["sources"]
+    assert sources["archive"] == APIConfigManager.DEFAULT_CONFIG["sources"]["archive"]
+    assert manager.is_catalog_source("archive")
+    urls, date = manager._source_urls("today", "1080p")
+    assert urls == ["https://mirror.example/1920x1080.php"]
+    assert date == time.strftime("%Y%m%d")
+    assert manager._source_urls("random", "1080p")[1] is None
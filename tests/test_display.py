@@ -0,0 +1,38 @@
+from display import DisplayBackend, DisplayDetector, FakeBackend, Monitor, XrandrBackend
+
+DUAL = [Monitor(0, 0, 2560, 1440, True), Monitor(2560, 0, 1920, 1080, False)]
+
+
+class BrokenBackend(DisplayBackend):
+    """模拟缺少 xrandr 或无显示会话"""
+
+    def monitors(self):
+        raise FileNotFoundError("xrandr")
+
+
+def test_layout_is_cached_until_display_changes():
+    backend = FakeBackend()
+    detector = DisplayDetector(backend)
+    assert detector.get_primary_resolution() == (1920, 1080)
+    detector.get_monitors()
+    assert backend.enumerations == 1
+
+    backend.set_monitors(DUAL)
+    assert detector.get_monitors() == DUAL
+    assert detector.get_primary_resolution() == (2560, 1440)
+    assert backend.enumerations == 2
+
+
+def test_xrandr_parse_marks_first_monitor_primary_when_unmarked():
+    output = (
+        "Screen 0: minimum 8 x 8, current 4480 x 1440, maximum 32767 x 32767\n"
+        "DP-1 connected 2560x1440+0+0 (normal left inverted right x axis y axis) 597mm x 336mm\n"
+        "HDMI-1 connected 1920x1080+2560+0 (normal left inverted right x axis y axis) 527mm x 296mm\n"
+        "VGA-1 disconnected (normal left inverted right x axis y axis)\n"
+    )
+    assert XrandrBackend.parse(output) == DUAL
+
+
+def test_failing_backend_falls_back_to_single_monitor(make_manager):
+    manager = make_manager(backend=BrokenBackend())
+    assert manager.get_monitors() == [Monitor(0, 0, 1920, 1080, True)]
@@ -0,0 +1,68 @@
+import io
+import os
+import hashlib
+from types import SimpleNamespace
+
+from PIL import Image
+
+from cache_index import CacheIndex
+from downloader import DownloadResult, content_path
+from perceptual_hash import hash_image
+
+URL = "https://mirror.example/rand.php"
+
+
+def save_version(cache_dir, image):
+    """按内容哈希保存一个版本，返回 (路径, 内容哈希)"""
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    sha256 = hashlib.sha256(buffer.getvalue()).hexdigest()
+    path = content_path(cache_dir, sha256)
+    with open(path, 'wb') as f:
+        f.write(buffer.getvalue())
+    return path, sha256
+
+
+def test_smaller_duplicate_redirects_validators_to_kept_version(make_manager):
+    manager = make_manager()
+    picture = Image.linear_gradient("L").resize((800, 600)).convert("RGB")
+    kept, kept_sha = save_version(manager.cache_dir, picture)
+    manager.cache_index.add(kept, 1000, "uhd", "random", kept_sha, hash_image(picture), 800 * 600)
+    manager.near_duplicates.add(kept, hash_image(picture), 800 * 600)
+
+    smaller = picture.resize((400, 300))
+    path, sha256 = save_version(manager.cache_dir, smaller)
+    response = SimpleNamespace(headers={"ETag": '"v1"'}, url=URL)
+    manager.validators.update(URL, response, path, sha256)
+
+    result = DownloadResult(path, 100, False, sha256, False, (400, 300), smaller, size=os.path.getsize(path))
+    assert manager._ingest(result, "1080p", "random") == kept
+
+    entry = manager.validators.get(URL)
+    assert entry["path"] == kept
+    assert entry["sha256"] == kept_sha
+    # 非目录、非每日数据源的下载不打开本地目录
+    assert manager._catalog is None
+
+
+def write_entry(manager, name, size, source="random"):
+    path = f"{manager.cache_dir}/{name}"
+    with open(path, 'wb') as f:
+        f.write(b"\0" * size)
+    manager.cache_index.add(path, size, "1080p", source, name.partition(".")[0])
+    return path
+
+
+def test_original_behind_current_variant_survives_supersede_and_eviction(make_manager):
+    manager = make_manager()
+    original = write_entry(manager, "ab" * 32 + ".jpg", 1000)
+    manager.current_wallpaper = write_entry(manager, "ab" * 32 + ".1920x1080.jpg", 500, CacheIndex.PREFIT_SOURCE)
+    newer = write_entry(manager, "cd" * 32 + ".jpg", 2000)
+
+    manager._supersede(original, newer, "cd" * 32)
+    assert os.path.exists(original)
+
+    manager.clean_cache(max_bytes=0)
+    assert os.path.exists(original) and os.path.exists(manager.current_wallpaper)
+    assert not os.path.exists(newer)
+    assert [row[0] for row in manager.cache_index.history()] == [original]
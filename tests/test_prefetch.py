@@ -0,0 +1,67 @@
+import threading
+
+import prefetch
+from prefetch import Prefetcher
+
+
+class FlakyManager:
+    """第一次预取失败、之后成功的假管理器"""
+
+    def __init__(self):
+        self.current_wallpaper = None
+        self.calls = 0
+        self.filled = threading.Event()
+
+    def is_remote_source(self, source):
+        return True
+
+    def prefetch_one(self, source, resolution):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError("模拟网络故障")
+        self.filled.set()
+        return f"/cache/{self.calls}.jpg"
+
+
+def test_failure_is_retried_after_backoff(monkeypatch):
+    monkeypatch.setattr(prefetch, "FAILURE_BACKOFF", 0.05)
+    manager = FlakyManager()
+    prefetcher = Prefetcher(manager, depth=1)
+    prefetcher.start("random", "1080p")
+    try:
+        # 没有取用或设置变化，退避结束后自行重试
+        assert manager.filled.wait(5)
+    finally:
+        prefetcher.stop()
+    assert manager.calls == 2
+    assert prefetcher.take("random", "1080p") == "/cache/2.jpg"
+
+
+class CurrentManager(FlakyManager):
+    """预取到的总是当前壁纸（适配版本）的原图"""
+
+    ORIGINAL = "/cache/" + "ab" * 32 + ".jpg"
+
+    def __init__(self):
+        super().__init__()
+        self.current_wallpaper = "/cache/" + "ab" * 32 + ".1920x1080.jpg"
+
+    def prefetch_one(self, source, resolution):
+        self.calls += 1
+        return self.ORIGINAL
+
+
+def test_original_of_current_variant_is_not_queued():
+    manager = CurrentManager()
+    prefetcher = Prefetcher(manager, depth=2)
+    prefetcher.start("random", "1080p")
+    try:
+        for _ in range(500):
+            if prefetcher._stalled:
+                break
+            threading.Event().wait(0.01)
+    finally:
+        prefetcher.stop()
+    assert prefetcher._stalled
+    assert manager.calls == 1
+    assert len(prefetcher) == 0
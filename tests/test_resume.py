@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from benchmarks.stub_server import StubServer
+from downloader import PARTIAL_DIR, stream_download
+
+
+def partial_bytes(cache_dir):
+    directory = os.path.join(cache_dir, PARTIAL_DIR)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".part"))
+
+
+def test_resume_after_disconnect_fetches_only_remaining_bytes(tmp_path):
+    with StubServer() as server:
+        url = f"{server.base_url}/bing/uhd/20240101.jpg"
+        complete = stream_download(url, str(tmp_path / "reference"))
+
+        cache_dir = str(tmp_path / "cache")
+        os.makedirs(cache_dir)
+        server.disconnect_after = 512 * 1024
+        with pytest.raises(Exception):
+            stream_download(url, cache_dir)
+        assert server.disconnects == 1
+        kept = partial_bytes(cache_dir)
+        assert 0 < kept <= 512 * 1024
+        assert not [name for name in os.listdir(cache_dir) if name.endswith(".jpg")]
+
+        before = server.bytes_sent
+        result = stream_download(url, cache_dir)
+
+    assert result.received == server.bytes_sent - before == complete.received - kept
+    assert result.sha256 == complete.sha256
+    assert result.size == complete.size == os.path.getsize(result.path)
+    assert partial_bytes(cache_dir) == 0
+
+
+def test_resumed_download_is_indexed_at_full_size(make_manager):
+    manager = make_manager()
+    with StubServer() as server:
+        url = f"{server.base_url}/bing/uhd/20240101.jpg"
+        server.disconnect_after = 512 * 1024
+        with pytest.raises(Exception):
+            manager._fetch([url], "uhd", "random")
+        path = manager._fetch([url], "uhd", "random")
+
+    assert manager.cache_index.total_bytes == os.path.getsize(path)
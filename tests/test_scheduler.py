@@ -0,0 +1,57 @@
+import threading
+import time
+
+from scheduler import RefreshScheduler
+
+
+def test_ticks_on_interval():
+    ticked = threading.Event()
+    ticks = []
+
+    def callback():
+        ticks.append(time.monotonic())
+        if len(ticks) == 2:
+            ticked.set()
+
+    scheduler = RefreshScheduler(callback)
+    scheduler.configure(0.1)
+    scheduler.start()
+    try:
+        assert ticked.wait(5)
+    finally:
+        scheduler.stop()
+    assert scheduler.missed == 0
+
+
+def test_idle_wait_lasts_until_the_deadline():
+    """两次触发之间只有一次等待，时长为到下次触发的完整间隔（没有分片轮询）"""
+    scheduler = RefreshScheduler(lambda: None)
+    timeouts = []
+    wait = scheduler._waiter.wait
+    scheduler._waiter.wait = lambda timeout: timeouts.append(timeout) or wait(timeout)
+    scheduler.configure(3600)
+    scheduler.start()
+    time.sleep(0.2)
+    scheduler.stop()
+    assert len(timeouts) <= 2  # 启动时一次，stop() 唤醒后可能再检查一次
+    assert timeouts[0] > 3500
+
+
+def test_wall_clock_jump_is_not_treated_as_sleep():
+    now = [1000.0]
+    wall = [1_700_000_000.0]
+    ticked = threading.Event()
+    scheduler = RefreshScheduler(ticked.set, clock=lambda: now[0], wall_clock=lambda: wall[0])
+    scheduler.configure(3600)
+    scheduler.start()
+    try:
+        wall[0] += 7200  # 手动把系统时间调快两小时
+        scheduler.wake()
+        assert not ticked.wait(0.2)
+
+        now[0] += 3600  # 单调时钟到期（含休眠时间）
+        scheduler.wake()
+        assert ticked.wait(5)
+    finally:
+        scheduler.stop()
+    assert scheduler.missed == 0
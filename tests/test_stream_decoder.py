@@ -0,0 +1,67 @@
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from benchmarks.stub_server import StubServer
+from downloader import PARTIAL_DIR, InvalidImageError, stream_download
+import stream_decoder
+from stream_decoder import StreamDecoder
+
+
+def cached_files(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name != PARTIAL_DIR]
+
+
+def download(server, path, cache_dir):
+    return stream_download(f"{server.base_url}{path}", str(cache_dir), decoder=StreamDecoder())
+
+
+@pytest.fixture
+def server():
+    with StubServer() as stub:
+        yield stub
+
+
+def test_truncated_jpeg_is_rejected_before_rename(server, tmp_path):
+    with pytest.raises(InvalidImageError):
+        download(server, "/truncated/1080p", tmp_path)
+    assert cached_files(tmp_path) == []
+
+
+def test_complete_jpeg_yields_preview(server, tmp_path):
+    result = download(server, "/bing/uhd/20240101.jpg", tmp_path)
+    assert result.image_size == (3840, 2160)
+    assert result.preview is not None and result.preview.width < 3840
+    assert cached_files(tmp_path) == [os.path.basename(result.path)]
+
+
+def test_fallback_without_pillow_internals_still_rejects_truncation(server, tmp_path, monkeypatch):
+    # 模拟内部接口已变化的 Pillow：只保留公开的 Image.open
+    monkeypatch.setattr(stream_decoder, "Image", SimpleNamespace(open=Image.open))
+    with pytest.raises(InvalidImageError):
+        download(server, "/truncated/1080p", tmp_path / "truncated")
+    assert cached_files(tmp_path / "truncated") == []
+
+    result = download(server, "/bing/uhd/20240101.jpg", tmp_path / "complete")
+    assert result.image_size == (3840, 2160)
+    assert result.preview is not None and result.preview.width < 3840
+
+
+def feed_png(data):
+    decoder = StreamDecoder()
+    for start in range(0, len(data), 16 * 1024):
+        decoder.feed(data[start:start + 16 * 1024])
+    return decoder.close()
+
+
+def test_truncated_png_is_rejected():
+    buffer = io.BytesIO()
+    Image.effect_noise((800, 600), 64).convert("RGB").save(buffer, "PNG")
+    data = buffer.getvalue()
+
+    assert feed_png(data)[:3] == ("PNG", 800, 600)
+    with pytest.raises(InvalidImageError):
+        feed_png(data[:len(data) // 2])
@@ -0,0 +1,143 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+from atomic_file import atomic_open
+from preview import hashed_key
+
+# 缩略图最大尺寸（画廊格子的图片区域，保持原图宽高比）
+THUMB_SIZE = (192, 108)
+THUMB_QUALITY = 85
+
+
+def thumbnail_path(thumb_dir, path, size=THUMB_SIZE):
+    """缩略图路径：按原图内容哈希（非内容寻址文件用路径+修改时间+大小的哈希）和尺寸命名，原图内容变化即失效"""
+    return os.path.join(thumb_dir, f"{hashed_key(path)}.{size[0]}x{size[1]}.jpg")
+
+
+def make_thumbnail(src_path, out_path, size=THUMB_SIZE, quality=THUMB_QUALITY):
+    """用 draft 降采样解码原图生成缩略图，原子写入 out_path 并返回缩略图"""
+    from PIL import Image  # 首次生成时才导入
+
+    with Image.open(src_path) as img:
+        img.draft("RGB", size)
+        image = img.convert("RGB")
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+
+    with atomic_open(out_path) as f:
+        image.save(f, "JPEG", quality=quality)
+    return image
+
+
+class ThumbnailStore:
+    """磁盘缩略图库（历史画廊使用）
+
+    缩略图在后台线程中生成并写入 thumb_dir，之后直接读取几 KB 的小文件，不再解码原图；
+    内存中只保留最近用过的 max_memory 张。排队中的请求后进先出，快速滚动时优先处理当前可见的格子，
+    已滚出视野的格子可用 cancel() 撤销。回调在工作线程中执行，调用方负责转交 Tk 主线程。
+    """
+
+    def __init__(self, thumb_dir, size=THUMB_SIZE, max_memory=128):
+        self.dir = thumb_dir
+        self.size = size
+        self.max_memory = max_memory
+        os.makedirs(thumb_dir, exist_ok=True)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # 原图路径 -> callback(path, image)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def cached(self, path):
+        """内存中已有的缩略图，没有时返回 None"""
+        with self._lock:
+            image = self._memory.get(path)
+            if image is not None:
+                self._memory.move_to_end(path)
+            return image
+
+    def request(self, path, callback):
+        """异步加载缩略图，完成后在工作线程中 callback(path, image)；失败时不回调"""
+        with self._cond:
+            self._pending[path] = callback
+            self._pending.move_to_end(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="thumbnails", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, path):
+        with self._cond:
+            self._pending.pop(path, None)
+
+    def load(self, path):
+        """读取缩略图，磁盘上没有（或已损坏）时从原图生成"""
+        from PIL import Image
+
+        thumb = thumbnail_path(self.dir, path, self.size)
+        try:
+            with metrics.timer("thumbnail.load"), Image.open(thumb) as img:
+                image = img.convert("RGB")
+        except OSError:
+            with metrics.timer("thumbnail.generate"):
+                image = make_thumbnail(path, thumb, self.size)
+        with self._lock:
+            self._memory[path] = image
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+        return image
+
+    def discard(self, path):
+        """删除原图对应的缩略图（原图被淘汰时调用）"""
+        with self._lock:
+            self._memory.pop(path, None)
+        try:
+            os.remove(thumbnail_path(self.dir, path, self.size))
+        except OSError:
+            pass
+
+    def prune(self, keep_paths):
+        """删除不对应任何 keep_paths 的缩略图，返回删除的文件数"""
+        keep = set()
+        for path in keep_paths:
+            try:
+                keep.add(os.path.basename(thumbnail_path(self.dir, path, self.size)))
+            except OSError:
+                pass  # 原图已不存在
+        removed = 0
+        with os.scandir(self.dir) as it:
+            for entry in it:
+                if entry.name not in keep and not entry.name.endswith(".part"):
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except OSError:
+                        pass
+        if removed:
+            logging.info(f"已清理失效的缩略图: {removed} 个")
+        return removed
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                path, callback = self._pending.popitem(last=True)
+            try:
+                image = self.load(path)
+            except Exception as e:
+                logging.error(f"生成缩略图失败: {path}（{str(e)}）")
+                continue
+            callback(path, image)
@@ -0,0 +1,147 @@
+import signal
+import logging
+import threading
+from datetime import datetime
+from bandwidth import describe_decision
+from display import RESOLUTION_PRESETS
+from retry_policy import describe_error
+from scheduler import RefreshScheduler
+from wallpaper_manager import WallpaperManager
+# 无界面模式：只使用 WallpaperManager，不导入 tkinter/pystray/ImageTk，可在 cron、服务管理器或无显示环境中运行
+
+
+def add_arguments(parser):
+    """注册命令行参数（--once/--daemon/--prefetch/--sync-catalog 任一出现即进入无界面模式）"""
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--once", action="store_true", help="刷新一次壁纸后退出")
+    mode.add_argument("--daemon", action="store_true", help="按 refresh_interval 循环刷新，直到收到退出信号")
+    mode.add_argument("--prefetch", type=int, metavar="N", help="下载 N 张壁纸到缓存后退出（不更换壁纸）")
+    mode.add_argument(
+        "--sync-catalog", action="store_true",
+        help="从目录数据源的元数据源同步本地目录后退出（--source 指定数据源，默认为 archive）"
+    )
+    parser.add_argument("--source", help="数据源键（如 today、random、local），会写入配置")
+    parser.add_argument(
+        "--resolution",
+        choices=["auto", *RESOLUTION_PRESETS],
+        help="分辨率模板，默认使用配置中的设置"
+    )
+
+
+def is_headless(args):
+    return args.once or args.daemon or args.prefetch is not None or args.sync_catalog
+
+
+def refresh_once(manager, resolution):
+    """刷新一次并设置桌面壁纸，返回是否成功"""
+    try:
+        if not manager.refresh(resolution):
+            logging.error("刷新失败且没有可用的缓存壁纸")
+            return False
+        manager.apply_wallpaper(manager.current_wallpaper)
+    except Exception as e:
+        logging.error(f"刷新壁纸失败: {describe_error(e)}")
+        return False
+    manager.api_config.update({"current_wallpaper": manager.current_wallpaper})
+    logging.info(f"壁纸已更新: {manager.current_wallpaper}")
+    if manager.last_decision is not None:
+        logging.info(describe_decision(manager.last_decision))
+    return True
+
+
+def apply_upgrade(manager, path):
+    """后台下载的高分辨率版本就绪后设置为桌面壁纸"""
+    try:
+        manager.apply_wallpaper(path)
+    except Exception as e:
+        logging.error(f"设置高分辨率壁纸失败: {describe_error(e)}")
+        return
+    manager.api_config.update({"current_wallpaper": path})
+
+
+def prefetch(manager, count, resolution):
+    """下载 count 张壁纸到缓存，返回成功张数"""
+    source = manager.api_config.config["current_source"]
+    if not manager.is_remote_source(source):
+        logging.info(f"本地数据源无需预取: {source}")
+        return 0
+    done = 0
+    for i in range(count):
+        try:
+            path = manager.prefetch_one(source, resolution)
+        except Exception as e:
+            logging.error(f"预取失败（{i + 1}/{count}）: {describe_error(e)}")
+            continue
+        done += 1
+        logging.info(f"已预取（{i + 1}/{count}）: {path}")
+    manager.clean_cache()
+    return done
+
+
+def sync_catalog(manager, source):
+    """立即同步本地目录，返回是否成功"""
+    if source not in manager.api_config.config["sources"] or not manager.is_catalog_source(source):
+        logging.error(f"不是目录数据源: {source}")
+        return False
+    added = manager.sync_catalog(source, force=True)
+    if added is None:
+        return False
+    logging.info(f"本地目录共 {len(manager.catalog)} 条")
+    return True
+
+
+def log_next_run(next_run):
+    if next_run is not None:
+        logging.info(f"下次刷新: {datetime.fromtimestamp(next_run).strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+def run_daemon(manager, resolution, stop):
+    """立即刷新一次，之后由调度器按 refresh_interval 刷新，直到 stop 被设置；间隔为“手动”(0) 时只刷新一次"""
+    manager.start_prefetch(resolution)
+    refresh_once(manager, resolution)
+    config = manager.api_config.config
+    if config["refresh_interval"] <= 0:
+        logging.info("刷新间隔为手动，守护进程退出")
+        return
+
+    scheduler = RefreshScheduler(
+        lambda: refresh_once(manager, resolution),
+        on_schedule=log_next_run
+    )
+    scheduler.configure(config["refresh_interval"], config["refresh_align"], config["refresh_jitter"])
+    scheduler.start()
+    stop.wait()
+    scheduler.stop()
+
+
+def main(args):
+    """无界面模式入口，返回进程退出码"""
+    manager = WallpaperManager()
+    config = manager.api_config.config
+    if args.source:
+        if args.source not in config["sources"]:
+            logging.error(f"未知数据源: {args.source}")
+            return 2
+        if not args.sync_catalog:
+            manager.api_config.update({"current_source": args.source})
+    resolution = args.resolution or config.get("resolution") or "auto"
+    manager.on_upgrade = lambda path: apply_upgrade(manager, path)
+
+    try:
+        if args.once:
+            success = refresh_once(manager, resolution)
+            manager.wait_upgrade()  # 降级下载后等待后台替换完成再退出
+            return 0 if success else 1
+        if args.prefetch is not None:
+            return 0 if prefetch(manager, args.prefetch, resolution) == args.prefetch else 1
+        if args.sync_catalog:
+            return 0 if sync_catalog(manager, args.source or "archive") else 1
+
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        run_daemon(manager, resolution, stop)
+        return 0
+    finally:
+        manager.close()
+
@@ -0,0 +1,352 @@
+import os
+import time
+import logging
+import threading
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+from bandwidth import describe_decision
+from preview import PreviewRenderer
+from logging_setup import shutdown_logging
+from scheduler import RefreshScheduler
+from wallpaper_manager import APIConfigManager, WallpaperManager
+# pystray 和 PIL.ImageTk 在首次使用时才导入，窗口可以更早显示
+
+class WallpaperApp(tk.Tk):
+    def __init__(self):
+        super().__init__()
+        # 隐藏主窗口
+        self.withdraw()
+        
+        self.title("智能壁纸管理器 v3.1")
+        self.geometry("800x600")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        self.wm = WallpaperManager()
+        # 后台替换为高分辨率版本后转交 Tk 主线程
+        self.wm.on_upgrade = lambda path: self.after(0, self.on_upgraded, path)
+        self.current_image = None
+        self.preview_renderer = PreviewRenderer(draft_source=self.wm.decoded_preview)
+        self.download_thread = None
+        self.history_window = None
+        # 调度线程触发后转交 Tk 主线程
+        self.scheduler = RefreshScheduler(
+            lambda: self.after(0, self.auto_refresh),
+            on_schedule=lambda next_run: self.after(0, self.on_refresh_scheduled, next_run)
+        )
+        
+        self.create_controls()
+        self.create_preview()
+        self.create_status_bar()
+        self.update_ui_state(False)
+        self._bind_events()
+        self.schedule_auto_refresh()
+        self.scheduler.start()
+        self.wm.start_prefetch(self.res_var.get())
+        
+        # 创建系统托盘图标
+        self.create_tray_icon()
+        
+    def create_tray_icon(self):
+        """创建系统托盘图标（pystray 在窗口创建后才导入）"""
+        import pystray
+        from PIL import Image
+
+        menu = (
+            pystray.MenuItem('显示窗口', self.show_window),
+            pystray.MenuItem('退出', self.quit_app)
+        )
+        image = Image.new('RGB', (64, 64), 'white')  # 创建白色图标
+        self.tray_icon = pystray.Icon("wallpaper", image, "壁纸管理器", menu)
+        
+        # 在独立线程运行托盘图标
+        threading.Thread(target=self.tray_icon.run, daemon=True).start()
+            
+        
+    def show_window(self):
+        """显示主窗口"""
+        self.deiconify()
+        self.lift()
+        
+    def quit_app(self):
+        """退出程序时清理资源"""
+        # 停止自动刷新调度
+        self.scheduler.stop()
+        
+        self.wm.close()
+
+        # 等待下载线程结束
+        if self.download_thread and self.download_thread.is_alive():
+            self.download_thread.join(timeout=5)
+            
+        self.preview_renderer.shutdown()
+        self.destroy()
+        self.tray_icon.stop()
+        shutdown_logging()  # os._exit 不会执行 atexit，先写完队列中的日志
+        os._exit(0)
+
+    def create_controls(self):
+        """创建控制面板（新增刷新频率选项）"""
+        control_frame = ttk.Frame(self)
+        control_frame.pack(pady=10, fill=tk.X)
+        
+        # 数据源选择
+        ttk.Label(control_frame, text="数据源:").grid(row=0, column=0, padx=5)
+        self.source_var = tk.StringVar()
+        self.source_combobox = ttk.Combobox(
+            control_frame,
+            textvariable=self.source_var,
+            state="readonly"
+        )
+        sources = self.wm.api_config.get_source_options()
+        source_names = [name for _, name in sources]
+        self.source_combobox['values'] = source_names
+        current_key = self.wm.api_config.config["current_source"]
+        current_name = next(name for key, name in sources if key == current_key)
+        self.source_var.set(current_name)
+        self.source_combobox.grid(row=0, column=1, padx=5)
+        
+        # 分辨率选择
+        ttk.Label(control_frame, text="分辨率:").grid(row=0, column=2, padx=5)
+        self.res_var = tk.StringVar()
+        res_options = ["auto", "uhd", "1080p", "768p", "mobile"]
+        index = 0
+        if self.wm.api_config.config.get("resolution", None) is not None:
+            for i,res in enumerate(res_options):
+                if res == self.wm.api_config.config["resolution"]:
+                    index = i
+                    break
+        self.res_combobox = ttk.Combobox(
+            control_frame,
+            textvariable=self.res_var,
+            values=res_options,
+            state="readonly"
+        )
+        self.res_combobox.current(index)
+        self.res_combobox.grid(row=0, column=3, padx=5)
+        
+        # 刷新频率
+        ttk.Label(control_frame, text="刷新频率:").grid(row=0, column=4, padx=5)
+        self.interval_var = tk.StringVar()
+        interval_names = [name for name, _ in APIConfigManager.INTERVAL_OPTIONS]
+        self.interval_combobox = ttk.Combobox(
+            control_frame,
+            textvariable=self.interval_var,
+            values=interval_names,
+            state="readonly"
+        )
+        current_interval = self.wm.api_config.config["refresh_interval"]
+        current_name = next(name for name, value in APIConfigManager.INTERVAL_OPTIONS if value == current_interval)
+        self.interval_var.set(current_name)
+        self.interval_combobox.grid(row=0, column=5, padx=5)
+        
+        # 刷新按钮
+        self.refresh_btn = ttk.Button(control_frame, text="立即刷新", command=self.start_download_thread)
+        self.refresh_btn.grid(row=0, column=6, padx=5)
+
+        # 历史壁纸画廊
+        ttk.Button(control_frame, text="历史壁纸", command=self.open_history).grid(row=0, column=7, padx=5)
+
+    def create_preview(self):
+        """创建自适应预览区域"""
+        self.preview_frame = ttk.Frame(self)
+        self.preview_frame.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        
+        self.preview_label = ttk.Label(self.preview_frame)
+        self.preview_label.pack(expand=True, fill=tk.BOTH)
+        
+        if self.wm.current_wallpaper is not None:
+            self.show_preview(self.wm.current_wallpaper)
+
+    def create_status_bar(self):
+        """创建状态栏"""
+        self.status_var = tk.StringVar()
+        status_bar = ttk.Label(
+            self,
+            textvariable=self.status_var,
+            relief=tk.SUNKEN,
+            anchor=tk.W
+        )
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+    def _bind_events(self):
+        """绑定配置变更事件"""
+        self.source_var.trace_add('write', lambda *_: self.save_config())
+        self.res_var.trace_add('write', lambda *_: self.save_config())
+        self.interval_var.trace_add('write', lambda *_: self.save_config())
+    
+    def save_config(self):
+        """把界面设置同步到配置（自动保存）"""
+        try:
+            # 转换数据源名称到键
+            selected_name = self.source_var.get()
+            sources = self.wm.api_config.get_source_options()
+            selected_key = next(key for key, name in sources if name == selected_name)
+            
+            # 转换刷新频率名称到值
+            selected_interval_name = self.interval_var.get()
+            selected_interval = next(value for name, value in APIConfigManager.INTERVAL_OPTIONS if name == selected_interval_name)
+            
+            # 更新配置对象（只有变化的项会被标记，写盘由后台合并进行）
+            changed = self.wm.api_config.update({
+                "current_source": selected_key,
+                "refresh_interval": selected_interval,
+                "resolution": self.res_var.get(),
+                "current_wallpaper": self.wm.current_wallpaper
+            })
+            
+            # 数据源或分辨率变化时作废预取队列
+            if changed & {"current_source", "resolution"}:
+                self.wm.prefetcher.set_key(selected_key, self.res_var.get())
+
+            # 刷新间隔变化时才重新安排定时任务
+            if "refresh_interval" in changed:
+                self.schedule_auto_refresh()
+            
+        except Exception as e:
+            logging.error(f"自动保存失败: {str(e)}")
+            self.status_var.set("错误: 配置保存失败")
+
+    def schedule_auto_refresh(self):
+        """按配置安排自动刷新（间隔未变化时保持原计划）"""
+        config = self.wm.api_config.config
+        self.scheduler.configure(config["refresh_interval"], config["refresh_align"], config["refresh_jitter"])
+
+    def on_refresh_scheduled(self, next_run):
+        """显示下次自动刷新时间"""
+        if next_run is not None:
+            self.status_var.set(f"下次自动刷新: {datetime.fromtimestamp(next_run).strftime('%H:%M:%S')}")
+
+    def auto_refresh(self):
+        """执行自动刷新"""
+        logging.info("开始自动刷新...")
+        self.start_download_thread()
+
+    def start_download_thread(self, action=None, on_failed=None):
+        """启动下载线程（默认执行一次刷新）"""
+        if self.download_thread and self.download_thread.is_alive():
+            return
+            
+        self.update_ui_state(True)
+        self.download_thread = threading.Thread(
+            target=self.download_task,
+            args=(action or (lambda: self.wm.refresh(self.res_var.get())), on_failed or self.on_download_failed),
+            daemon=True
+        )
+        self.download_thread.start()
+
+    def download_task(self, action, on_failed):
+        """后台下载任务（结束时把结果交回主线程，无需轮询线程状态）"""
+        try:
+            success = action()
+            if success:
+                result = (self.on_download_success, self.wm.current_wallpaper)
+            else:
+                result = (on_failed,)
+        except Exception as e:
+            result = (self.show_error, str(e))
+        self.after(0, self.on_download_done, *result)
+
+    def on_download_done(self, handler, *args):
+        """下载线程结束（主线程）"""
+        self.update_ui_state(False)
+        handler(*args)
+
+    def on_download_success(self, path):
+        """下载成功处理"""
+        self.set_wallpaper(path)
+        self.show_preview(path)
+        decision = self.wm.last_decision
+        self.status_var.set(f"壁纸更新成功 ✓  {describe_decision(decision)}" if decision else "壁纸更新成功 ✓")
+        logging.info(f"成功设置壁纸: {path}")
+
+    def on_upgraded(self, path):
+        """后台下载的高分辨率版本已就绪（主线程）"""
+        self.set_wallpaper(path)
+        self.show_preview(path)
+        self.status_var.set("已替换为高分辨率版本 ✓")
+
+    def on_download_failed(self):
+        """下载失败处理"""
+        if self.wm.current_wallpaper:
+            self.set_wallpaper(self.wm.current_wallpaper)
+            self.show_preview(self.wm.current_wallpaper)
+            self.status_var.set("使用缓存壁纸 ✓")
+            logging.warning("下载失败，已使用缓存壁纸")
+        else:
+            self.status_var.set("错误: 无可用壁纸")
+            logging.error("所有下载尝试失败且无缓存可用")
+
+    def open_history(self):
+        """打开历史壁纸画廊（已打开时置前）"""
+        if self.history_window is not None and self.history_window.winfo_exists():
+            self.history_window.lift()
+            return
+        from history_gallery import HistoryGallery
+
+        entries = self.wm.history()
+        self.history_window = HistoryGallery(self, entries, self.wm.thumbnails, self.select_history)
+        # 后台删除已淘汰图片的缩略图
+        threading.Thread(
+            target=self.wm.thumbnails.prune,
+            args=([path for path, *_ in entries],),
+            daemon=True
+        ).start()
+
+    def select_history(self, path):
+        """把历史画廊中双击的壁纸设为当前壁纸（屏幕适配在后台进行）"""
+        self.start_download_thread(
+            lambda: self.wm.select_cached(path),
+            lambda: self.status_var.set("错误: 壁纸文件已不存在")
+        )
+
+    def show_error(self, error):
+        """显示错误信息"""
+        self.status_var.set(f"错误: {error}")
+        logging.error(f"操作失败: {error}")
+
+    def update_ui_state(self, downloading):
+        """更新界面状态（操作期间禁用按钮）"""
+        state = "disabled" if downloading else "normal"
+        # self.apply_btn.config(state=state)
+        self.refresh_btn.config(state=state)
+        self.status_var.set("正在下载壁纸，请稍候..." if downloading else "就绪")
+
+    def set_wallpaper(self, path):
+        """设置壁纸"""
+        try:
+            self.wm.apply_wallpaper(path)
+            self.save_config()
+        except Exception as e:
+            logging.error(f"设置壁纸失败: {str(e)}")
+            raise
+
+    def show_preview(self, image_path):
+        """动态调整预览图（保持宽高比，后台线程解码）"""
+        # 获取实际可用空间
+        label_width = self.preview_label.winfo_width()
+        label_height = self.preview_label.winfo_height()
+        
+        if label_width < 10 or label_height < 10:  # 初始默认大小
+            label_width = 600
+            label_height = 400
+
+        # 工作线程完成解码后，仅 PhotoImage 的创建回到 Tk 主线程
+        self.preview_renderer.render(
+            image_path,
+            (label_width, label_height),
+            lambda img: self.after(0, self._apply_preview, img)
+        )
+
+    def _apply_preview(self, img):
+        """在主线程中显示已解码的预览图"""
+        from PIL import ImageTk
+
+        start = time.perf_counter()
+        self.current_image = ImageTk.PhotoImage(img)
+        self.preview_label.config(image=self.current_image)
+        logging.debug(f"预览主线程耗时: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def on_close(self):
+        """关闭窗口时隐藏到托盘"""
+        self.withdraw()
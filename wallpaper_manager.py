@@ -0,0 +1,945 @@
+import os
+import sys
+import copy
+import json
+import time
+import shlex
+import ctypes
+import logging
+import threading
+import tempfile
+import subprocess
+from collections import OrderedDict
+import metrics
+from downloader import stream_download, create_session, prune_partials, ValidatorStore
+from cache_index import CacheIndex, prefit_original
+from prefetch import Prefetcher
+from mirrors import HedgedFetcher, as_mirror_list
+from display import DisplayDetector, Monitor, RESOLUTION_PRESETS, match_resolution_preset, set_wallpaper_style
+from metrics import MetricsExporter
+from thumbnails import ThumbnailStore
+from retry_policy import RetryPolicy, CircuitBreaker, CircuitOpenError, describe_error
+from bandwidth import BandwidthTracker, choose_resolution, log_decision
+# 本模块不导入任何 GUI 依赖（tkinter/pystray/ImageTk），numpy 和 Pillow 在首次使用时才导入，
+# 供命令行/守护进程模式快速启动
+
+class APIConfigManager:
+    """API配置管理器（新增刷新频率配置）"""
+    CONFIG_FILE = "api_config.json"
+    
+    DEFAULT_CONFIG = {
+        "current_source": "today",
+        "current_wallpaper": "",
+        "resolution": "",
+        "refresh_interval": 3600,  # 默认1小时
+        "refresh_align": False,  # 按本地时间对齐刷新（如每小时整点）
+        "refresh_jitter": 0,  # 每次刷新随机推迟的最大秒数
+        "cache_max_bytes": 512 * 1024 * 1024,  # 缓存容量上限（字节）
+        "prefetch_depth": 2,  # 后台预取队列深度，0 为关闭
+        "hedge_delay": 2.0,  # 镜像对冲等待首字节的时间（秒）
+        "download_attempts": 3,  # 单次刷新的最大尝试次数
+        "connect_timeout": 5,  # 连接超时（秒）
+        "read_timeout": 15,  # 读取超时（秒）
+        "circuit_breakers": {},  # 各数据源/分辨率的熔断状态（自动维护）
+        "span_monitors": False,  # 多显示器时为每块屏幕各取一张并拼接为跨屏壁纸
+        "prefit": True,  # 预先把壁纸裁剪缩放到屏幕分辨率，设置时系统无需缩放
+        "prefit_quality": 90,  # 适配版本的 JPEG 质量
+        "metrics_port": 0,  # 本机指标查询端口（/metrics、/metrics.json），0 为关闭
+        "metrics_file": "",  # 定期写入指标的文件（.prom 为 Prometheus 文本，否则 JSON），空为关闭
+        "metrics_interval": 60,  # 指标文件写入间隔（秒）
+        "apply_command": "",  # 非 Windows 平台设置壁纸的命令，{path} 替换为图片路径
+        "max_download_seconds": 30,  # 自动分辨率时单张壁纸的预计下载耗时上限（秒），超出则降级，0 为不限
+        "metered": False,  # 按流量计费的网络：限制每日下载流量并关闭后台预取
+        "metered_daily_bytes": 50 * 1024 * 1024,  # 按流量计费时每日下载流量上限（字节）
+        "upgrade_later": False,  # 因带宽降级后在后台下载原分辨率并替换（仅限 upgradable 的数据源）
+        "bandwidth": {},  # 各数据源吞吐量、各模板平均大小和当日流量（自动维护）
+        "near_duplicates": True,  # 按感知哈希识别同一张图片的不同分辨率/重新编码版本，缓存中只保留分辨率最高的一份
+        "near_duplicate_distance": 4,  # 感知哈希（64 位）汉明距离不超过该值视为同一张图片
+        "sources": {
+            "today": {
+                "name": "今日壁纸",
+                "upgradable": True,  # 各分辨率模板是同一张图片，可先用小图再替换为大图
+                "daily": True,  # 每天一张，下载时按当天日期登记到本地目录
+                "templates": {
+                    "uhd": "https://bing.img.run/uhd.php",
+                    "1080p": "https://bing.img.run/1920x1080.php",
+                    "768p": "https://bing.img.run/1366x768.php",
+                    "mobile": "https://bing.img.run/m.php"
+                }
+            },
+            "random": {
+                "name": "随机历史",
+                "avoid_repeats": True,  # 取到与当前壁纸相同的图片时重新获取
+                "templates": {
+                    "uhd": "https://bing.img.run/rand_uhd.php",
+                    "1080p": "https://bing.img.run/rand.php",
+                    "768p": "https://bing.img.run/rand_1366x768.php",
+                    "mobile": "https://bing.img.run/rand_m.php"
+                }
+            },
+            "archive": {
+                "name": "历史归档",
+                "type": "catalog",  # 按本地目录（Bing 历史壁纸元数据）选图，刷新时只下载选中的一张
+                # 元数据源：HPImageArchive 格式的 JSON 地址或本地文件路径
+                "feed": "https://www.bing.com/HPImageArchive.aspx?format=js&idx=0&n=8&mkt=zh-CN",
+                "sync_interval": 86400,  # 元数据同步间隔（秒）
+                "no_repeat_days": 30,  # 该天数内显示过的图片不再选择（全部显示过时选最久未显示的）
+                "date_from": "",  # 日期范围 YYYYMMDD，空为不限
+                "date_to": "",
+                "color": ""  # 主色调：red/orange/yellow/green/cyan/blue/purple/pink/gray，空为不限
+            },
+            "local": {
+                "name": "本地文件夹",
+                "type": "local",
+                "folders": [],  # 图片文件夹列表（包含子目录）
+                "order": "random",  # random 或 sequential
+                "rescan_interval": 3600  # 增量重新扫描间隔（秒）
+            }
+        }
+    }
+
+    INTERVAL_OPTIONS = [
+        ("30分钟", 1800),
+        ("1小时", 3600),
+        ("6小时", 21600),
+        ("1天", 86400),
+        ("手动", 0)
+    ]
+
+    # 配置变更后合并写盘的等待时间（秒）
+    SAVE_DELAY = 1.0
+
+    def __init__(self):
+        # 保护 config 的读写（熔断器等后台线程也会修改其中的字典）
+        self.lock = threading.RLock()
+        self.config = self.load_config()
+        self._dirty = set()
+        self._timer = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def backup_file(self):
+        return self.CONFIG_FILE + ".bak"
+
+    def load_config(self):
+        """加载配置文件，损坏时回退到最近一次正常写入的备份"""
+        for path in (self.CONFIG_FILE, self.backup_file):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except FileNotFoundError:
+                continue
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                logging.error(f"配置文件损坏: {path}（{str(e)}）")
+                continue
+            if path != self.CONFIG_FILE:
+                logging.warning(f"已从备份恢复配置: {path}")
+            self._fill_defaults(config)
+            return config
+        return copy.deepcopy(self.DEFAULT_CONFIG)
+
+    def _fill_defaults(self, config):
+        """兼容旧版本配置：补齐缺失的配置项，内置数据源逐个、逐项补齐（已有的值保持用户的修改）"""
+        for key, value in self.DEFAULT_CONFIG.items():
+            if key not in config:
+                config[key] = copy.deepcopy(value)
+        sources = config["sources"]
+        for name, defaults in self.DEFAULT_CONFIG["sources"].items():
+            source = sources.setdefault(name, {})
+            for key, value in defaults.items():
+                if key not in source:
+                    source[key] = copy.deepcopy(value)
+
+    def update(self, changes):
+        """更新配置项，只有值真正变化的项被标记为待保存；返回变化的键集合"""
+        with self.lock:
+            changed = {key for key, value in changes.items() if self.config.get(key) != value}
+            for key in changed:
+                self.config[key] = changes[key]
+        if changed:
+            self.save_config(*changed)
+        return changed
+
+    def save_config(self, *keys):
+        """标记配置已修改（keys 为修改的项），在 SAVE_DELAY 秒后由后台线程合并写盘"""
+        with self.lock:
+            self._dirty.update(keys or ["*"])
+            if self._timer is None:
+                self._timer = threading.Timer(self.SAVE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """立即写入尚未保存的修改（退出前调用）"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            data = json.dumps(self.config, ensure_ascii=False, indent=2)
+        with self._write_lock:
+            try:
+                self._write(data)
+            except OSError as e:
+                logging.error(f"保存配置失败: {str(e)}")
+                with self.lock:
+                    self._dirty |= dirty
+                return
+        logging.info(f"配置已保存: {', '.join(sorted(dirty))}")
+
+    def _write(self, data):
+        """原子写入（临时文件 + fsync + 重命名），写入前把当前文件保存为备份"""
+        try:
+            with open(self.CONFIG_FILE, 'r', encoding='utf-8') as f:
+                previous = f.read()
+            json.loads(previous)
+            _write_atomically(self.backup_file, previous)
+        except (FileNotFoundError, ValueError):
+            pass  # 没有旧文件或旧文件已损坏时保留原备份
+        _write_atomically(self.CONFIG_FILE, data)
+
+    def get_source_options(self):
+        """获取数据源选项列表（键值对）"""
+        return [(key, self.config["sources"][key]["name"]) for key in self.config["sources"]]
+
+
+def _write_atomically(path, text):
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class WallpaperManager:
+    PREVIEW_SLOTS = 4  # 保留下载时解码图片的张数（当前壁纸 + 预取队列）
+    REPEAT_ATTEMPTS = 3  # 避开与当前壁纸相同的图片时最多获取的次数
+
+    def __init__(self, detector=None):
+        self.api_config = APIConfigManager()
+        self.cache_dir = os.path.join(os.path.expanduser("~"), ".wallpaper_cache")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.current_wallpaper = self.api_config.config.get("current_wallpaper", None)
+        self.detector = detector or DisplayDetector()
+        # 长连接会话 + 条件请求校验信息（跨重启保留）
+        self.session = create_session()
+        self.validators = ValidatorStore(os.path.join(self.cache_dir, "validators.json"))
+        # 缓存索引：替代每次刷新的目录扫描
+        self.cache_index = CacheIndex(self.cache_dir)
+        self.prefetcher = Prefetcher(self, self.api_config.config["prefetch_depth"])
+        # 多镜像对冲请求
+        self.fetcher = HedgedFetcher(self.api_config.config["hedge_delay"])
+        # 重试策略与熔断器（熔断状态保存在配置文件中）
+        config = self.api_config.config
+        self.retry_policy = RetryPolicy(
+            attempts=config["download_attempts"],
+            connect_timeout=config["connect_timeout"],
+            read_timeout=config["read_timeout"]
+        )
+        self.breaker = CircuitBreaker(
+            config["circuit_breakers"],
+            on_change=lambda: self.api_config.save_config("circuit_breakers"),
+            lock=self.api_config.lock
+        )
+        # 带宽估计与当日流量（保存在配置文件中），用于按预算选择分辨率
+        self.bandwidth = BandwidthTracker(
+            config["bandwidth"],
+            on_change=lambda: self.api_config.save_config("bandwidth"),
+            lock=self.api_config.lock
+        )
+        self.last_decision = None
+        self._upgrade_to = None
+        self.upgrade_thread = None
+        self.on_upgrade = None  # on_upgrade(path)：后台替换为高分辨率版本后调用（在后台线程中）
+        # 多显示器拼接和本地图库在首次使用时创建（分别依赖 numpy 和 Pillow）
+        self.composite_dir = os.path.join(self.cache_dir, "composites")  # 与 Compositor 的输出目录一致
+        self._compositor = None
+        self._local_library = None
+        self._near_duplicates = None
+        self._catalog = None
+        self._backfill_stop = threading.Event()
+        self._lazy_lock = threading.Lock()
+        # 下载时增量解码得到的降采样图片（路径 -> 图片），预览直接复用，不再从磁盘解码
+        self._previews = OrderedDict()
+        self._previews_lock = threading.Lock()
+        # 历史画廊的磁盘缩略图库（Pillow 在首次生成时才导入）
+        self.thumbnails = ThumbnailStore(os.path.join(self.cache_dir, "thumbnails"))
+        # 各阶段耗时与计数的导出（按配置监听本机端口或定期写文件）
+        self.metrics_exporter = MetricsExporter(
+            config["metrics_port"], config["metrics_file"], config["metrics_interval"]
+        )
+        self.metrics_exporter.start()
+        self.resolution_map = {
+            (3840, 2160): "uhd",
+            (1920, 1080): "1080p",
+            (1366, 768): "768p",
+            (1080, 1920): "mobile"
+        }
+
+    @property
+    def compositor(self):
+        """多显示器拼接器（首次访问时导入 numpy 并创建）"""
+        with self._lazy_lock:
+            if self._compositor is None:
+                from compositor import Compositor
+                self._compositor = Compositor(self.cache_dir)
+            return self._compositor
+
+    @property
+    def local_library(self):
+        """本地图库索引（首次访问时导入 Pillow 并打开）"""
+        with self._lazy_lock:
+            if self._local_library is None:
+                from local_source import LocalLibrary
+                self._local_library = LocalLibrary(os.path.join(self.cache_dir, "local_library.db"))
+            return self._local_library
+
+    @property
+    def catalog(self):
+        """Bing 历史壁纸本地目录（首次访问时导入 numpy 并打开）"""
+        with self._lazy_lock:
+            if self._catalog is None:
+                from catalog import Catalog
+                self._catalog = Catalog(os.path.join(self.cache_dir, Catalog.DB_NAME))
+            return self._catalog
+
+    @property
+    def near_duplicates(self):
+        """感知哈希索引（首次访问时导入 numpy 并从缓存索引加载，旧缓存中没有哈希的图片在后台补算）"""
+        with self._lazy_lock:
+            if self._near_duplicates is None:
+                from perceptual_hash import HashIndex
+                index = HashIndex()
+                index.extend(self.cache_index.phashes())
+                pending = self.cache_index.unhashed()
+                if pending:
+                    threading.Thread(
+                        target=self._backfill_hashes, args=(index, pending), name="phash", daemon=True
+                    ).start()
+                self._near_duplicates = index
+            return self._near_duplicates
+
+    def _backfill_hashes(self, index, entries):
+        """为升级前缓存的图片补算感知哈希（屏幕适配版本只记入缓存索引，不参与近似重复匹配）"""
+        from perceptual_hash import hash_file
+
+        done = 0
+        for path, source in entries:
+            if self._backfill_stop.is_set():
+                return
+            try:
+                phash, (width, height) = hash_file(path)
+            except Exception:
+                continue  # 文件已删除或损坏
+            self.cache_index.set_phash(path, phash, width * height)
+            if source != CacheIndex.PREFIT_SOURCE:
+                index.add(path, phash, width * height)
+            done += 1
+        logging.info(f"已补算感知哈希: {done} 张")
+
+    def is_composite(self, path):
+        """是否为拼接生成的跨屏壁纸"""
+        return os.path.dirname(path) == self.composite_dir
+
+    def apply_wallpaper(self, path):
+        """把壁纸设置到桌面
+
+        Windows 调用系统接口；其他平台执行配置中的 apply_command（如 "feh --bg-fill {path}"），
+        未配置时只记录日志。
+        """
+        with metrics.timer("apply"):
+            self._apply(path)
+
+    def _apply(self, path):
+        if sys.platform == "win32":
+            # 拼接壁纸需使用“跨区”排列方式
+            set_wallpaper_style(self.is_composite(path))
+            ctypes.windll.user32.SystemParametersInfoW(20, 0, path, 3)
+            return
+        command = self.api_config.config["apply_command"]
+        if not command:
+            logging.info(f"未配置 apply_command，跳过设置桌面壁纸: {path}")
+            return
+        # 先按 shell 规则拆分再替换路径，路径中的空格不会被拆开
+        subprocess.run([arg.format(path=path) for arg in shlex.split(command)], check=True, timeout=30)
+
+    def close(self):
+        """停止后台线程和工作进程"""
+        self.prefetcher.stop()
+        self.fetcher.shutdown()
+        self.metrics_exporter.stop()
+        self.thumbnails.shutdown()
+        self._backfill_stop.set()
+        with self._lazy_lock:
+            if self._compositor is not None:
+                self._compositor.shutdown()
+            if self._catalog is not None:
+                self._catalog.close()
+        self.api_config.flush()
+
+    def get_screen_resolution(self):
+        """获取主显示器物理分辨率对应的下载模板（检测结果有缓存，匹配为纯查表）"""
+        try:
+            with metrics.timer("resolution.detect"):
+                width, height = self.detector.get_primary_resolution()
+                return match_resolution_preset(width, height)
+        except Exception as e:
+            logging.error(f"分辨率检测异常：{str(e)}")
+            return "uhd"  # 异常时默认返回最高分辨率
+
+    def get_monitors(self):
+        """全部显示器布局；检测失败（如缺少 xrandr、无显示会话）时按只有一块主显示器处理"""
+        try:
+            return self.detector.get_monitors()
+        except Exception as e:
+            logging.error(f"显示器检测失败，按单显示器处理: {str(e)}")
+            return [Monitor(0, 0, *self.detector.get_primary_resolution(), True)]
+
+    def is_remote_source(self, source):
+        """是否为需要下载的网络数据源"""
+        return self.api_config.config["sources"][source].get("type", "remote") != "local"
+
+    def pick_local(self, source, width, height):
+        """从本地文件夹数据源选一张适合该尺寸的图片，无可用图片返回 None"""
+        conf = self.api_config.config["sources"][source]
+        folders = [f for f in conf.get("folders", []) if os.path.isdir(f)]
+        if not folders:
+            logging.error(f"本地数据源未配置有效文件夹: {source}")
+            return None
+        self.local_library.ensure_scanned(folders, conf.get("rescan_interval", 3600))
+        path = self.local_library.pick(folders, width, height, conf.get("order", "random"))
+        if path:
+            logging.info(f"使用本地图片: {path}")
+        return path
+
+    def is_catalog_source(self, source):
+        """是否为按本地目录选图的数据源"""
+        return self.api_config.config["sources"][source].get("type") == "catalog"
+
+    def sync_catalog(self, source=None, force=False):
+        """从数据源配置的元数据源同步本地目录（未到同步间隔时跳过），返回新增条数，失败返回 None"""
+        from catalog import make_feed
+
+        source = source or self.api_config.config["current_source"]
+        conf = self.api_config.config["sources"][source]
+        catalog = self.catalog
+        if not force and time.time() - catalog.last_synced() < conf.get("sync_interval", 86400):
+            return 0
+        try:
+            with metrics.timer("catalog.sync"):
+                return catalog.sync(make_feed(conf["feed"], self.session, self.retry_policy.timeout))
+        except Exception as e:
+            logging.error(f"同步本地目录失败: {describe_error(e)}")
+            return None
+
+    def pick_from_catalog(self, source, preset):
+        """按数据源配置的条件（不重复天数、日期范围、主色调）从本地目录选一张，返回 catalog.CatalogPick 或 None"""
+        from catalog import COLORS
+
+        conf = self.api_config.config["sources"][source]
+        self.sync_catalog(source)
+        color = conf.get("color") or None
+        if color and color not in COLORS:
+            logging.error(f"未知主色调: {color}（可选 {'/'.join(COLORS)}），忽略颜色条件")
+            color = None
+        with metrics.timer("catalog.pick"):
+            pick = self.catalog.pick(
+                preset,
+                no_repeat_days=conf.get("no_repeat_days", 0),
+                date_from=conf.get("date_from", ""),
+                date_to=conf.get("date_to", ""),
+                color=color
+            )
+        if pick is None:
+            logging.warning("本地目录中没有符合条件的图片")
+        else:
+            logging.info(f"从本地目录选择: {pick.date} {pick.title}")
+        return pick
+
+    def _source_urls(self, source, preset):
+        """返回 (下载地址列表, 目录日期)
+
+        目录数据源按条件选出一张（没有可选图片时地址列表为空）；每日数据源的日期为当天，其他为 None。
+        """
+        if self.is_catalog_source(source):
+            pick = self.pick_from_catalog(source, preset)
+            return ([pick.url], pick.date) if pick else ([], None)
+        date = time.strftime("%Y%m%d") if self.api_config.config["sources"][source].get("daily") else None
+        return self.generate_api_urls(preset, source), date
+
+    def generate_api_urls(self, resolution_type=None, source=None):
+        """生成API请求URL（模板可配置多个镜像，返回镜像列表）"""
+        source = source or self.api_config.config["current_source"]
+        templates = self.api_config.config["sources"][source]["templates"]
+        
+        if not resolution_type:
+            resolution_type = self.get_screen_resolution()
+        logging.info(f"下载分辨率：{resolution_type}")
+        with metrics.timer("urls.generate"):
+            return as_mirror_list(templates.get(resolution_type, templates["1080p"]))
+
+    def refresh(self, resolution="auto"):
+        """刷新壁纸：优先使用预取队列中已就绪的图片，否则按带宽选择分辨率立即下载"""
+        self._upgrade_to = None
+        self.last_decision = None
+        with metrics.timer("refresh"):
+            if not self._refresh(resolution):
+                return False
+            self.current_wallpaper = self.fit_for_display(self.current_wallpaper)
+        if self._upgrade_to:
+            self._start_upgrade(self.api_config.config["current_source"], self._upgrade_to)
+        return True
+
+    def fit_for_display(self, path):
+        """返回适配主显示器物理分辨率的版本（工作进程中生成并登记到缓存），无需适配或失败时返回原图"""
+        if not self.api_config.config["prefit"] or self.is_composite(path):
+            return path
+        width, height = self.detector.get_primary_resolution()
+        try:
+            variant, created = self.compositor.fit(path, width, height, self.api_config.config["prefit_quality"])
+        except Exception as e:
+            logging.error(f"生成适配版本失败，使用原图: {str(e)}")
+            return path
+        if created:
+            self.cache_index.add(
+                variant, os.path.getsize(variant), f"{width}x{height}", CacheIndex.PREFIT_SOURCE,
+                phash=self.cache_index.phash(path), pixels=width * height
+            )
+        elif variant != path:
+            self.cache_index.touch(variant)
+        if variant != path:
+            self._alias_preview(path, variant, width / height)
+        return variant
+
+    def decoded_preview(self, path):
+        """下载时已解码的降采样图片，没有时返回 None"""
+        with self._previews_lock:
+            return self._previews.get(path)
+
+    def _remember_preview(self, path, image):
+        with self._previews_lock:
+            self._previews[path] = image
+            self._previews.move_to_end(path)
+            while len(self._previews) > self.PREVIEW_SLOTS:
+                self._previews.popitem(last=False)
+
+    def _alias_preview(self, path, variant, aspect):
+        """适配版本与原图宽高比相同（只缩放未裁剪）时共用原图的降采样图片"""
+        image = self.decoded_preview(path)
+        if image is not None and abs(image.width / image.height - aspect) < 0.01:
+            self._remember_preview(variant, image)
+
+    def _refresh(self, resolution):
+        if self.api_config.config["span_monitors"]:
+            monitors = self.get_monitors()
+            if len(monitors) > 1:
+                return self.refresh_spanned(monitors, resolution)
+
+        source = self.api_config.config["current_source"]
+        if not self.is_remote_source(source):
+            width, height = (
+                self.detector.get_primary_resolution() if resolution == "auto" else RESOLUTION_PRESETS[resolution]
+            )
+            path = self.pick_local(source, width, height)
+            if path is None:
+                return self.use_cached_wallpaper()
+            self.current_wallpaper = path
+            return True
+
+        if self.prefetcher.depth > 0:
+            path = self.prefetcher.take(source, resolution)
+            if path and os.path.exists(path) and not self._is_repeat(source, path):
+                metrics.inc("cache.hits")
+                self.cache_index.touch(path)
+                self.current_wallpaper = path
+                self.clean_cache()
+                return True
+
+        decision = self.last_decision = self.select_resolution(source, resolution)
+        log_decision(decision)
+        if decision.preset is None:
+            return self.use_cached_wallpaper()
+        urls, date = self._source_urls(source, decision.preset)
+        if not urls:
+            return self.use_cached_wallpaper()
+        logging.info(f"开始下载: {', '.join(urls)}")
+        path = self._download_with_retry(urls, decision.preset, source, date)
+        for _ in range(self.REPEAT_ATTEMPTS - 1):
+            if path is None or not self._is_repeat(source, path):
+                break
+            logging.info(f"与当前壁纸是同一张图片，重新获取: {path}")
+            metrics.inc("download.repeats")
+            path = self._download_with_retry(urls, decision.preset, source, date)
+        if path is None:
+            # 所有尝试失败后使用缓存
+            return self.use_cached_wallpaper()
+        self.current_wallpaper = path
+        self.clean_cache()
+        self._upgrade_to = decision.wanted if self._should_upgrade(source, decision) else None
+        return True
+
+    def same_picture(self, a, b):
+        """两个缓存文件是否为同一张图片（路径相同或同一原图的适配版本，或开启近似重复检测时感知哈希相近）"""
+        if not a or not b:
+            return False
+        a, b = prefit_original(a) or a, prefit_original(b) or b
+        if a == b:
+            return True
+        config = self.api_config.config
+        if not config["near_duplicates"]:
+            return False
+        hash_a, hash_b = self.cache_index.phash(a), self.cache_index.phash(b)
+        if hash_a is None or hash_b is None:
+            return False
+        return bin(hash_a ^ hash_b).count("1") <= config["near_duplicate_distance"]
+
+    def _is_repeat(self, source, path):
+        """数据源要求避免重复（随机历史）且 path 与当前壁纸是同一张图片"""
+        if not self.api_config.config["sources"][source].get("avoid_repeats"):
+            return False
+        return self.same_picture(path, self.current_wallpaper)
+
+    def select_resolution(self, source, resolution="auto"):
+        """按带宽和流量预算选择下载模板（手动指定分辨率时只受流量预算限制），返回 bandwidth.Decision"""
+        config = self.api_config.config
+        wanted = self.get_screen_resolution() if resolution == "auto" else resolution
+        return choose_resolution(
+            self.bandwidth, source, wanted,
+            max_seconds=config["max_download_seconds"] if resolution == "auto" else 0,
+            daily_budget=config["metered_daily_bytes"] if config["metered"] else 0
+        )
+
+    def _should_upgrade(self, source, decision):
+        """仅因带宽降级、数据源各模板为同一张图片、且流量预算允许原分辨率时，才在后台替换"""
+        config = self.api_config.config
+        if decision.preset == decision.wanted or not config["upgrade_later"]:
+            return False
+        if not config["sources"][source].get("upgradable"):
+            return False
+        budget = config["metered_daily_bytes"] if config["metered"] else 0
+        return choose_resolution(self.bandwidth, source, decision.wanted, daily_budget=budget).preset == decision.wanted
+
+    def _start_upgrade(self, source, preset):
+        """后台下载 preset 版本，完成时若当前壁纸未被更换则替换并回调 on_upgrade"""
+        if self.upgrade_thread and self.upgrade_thread.is_alive():
+            return
+        expected = self.current_wallpaper
+
+        def run():
+            logging.info(f"后台下载 {preset} 版本以替换当前壁纸")
+            path = self._download_with_retry(self.generate_api_urls(preset, source), preset, source)
+            if path is None:
+                logging.warning(f"{preset} 版本下载失败，保留当前壁纸")
+                return
+            variant = self.fit_for_display(path)
+            if self.current_wallpaper != expected:
+                logging.info("壁纸已被更换，放弃替换")
+                return
+            self.current_wallpaper = variant
+            logging.info(f"已替换为 {preset} 版本: {variant}")
+            if self.on_upgrade:
+                self.on_upgrade(variant)
+
+        self.upgrade_thread = threading.Thread(target=run, name="upgrade", daemon=True)
+        self.upgrade_thread.start()
+
+    def wait_upgrade(self, timeout=None):
+        """等待后台替换完成（命令行单次刷新退出前调用）"""
+        if self.upgrade_thread is not None:
+            self.upgrade_thread.join(timeout)
+
+    def start_prefetch(self, resolution="auto"):
+        """启动后台预取（队列深度为 0 或按流量计费时不启动）"""
+        if self.api_config.config["metered"]:
+            logging.info("按流量计费的网络，不进行后台预取")
+            return
+        if self.prefetcher.depth > 0:
+            self.prefetcher.start(self.api_config.config["current_source"], resolution)
+
+    def prefetch_one(self, source, resolution):
+        """为预取队列下载一张壁纸（不切换当前壁纸，不重试）"""
+        res_type = self.select_resolution(source, resolution).preset
+        if res_type is None:
+            raise RuntimeError("今日流量预算已用完")
+        key = f"{source}/{res_type}"
+        if not self.breaker.allow(key):
+            raise CircuitOpenError(f"熔断中: {key}")
+        urls, date = self._source_urls(source, res_type)
+        if not urls:
+            raise RuntimeError("本地目录中没有符合条件的图片")
+        try:
+            path = self._fetch(urls, res_type, source, date)
+        except Exception:
+            self.breaker.record_failure(key)
+            raise
+        self.breaker.record_success(key)
+        self.fit_for_display(path)  # 预先生成适配版本，取用时直接命中
+        return path
+
+    def _fetch(self, urls, resolution, source, date=None):
+        """对冲请求各镜像下载到缓存并登记索引（date 为本地目录中的日期，未知时为 None），返回缓存文件路径"""
+        from stream_decoder import StreamDecoder  # 导入 Pillow，首次下载时才需要
+
+        # 流式写入临时文件并计算哈希，完整后按内容哈希原子重命名，避免半截文件和重复文件进入缓存；
+        # 同时增量解码：非图片响应在首个数据块即被拒绝，下载完成时预览图已就绪
+        start = time.perf_counter()
+        result = self.fetcher.fetch(urls, lambda url, cancel, on_headers: stream_download(
+            url, self.cache_dir,
+            session=self.session,
+            timeout=self.retry_policy.timeout,
+            validators=self.validators,
+            cancel=cancel,
+            on_headers=on_headers,
+            decoder=StreamDecoder()
+        ))
+        if result.not_modified:
+            metrics.inc("cache.hits")
+            self.cache_index.touch(result.path)
+            if date:
+                self.catalog.mark_shown(date)
+            return result.path
+
+        self.bandwidth.record(source, resolution, result.received, time.perf_counter() - start, result.size)
+        metrics.inc("cache.misses")
+        path = self._ingest(result, resolution, source, date)
+        if result.preview is not None:
+            self._remember_preview(path, result.preview)
+        downloads, duplicates, ratio = self.cache_index.dedup_stats()
+        logging.info(f"去重统计: 共下载 {downloads} 次，重复 {duplicates} 次，去重率 {ratio:.1%}")
+        return path
+
+    def _ingest(self, result, resolution, source, date=None):
+        """登记新下载的图片，返回保留的缓存路径
+
+        开启近似重复检测时用下载时已解码的降采样图片计算感知哈希：缓存中已有同一张图片（其他分辨率或重新编码）
+        时只保留像素最多的一份——本次下载不比已有版本大则丢弃并返回已有版本，否则取代已有版本。
+        date 已知（目录数据源或每日数据源）时同时在本地目录登记内容哈希和颜色直方图；
+        其他数据源的下载不打开本地目录。
+        """
+        near_duplicates = self.api_config.config["near_duplicates"]
+        phash = match = image = None
+        pixels = result.image_size[0] * result.image_size[1] if result.image_size else None
+        if not result.duplicate and (near_duplicates or date):
+            try:
+                image, (width, height) = self._draft_image(result)
+                pixels = width * height
+                if near_duplicates:
+                    from perceptual_hash import hash_image
+                    phash = hash_image(image)
+                    match = self._nearest_picture(phash, exclude=result.path)
+            except Exception as e:
+                logging.error(f"分析图片失败: {str(e)}")
+        if date:
+            self._record_catalog(date, resolution, result, image)
+
+        if match and match[2] >= pixels:
+            kept, distance, _ = match
+            logging.info(f"与缓存中的图片近似重复（汉明距离 {distance}），使用分辨率不低于本次下载的已有版本: {kept}")
+            metrics.inc("cache.near_duplicates")
+            _remove_file(result.path)
+            self.validators.redirect(result.path, kept, self.cache_index.sha256(kept))
+            self.cache_index.touch(kept)
+            return kept
+
+        with metrics.timer("cache.index"):
+            self.cache_index.add(result.path, result.size, resolution, source, result.sha256, phash, pixels)
+        if phash is not None:
+            self.near_duplicates.add(result.path, phash, pixels)
+        if match:
+            metrics.inc("cache.near_duplicates")
+            self._supersede(match[0], result.path, result.sha256)
+        return result.path
+
+    def _draft_image(self, result):
+        """返回 (降采样图片, 原始尺寸)：优先使用下载时 draft 解码的图片，没有时从文件 draft 解码"""
+        from PIL import Image
+        from perceptual_hash import DRAFT_SIZE
+
+        if result.preview is not None and result.image_size:
+            return result.preview, result.image_size
+        with Image.open(result.path) as img:
+            size = img.size
+            img.draft("RGB", DRAFT_SIZE)
+            return img.convert("RGB"), size
+
+    def _record_catalog(self, date, resolution, result, image):
+        """在本地目录中登记该日期图片的下载（内容哈希、颜色直方图、显示时间）"""
+        from catalog import color_histogram
+
+        try:
+            histogram = color_histogram(image) if image is not None else None
+            self.catalog.record_download(date, resolution, result.url, result.sha256, histogram)
+        except Exception as e:
+            logging.error(f"登记本地目录失败: {str(e)}")
+
+    def _nearest_picture(self, phash, exclude=None):
+        """缓存中与 phash 近似的图片 (路径, 距离, 像素数)，文件已被外部删除的条目移出索引后重找"""
+        index = self.near_duplicates
+        while True:
+            match = index.nearest(phash, self.api_config.config["near_duplicate_distance"], exclude)
+            if match is None or os.path.exists(match[0]):
+                return match
+            index.remove(match[0])
+            self.cache_index.remove(match[0])
+
+    def _supersede(self, old, new, sha256):
+        """同一张图片的更高分辨率版本入库后删除旧版本（当前壁纸（含其适配版本的原图）或预取队列中的旧版本留给 LRU 淘汰）"""
+        self.near_duplicates.remove(old)
+        self.validators.redirect(old, new, sha256)
+        current = self.current_wallpaper
+        if old in (current, prefit_original(current)) or old in self.prefetcher.queued_paths():
+            return
+        self.cache_index.remove(old)
+        self.thumbnails.discard(old)
+        _remove_file(old)
+        logging.info(f"已由更高分辨率的版本取代: {old}")
+
+    def download_wallpaper(self, urls, resolution=""):
+        """下载壁纸（带重试退避、熔断和缓存备用功能，urls 为单个URL或镜像列表）"""
+        path = self._download_with_retry(as_mirror_list(urls), resolution, self.api_config.config["current_source"])
+        if path is None:
+            # 所有尝试失败后使用缓存
+            return self.use_cached_wallpaper()
+
+        self.current_wallpaper = path
+        self.clean_cache()  # 下载成功后清理旧缓存
+        return True
+
+    def refresh_spanned(self, monitors, resolution="auto"):
+        """多显示器：每块显示器按自身分辨率各取一张壁纸，拼接成一张跨屏壁纸"""
+        source = self.api_config.config["current_source"]
+        paths = []
+        for monitor in monitors:
+            res_type = match_resolution_preset(monitor.width, monitor.height) if resolution == "auto" else resolution
+            if self.is_remote_source(source):
+                urls, date = self._source_urls(source, res_type)
+                path = self._download_with_retry(urls, res_type, source, date) if urls else None
+            else:
+                path = self.pick_local(source, monitor.width, monitor.height)
+            if path is None:
+                path = self._pick_cached()
+            if path is None:
+                return False
+            paths.append(path)
+
+        try:
+            self.current_wallpaper = self.compositor.compose(monitors, paths)
+        except Exception as e:
+            logging.error(f"拼接壁纸失败: {str(e)}")
+            return False
+        self.clean_cache()
+        return True
+
+    def _download_with_retry(self, urls, resolution, source, date=None):
+        """按重试策略下载，成功返回缓存路径；熔断中或全部失败返回 None"""
+        key = f"{source}/{resolution}"
+        if not self.breaker.allow(key):
+            logging.warning(f"数据源熔断中，直接使用缓存: {key}")
+            metrics.inc("circuit.rejected")
+            return None
+
+        policy = self.retry_policy
+        for attempt in range(policy.attempts):
+            if attempt:
+                metrics.inc("download.retries")
+            try:
+                path = self._fetch(urls, resolution, source, date)
+                self.breaker.record_success(key)
+                return path
+            except Exception as e:
+                retryable = policy.is_retryable(e)
+                metrics.inc("download.failures")
+                logging.error(f"下载失败（尝试 {attempt+1}/{policy.attempts}）: {describe_error(e)}")
+                if not retryable:
+                    logging.error("不可重试的错误，停止重试")
+                    break
+                if attempt + 1 < policy.attempts:
+                    time.sleep(policy.delay(attempt, e))
+
+        self.breaker.record_failure(key)
+        return None
+
+    def history(self):
+        """历史壁纸（缓存中的原图，最近使用的在前），[(路径, 最近使用时间, 分辨率, 来源)]"""
+        return self.cache_index.history()
+
+    def select_cached(self, path):
+        """把缓存中的一张历史壁纸设为当前壁纸（使用屏幕适配版本），文件已不存在时返回 False"""
+        if not os.path.exists(path):
+            self.cache_index.remove(path)
+            return False
+        self.cache_index.touch(path)
+        self.last_decision = None
+        self.current_wallpaper = self.fit_for_display(path)
+        return True
+
+    def use_cached_wallpaper(self):
+        """使用缓存中的随机壁纸（索引内 O(1) 随机选择）"""
+        selected = self._pick_cached(avoid=self.current_wallpaper)
+        if selected is None:
+            return False
+        metrics.inc("fallback.cached")
+        self.current_wallpaper = selected
+        logging.info(f"使用缓存壁纸: {self.current_wallpaper}")
+        return True
+
+    def _pick_cached(self, avoid=None):
+        """从缓存索引随机取一张仍存在的壁纸并记录使用（尽量避开与 avoid 相同的图片），缓存为空返回 None"""
+        try:
+            for _ in range(self.REPEAT_ATTEMPTS):
+                selected = self._random_cached()
+                if selected is None or not self.same_picture(selected, avoid):
+                    break
+            if selected is None:
+                return None
+            self.cache_index.touch(selected)
+            return selected
+        except Exception as e:
+            logging.error(f"获取缓存壁纸失败: {str(e)}")
+            return None
+
+    def _random_cached(self):
+        while True:
+            selected = self.cache_index.random_path()
+            if selected is None or os.path.exists(selected):
+                return selected
+            # 文件已被外部删除，移出索引后重选
+            self.cache_index.remove(selected)
+
+    def clean_cache(self, max_bytes=None):
+        """按 LRU 淘汰旧缓存直到不超过字节预算（保留当前壁纸及其原图和预取队列）"""
+        if max_bytes is None:
+            max_bytes = self.api_config.config["cache_max_bytes"]
+        try:
+            with metrics.timer("cache.cleanup"):
+                keep = self.prefetcher.queued_paths()
+                if self.current_wallpaper:
+                    keep.add(self.current_wallpaper)
+                    original = prefit_original(self.current_wallpaper)
+                    if original:
+                        keep.add(original)  # 当前壁纸是适配版本时，原图仍在历史和画廊中使用
+                for old_file in self.cache_index.evict(max_bytes, keep=keep):
+                    self.thumbnails.discard(old_file)
+                    if self._near_duplicates is not None:
+                        self._near_duplicates.remove(old_file)
+                    _remove_file(old_file)
+                    logging.info(f"已清理旧缓存: {old_file}")
+                removed = prune_partials(self.cache_dir)
+                if removed:
+                    logging.info(f"已清理过期的未完成下载: {removed} 个文件")
+        except Exception as e:
+            logging.error(f"清理缓存失败: {str(e)}")
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass